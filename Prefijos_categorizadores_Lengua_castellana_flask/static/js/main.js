@@ -150,12 +150,38 @@ function cargarPreferenciasUsuario() {
 }
 
 function verificarNotificaciones() {
-    // Verificar notificaciones pendientes cada 30 segundos
+    // La primera consulta da el cursor inicial y dice si el servidor puede
+    // empujar eventos (sólo bajo ASGI). Con EventSource y servidor en vivo se
+    // escucha /api/eventos/; si no, se sondea como antes.
+    if (!currentUser?.id) {
+        return;
+    }
+    fetch('/api/notificaciones-pendientes')
+        .then(response => response.json())
+        .then(data => {
+            if (window.EventSource && data.en_vivo) {
+                escucharEventos(data.cursor);
+            } else {
+                sondearNotificaciones(data.cursor);
+            }
+        });
+}
+
+function sondearNotificaciones(cursorInicial) {
+    // Verificar notificaciones pendientes cada 30 segundos.
+    // Sólo se piden las posteriores al último cursor recibido.
+    let cursor = cursorInicial;
     setInterval(() => {
         if (currentUser?.id) {
-            fetch('/api/notificaciones-pendientes')
+            const url = cursor
+                ? `/api/notificaciones-pendientes?desde=${encodeURIComponent(cursor)}`
+                : '/api/notificaciones-pendientes';
+            fetch(url)
                 .then(response => response.json())
                 .then(data => {
+                    if (data.cursor) {
+                        cursor = data.cursor;
+                    }
                     if (data.notificaciones && data.notificaciones.length > 0) {
                         data.notificaciones.forEach(notif => {
                             window.notificaciones.mostrar(notif.mensaje, notif.tipo);
@@ -166,6 +192,30 @@ function verificarNotificaciones() {
     }, 30000);
 }
 
+function escucharEventos(cursorInicial) {
+    const url = cursorInicial
+        ? `/api/eventos/?desde=${encodeURIComponent(cursorInicial)}`
+        : '/api/eventos/';
+    const fuente = new EventSource(url);
+    let ultimoId = cursorInicial;
+    fuente.addEventListener('notificacion', event => {
+        ultimoId = event.lastEventId || ultimoId;
+        const notif = JSON.parse(event.data);
+        window.notificaciones.mostrar(notif.mensaje, notif.tipo);
+    });
+    fuente.addEventListener('mensaje', event => {
+        document.dispatchEvent(new CustomEvent('mensaje-recibido', { detail: JSON.parse(event.data) }));
+    });
+    // Si el navegador da la conexión por perdida (un proxy que no deja pasar
+    // el stream, p. ej.) se pasa a sondear desde lo último recibido.
+    fuente.onerror = () => {
+        if (fuente.readyState === EventSource.CLOSED) {
+            fuente.close();
+            sondearNotificaciones(ultimoId);
+        }
+    };
+}
+
 // ============================================
 // FUNCIONES DE UTILIDAD
 // ============================================
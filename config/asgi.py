@@ -3,6 +3,13 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn config.asgi:application``) so the
+live channel at ``/api/eventos/`` streams Server-Sent Events; under WSGI
+that endpoint answers at once and browsers keep polling. The login view is async as well: under
+ASGI a worker keeps serving other requests while passwords are verified in the
+bounded pool of ``juegos.acceso``, which is what absorbs a whole class logging
+in at once.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
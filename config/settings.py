@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,11 +49,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "juegos.consultas.ConsultasMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "juegos.middleware.PerfilMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -69,6 +72,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "juegos.context_processors.notificaciones",
             ],
         },
     },
@@ -88,6 +92,27 @@ DATABASES = {
 }
 
 
+# Cache
+# Los sellos de versión, los usuarios y los catálogos de juegos viven aquí y
+# tienen que verlos todos los procesos: en producción, REDIS_URL. Sin ella
+# cada proceso tiene su propia LocMemCache (sólo sirve con un único proceso).
+
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -135,3 +160,31 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 # Configuración de claves primarias
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Academia Digital
+# Evaluar los logros en un hilo de fondo, fuera del tiempo de respuesta
+JUEGOS_LOGROS_EN_SEGUNDO_PLANO = True
+# Carpeta donde aplicar_retencion guarda lo que borra (JSONL comprimido)
+JUEGOS_DIRECTORIO_ARCHIVO = BASE_DIR / 'archivo'
+# Escritura diferida de partidas: se encolan y se guardan en lotes cada N ms
+JUEGOS_ESCRITURA_DIFERIDA = False
+JUEGOS_ESCRITURA_DIFERIDA_MS = 200
+JUEGOS_DIRECTORIO_SPOOL = BASE_DIR / 'spool'
+# Medición de consultas por vista (cabeceras X-Consultas*) y presupuestos por URL
+JUEGOS_MEDIR_CONSULTAS = DEBUG
+JUEGOS_PRESUPUESTO_CONSULTAS = {
+    'juegos:logros': 20,
+    'juegos:ranking': 15,
+    'juegos:api_notificaciones': 5,
+    'juegos:api_notificaciones_pendientes': 5,
+    'juegos:api_historial_mensajes': 8,
+}
+JUEGOS_UMBRAL_N_MAS_1 = 5
+# Login: hilos que verifican contraseñas (None = uno por CPU) y logins que pueden esperar turno
+JUEGOS_HILOS_CLAVES = None
+JUEGOS_LOGINS_EN_ESPERA = 200
+# Anotar la última conexión y la racha en un hilo de fondo, en lotes
+JUEGOS_CONEXIONES_EN_SEGUNDO_PLANO = True
+# Sin caché compartida, segundos que un proceso puede servir catálogos o índices viejos
+JUEGOS_VIDA_VERSIONES_LOCALES = 30
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
-from .models import Perfil, Item, Inventario, ItemUsuario, Logro, LogroDesbloqueado, Notificacion, Amistad, Mensaje, PuntuacionDiaria
+from .models import Perfil, Item, Inventario, ItemUsuario, Logro, LogroDesbloqueado, Notificacion, Amistad, Mensaje, Conversacion, PuntuacionDiaria
 
 class PerfilInline(admin.StackedInline):
     model = Perfil
@@ -36,8 +36,8 @@ class ItemUsuarioAdmin(admin.ModelAdmin):
 
 @admin.register(Logro)
 class LogroAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'categoria', 'puntos']
-    list_filter = ['categoria']
+    list_display = ['nombre', 'categoria', 'tipo', 'cantidad_necesaria', 'rareza', 'puntos']
+    list_filter = ['categoria', 'tipo', 'rareza']
 
 @admin.register(LogroDesbloqueado)
 class LogroDesbloqueadoAdmin(admin.ModelAdmin):
@@ -61,6 +61,11 @@ class MensajeAdmin(admin.ModelAdmin):
     def contenido_corto(self, obj):
         return obj.contenido[:50] + "..." if len(obj.contenido) > 50 else obj.contenido
 
+@admin.register(Conversacion)
+class ConversacionAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'otro_usuario', 'no_leidos', 'fecha_ultimo_mensaje']
+    raw_id_fields = ['usuario', 'otro_usuario', 'ultimo_mensaje']
+
 @admin.register(PuntuacionDiaria)
 class PuntuacionDiariaAdmin(admin.ModelAdmin):
     list_display = ['usuario', 'puntos', 'tipo_juego', 'fecha']
@@ -93,9 +93,30 @@ class Logro(models.Model):
         ('ESPECIAL', 'Especial'),
     ]
     
+    RAREZAS = [
+        ('COMUN', 'Común'),
+        ('RARO', 'Raro'),
+        ('EPICO', 'Épico'),
+        ('LEGENDARIO', 'Legendario'),
+    ]
+    
+    # Métrica que se compara con cantidad_necesaria para desbloquear el logro
+    TIPOS = [
+        ('AVENTURA', 'Niveles de aventura completados'),
+        ('ORTOGRAFIA', 'Aciertos de ortografía'),
+        ('PUNTOS', 'Puntos totales'),
+        ('RACHA', 'Racha máxima'),
+        ('SOCIAL', 'Amigos'),
+    ]
+    
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField()
     categoria = models.CharField(max_length=20, choices=CATEGORIAS)
+    rareza = models.CharField(max_length=20, choices=RAREZAS, default='COMUN')
+    tipo = models.CharField(max_length=20, choices=TIPOS, blank=True)
+    cantidad_necesaria = models.IntegerField(default=0)
+    dificultad = models.IntegerField(default=1)
+    icono = models.CharField(max_length=50, default='medal')
     puntos = models.IntegerField(default=10)
     
     def __str__(self):
@@ -135,6 +156,13 @@ class Notificacion(models.Model):
     leida = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(default=timezone.now)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', '-fecha_creacion'], name='notificacion_usuario_idx'),
+            models.Index(fields=['usuario', 'leida'], name='notificacion_no_leidas_idx'),
+            models.Index(fields=['tipo', 'fecha_creacion'], name='notificacion_retencion_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.titulo} - {self.usuario.username}"
 
@@ -171,9 +199,36 @@ class Mensaje(models.Model):
     leido = models.BooleanField(default=False)
     fecha_envio = models.DateTimeField(default=timezone.now)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['remitente', 'destinatario', 'fecha_envio'], name='mensaje_conversacion_idx'),
+            models.Index(fields=['fecha_envio'], name='mensaje_fecha_idx'),
+        ]
+    
     def __str__(self):
         return f"De: {self.remitente.username} Para: {self.destinatario.username}"
 
+# ============================================
+# MODELO CONVERSACION
+# ============================================
+
+class Conversacion(models.Model):
+    """Resumen de la conversación de un usuario con otro (una fila por participante)"""
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversaciones')
+    otro_usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    ultimo_mensaje = models.ForeignKey(Mensaje, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha_ultimo_mensaje = models.DateTimeField(default=timezone.now)
+    no_leidos = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['usuario', 'otro_usuario']
+        indexes = [
+            models.Index(fields=['usuario', '-fecha_ultimo_mensaje'], name='conversacion_bandeja_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.usuario.username} - {self.otro_usuario.username} ({self.no_leidos})"
+
 # ============================================
 # MODELO PUNTUACION DIARIA
 # ============================================
@@ -509,15 +509,12 @@ class RendimientoCoreTest(TestCase):
     
     def test_consultas_base_datos(self):
         """Cuenta el número de consultas a la BD"""
-        from django.db import connection
+        from juegos.consultas import presupuesto_consultas
         
-        # Resetear contador de consultas
-        connection.queries_log.clear()
+        # Presupuesto de la URL en JUEGOS_PRESUPUESTO_CONSULTAS; falla también ante un N+1
+        with presupuesto_consultas(maximo=20):
+            response = self.client.get(reverse('core:logros'))
         
-        response = self.client.get(reverse('core:logros'))
-        
-        num_queries = len(connection.queries)
-        self.assertLess(num_queries, 20)  # Menos de 20 consultas
         self.assertEqual(response.status_code, 200)
 
 # ============================================
@@ -0,0 +1,236 @@
+"""
+Inicio de sesión en ráfagas (toda la clase entra al tocar el timbre)
+
+Verificar una contraseña es lento a propósito (PBKDF2 con cientos de miles
+de iteraciones). `autenticar` lo hace en un pool acotado de hilos: hashlib
+suelta el GIL mientras calcula, así que los hilos verifican en paralelo y,
+bajo ASGI, el bucle de eventos sigue atendiendo otras peticiones mientras
+tanto. Si ya hay JUEGOS_LOGINS_EN_ESPERA logins esperando su turno, el
+siguiente se rechaza enseguida (LoginsSaturados) en vez de hacer cola
+hasta que el cliente se canse.
+
+La última conexión y la racha no hacen falta para responder: se encolan y
+un hilo las anota en lotes (tres consultas por lote, no por alumno). Con
+JUEGOS_CONEXIONES_EN_SEGUNDO_PLANO = False se anotan en el momento.
+
+`autenticar` sigue las reglas de ModelBackend (username exacto, usuarios
+inactivos rechazados, hash actualizado si cambió el algoritmo y la señal
+user_login_failed), que es el único backend configurado.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_login_failed
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core.models import Perfil
+
+from .perfiles import invalidar_perfil
+from .ranking import ultimos_dias_activos
+
+logger = logging.getLogger(__name__)
+
+
+LOGINS_EN_ESPERA = 200
+# Segundos que se sugiere esperar al cliente rechazado (Retry-After)
+REINTENTAR_EN = 2
+TAMANO_LOTE = 500
+
+
+# ============================================
+# VERIFICACIÓN DE CONTRASEÑAS
+# ============================================
+
+class LoginsSaturados(Exception):
+    """Demasiados logins esperando verificación; conviene reintentar"""
+
+
+_pool = None
+_cupos = None
+_lock_pool = threading.Lock()
+
+
+def hilos_claves():
+    return getattr(settings, 'JUEGOS_HILOS_CLAVES', None) or os.cpu_count() or 1
+
+
+def _obtener_pool():
+    """Pool de hilos para hashear y cupos de espera (uno por proceso)"""
+    global _pool, _cupos
+    with _lock_pool:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=hilos_claves(), thread_name_prefix='claves')
+            _cupos = threading.BoundedSemaphore(getattr(settings, 'JUEGOS_LOGINS_EN_ESPERA', LOGINS_EN_ESPERA))
+        return _pool, _cupos
+
+
+def _verificar(clave, codificada):
+    """(válida, hay que rehashear); sin usuario se hashea igual para no delatarlo por el tiempo"""
+    if codificada is None:
+        make_password(clave)
+        return False, False
+    rehashear = []
+    valida = check_password(clave, codificada, setter=rehashear.append)
+    return valida, bool(rehashear)
+
+
+def _buscar_usuario(username):
+    try:
+        return User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        return None
+
+
+async def autenticar(request, username, password):
+    """Usuario si las credenciales son válidas, o None
+
+    Lanza LoginsSaturados si el pool ya tiene demasiados logins en espera.
+    """
+    pool, cupos = _obtener_pool()
+    if not cupos.acquire(blocking=False):
+        raise LoginsSaturados
+
+    loop = asyncio.get_running_loop()
+    try:
+        usuario = await sync_to_async(_buscar_usuario)(username)
+        codificada = usuario.password if usuario is not None else None
+        valida, rehashear = await loop.run_in_executor(pool, _verificar, password, codificada)
+        if valida and rehashear:
+            usuario.password = await loop.run_in_executor(pool, make_password, password)
+            await sync_to_async(usuario.save)(update_fields=['password'])
+    finally:
+        cupos.release()
+
+    if not valida or not usuario.is_active:
+        await sync_to_async(user_login_failed.send)(
+            sender=__name__, credentials={'username': username, 'password': '********'}, request=request,
+        )
+        return None
+    usuario.backend = 'django.contrib.auth.backends.ModelBackend'
+    return usuario
+
+
+class FormularioLogin(AuthenticationForm):
+    """AuthenticationForm que sólo valida los campos; la contraseña se verifica con `autenticar`"""
+
+    def clean(self):
+        return self.cleaned_data
+
+    def aceptar(self, usuario):
+        """Completa la validación con lo que devolvió `autenticar`; True si puede entrar"""
+        if usuario is None:
+            self.add_error(None, self.get_invalid_login_error())
+            return False
+        try:
+            self.confirm_login_allowed(usuario)
+        except ValidationError as e:
+            self.add_error(None, e)
+            return False
+        self.user_cache = usuario
+        return True
+
+
+# ============================================
+# ÚLTIMA CONEXIÓN Y RACHA
+# ============================================
+
+def aplicar_conexiones(conexiones):
+    """Anota {usuario_id: momento del login}: última conexión y racha de cada perfil"""
+    ultimos = ultimos_dias_activos(conexiones)
+
+    with transaction.atomic():
+        perfiles = list(Perfil.objects.select_for_update().filter(usuario_id__in=conexiones))
+        for perfil in perfiles:
+            momento = conexiones[perfil.usuario_id]
+            ultima_actividad = ultimos.get(perfil.usuario_id)
+
+            if ultima_actividad:
+                diferencia = (momento.date() - ultima_actividad).days
+                if diferencia == 1:
+                    # Día consecutivo
+                    perfil.racha_actual += 1
+                    if perfil.racha_actual > perfil.racha_maxima:
+                        perfil.racha_maxima = perfil.racha_actual
+                elif diferencia > 1:
+                    # Se rompió la racha
+                    perfil.racha_actual = 1
+            else:
+                # Primera actividad
+                perfil.racha_actual = 1
+            perfil.ultima_conexion = momento
+
+        Perfil.objects.bulk_update(perfiles, ['ultima_conexion', 'racha_actual', 'racha_maxima'])
+        # bulk_update no envía post_save: se descartan a mano los usuarios en caché
+        for perfil in perfiles:
+            invalidar_perfil(perfil.usuario_id)
+    return len(perfiles)
+
+
+# Cola de logins pendientes de anotar y su hilo consumidor (uno por proceso)
+_cola = queue.Queue()
+_trabajador = None
+_lock_trabajador = threading.Lock()
+
+
+def _tomar_lote(primera):
+    """La conexión recibida y las que ya esperan, una por usuario (la más reciente)"""
+    usuario_id, momento = primera
+    lote = {usuario_id: momento}
+    tomadas = 1
+    while tomadas < TAMANO_LOTE:
+        try:
+            usuario_id, momento = _cola.get_nowait()
+        except queue.Empty:
+            break
+        tomadas += 1
+        lote[usuario_id] = max(momento, lote.get(usuario_id, momento))
+    return lote, tomadas
+
+
+def _procesar_cola():
+    while True:
+        lote, tomadas = _tomar_lote(_cola.get())
+        try:
+            close_old_connections()
+            aplicar_conexiones(lote)
+        except Exception:
+            logger.exception('Error anotando %s conexiones', len(lote))
+        finally:
+            close_old_connections()
+            for _ in range(tomadas):
+                _cola.task_done()
+
+
+def _encolar(conexion):
+    global _trabajador
+    with _lock_trabajador:
+        if _trabajador is None or not _trabajador.is_alive():
+            _trabajador = threading.Thread(target=_procesar_cola, name='conexiones', daemon=True)
+            _trabajador.start()
+    _cola.put(conexion)
+
+
+def registrar_conexion(usuario_id, momento=None):
+    """Anota un login; en segundo plano salvo JUEGOS_CONEXIONES_EN_SEGUNDO_PLANO = False"""
+    momento = momento or timezone.now()
+    if getattr(settings, 'JUEGOS_CONEXIONES_EN_SEGUNDO_PLANO', True):
+        _encolar((usuario_id, momento))
+    else:
+        aplicar_conexiones({usuario_id: momento})
+
+
+def esperar_conexiones():
+    """Bloquea hasta que el hilo anote todos los logins encolados"""
+    _cola.join()
@@ -1,5 +1,11 @@
 # juegos/admin.py
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import redirect, render
+from django.urls import path
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from .models import (
@@ -7,7 +13,11 @@ from .models import (
     AventuraNivel, ProgresoAventura,
     # Modelos de ortografía
     PreguntaOrtografia, ProgresoOrtografia,
+    # Modelos de ranking
+    RankingMaterializado,
 )
+from core.admin import CustomUserAdmin
+from .alumnos import MAXIMO_EN_PETICION, escribir_claves, importar_alumnos, leer_lista
 
 
 @admin.register(AventuraNivel)
@@ -47,4 +57,90 @@ class ProgresoOrtografiaAdmin(admin.ModelAdmin):
     
     list_display = ['usuario', 'categoria', 'aciertos', 'errores', 'fecha']
     list_filter = ['categoria', 'fecha']
-    search_fields = ['usuario__username']
\ No newline at end of file
+    search_fields = ['usuario__username']
+
+
+@admin.register(RankingMaterializado)
+class RankingMaterializadoAdmin(admin.ModelAdmin):
+    """Administración del ranking materializado"""
+    
+    list_display = ['usuario', 'periodo', 'juego', 'inicio_periodo', 'puntos', 'partidas']
+    list_filter = ['periodo', 'juego']
+    search_fields = ['usuario__username']
+    raw_id_fields = ['usuario']
+
+
+class ImportarAlumnosForm(forms.Form):
+    archivo = forms.FileField(label='Lista de clase (CSV o JSON)')
+
+
+class AlumnosUserAdmin(CustomUserAdmin):
+    """Administración de usuarios con el alta masiva de alumnos"""
+    
+    change_list_template = 'admin/auth/user/change_list_alumnos.html'
+    
+    def get_urls(self):
+        return [
+            path(
+                'importar-alumnos/',
+                self.admin_site.admin_view(self.importar_alumnos_view),
+                name='auth_user_importar_alumnos',
+            ),
+        ] + super().get_urls()
+    
+    def _leer_lista_alumnos(self, form):
+        """Filas del archivo subido, o None tras anotar el error en el formulario"""
+        try:
+            filas = leer_lista(form.cleaned_data['archivo'].read())
+        except (UnicodeDecodeError, ValueError) as e:
+            form.add_error('archivo', f'No se pudo leer el archivo: {e}')
+            return None
+        if len(filas) > MAXIMO_EN_PETICION:
+            # Hashear tantas contraseñas excedería el timeout de la petición
+            form.add_error(
+                'archivo',
+                f'La lista tiene {len(filas)} filas; desde aquí se importan hasta {MAXIMO_EN_PETICION}. '
+                'Divídala o use el comando "manage.py importar_alumnos".',
+            )
+            return None
+        return filas
+    
+    def importar_alumnos_view(self, request):
+        """Alta masiva de alumnos desde un CSV o JSON subido"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        
+        form = ImportarAlumnosForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            filas = self._leer_lista_alumnos(form)
+            if filas is not None:
+                # Se hashea en este proceso: un worker web no arranca un pool de procesos
+                resultado = importar_alumnos(filas, procesos=1)
+                for error in resultado.errores[:20]:
+                    messages.warning(request, error)
+                messages.success(
+                    request,
+                    f'Alumnos creados: {len(resultado.creados)}. Ya existían: {len(resultado.existentes)}.'
+                )
+                
+                # Las contraseñas generadas se descargan una sola vez
+                if resultado.claves_generadas:
+                    response = HttpResponse(content_type='text/csv; charset=utf-8')
+                    response['Content-Disposition'] = 'attachment; filename="claves_alumnos.csv"'
+                    escribir_claves(resultado.claves_generadas, response)
+                    return response
+                return redirect('admin:auth_user_changelist')
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Importar alumnos',
+            'opts': self.model._meta,
+            'form': form,
+            'maximo': MAXIMO_EN_PETICION,
+        }
+        return render(request, 'admin/auth/user/importar_alumnos.html', context)
+
+
+# core.admin ya registró User (core va antes que juegos en INSTALLED_APPS)
+admin.site.unregister(User)
+admin.site.register(User, AlumnosUserAdmin)
@@ -0,0 +1,302 @@
+"""
+Alta masiva de alumnos desde una lista de clase (CSV o JSON)
+
+Cada alumno nuevo necesita User, Perfil, Inventario, el kit de bienvenida y
+una notificación. En lugar de cinco INSERT por alumno (como el registro
+web), se crean por lotes con bulk_create, cada lote en su transacción: si
+un lote falla no queda ningún alumno a medias.
+
+Hashear contraseñas es lo más caro (PBKDF2 está hecho para ser lento), así
+que se reparte entre varios procesos antes de abrir las transacciones. A
+los alumnos sin contraseña se les genera una, que se devuelve para
+entregarla; las que trae la lista pasan por AUTH_PASSWORD_VALIDATORS como en
+el registro web.
+
+Si otro alta crea un username entre la comprobación y el bulk_create, el
+lote se deshace y sus alumnos se crean de a uno: el repetido se informa como
+existente y los demás se crean igual.
+
+El admin importa dentro de la petición y hashea en su propio proceso (un
+worker web no debe arrancar un pool de procesos), así que acepta hasta
+MAXIMO_EN_PETICION filas para no pasarse del timeout; las listas más largas
+se importan con el comando importar_alumnos, que sí reparte entre procesos.
+
+Columnas (CSV con encabezado, o lista de objetos JSON):
+
+    username (obligatoria), password, nombre_completo, fecha_nacimiento
+    (AAAA-MM-DD), email, first_name, last_name
+"""
+
+import csv
+import io
+import json
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core.models import Inventario, ItemUsuario, Notificacion, Perfil
+
+from .catalogo import asegurar_item
+from .notificaciones import crear_notificaciones
+
+
+TAMANO_LOTE = 500
+# Con menos contraseñas no compensa arrancar procesos
+MINIMO_PARA_PROCESOS = 20
+LARGO_CLAVE_GENERADA = 10
+# Filas que el admin importa dentro de una petición, hasheando en un solo proceso (~0,3 s por alumno)
+MAXIMO_EN_PETICION = 50
+
+# Campo de la fila -> modelo cuyo campo lo valida (largo, formato, email...)
+CAMPOS_VALIDADOS = {
+    'username': User,
+    'email': User,
+    'first_name': User,
+    'last_name': User,
+    'nombre_completo': Perfil,
+}
+
+KIT_BIENVENIDA = {
+    'nombre': 'Kit de Bienvenida',
+    'tipo': 'ESPECIAL',
+    'rareza': 'COMUN',
+    'descripcion': 'Item de bienvenida para nuevos estudiantes',
+    'valor': 100,
+}
+BIENVENIDA = {
+    'titulo': '¡Bienvenido!',
+    'mensaje': 'Completa tu perfil y empieza a jugar',
+    'tipo': 'BIENVENIDA',
+}
+
+
+def obtener_item_bienvenida():
+    """Ítem que recibe todo alumno nuevo"""
+    datos = dict(KIT_BIENVENIDA)
+    return asegurar_item(datos.pop('nombre'), **datos)
+
+
+# ============================================
+# LECTURA DE LA LISTA
+# ============================================
+
+class Resultado:
+    """Resumen de una importación"""
+
+    def __init__(self):
+        self.creados = []
+        self.existentes = []
+        self.errores = []
+        # {username: contraseña} de las generadas
+        self.claves_generadas = {}
+
+
+def leer_lista(contenido, formato=None):
+    """Filas (diccionarios) de un CSV o JSON; el formato se deduce si no se indica"""
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode('utf-8-sig')
+    if formato is None:
+        formato = 'json' if contenido.lstrip().startswith(('[', '{')) else 'csv'
+
+    if formato == 'json':
+        filas = json.loads(contenido)
+        if isinstance(filas, dict):
+            filas = filas.get('alumnos', [])
+        if not isinstance(filas, list):
+            raise ValueError('El JSON debe ser una lista de alumnos')
+        return filas
+    if formato == 'csv':
+        return list(csv.DictReader(io.StringIO(contenido)))
+    raise ValueError(f'Formato desconocido: {formato}')
+
+
+def _fecha(texto):
+    return date.fromisoformat(texto) if texto else None
+
+
+def _errores_campos(alumno):
+    """Mensajes de los validadores de cada campo (los mismos que usaría el modelo)"""
+    errores = []
+    for campo, modelo in CAMPOS_VALIDADOS.items():
+        try:
+            modelo._meta.get_field(campo).clean(alumno[campo], None)
+        except ValidationError as e:
+            errores.append(f'{campo}: {" ".join(e.messages)}')
+    return errores
+
+
+def _errores_clave(alumno):
+    """Mensajes de AUTH_PASSWORD_VALIDATORS para la contraseña de la fila (vacía: se generará)"""
+    if not alumno['password']:
+        return []
+    usuario = User(
+        username=alumno['username'], email=alumno['email'],
+        first_name=alumno['first_name'], last_name=alumno['last_name'],
+    )
+    try:
+        validate_password(alumno['password'], usuario)
+    except ValidationError as e:
+        return [f'password: {" ".join(e.messages)}']
+    return []
+
+
+def validar_filas(filas, resultado):
+    """Alumnos válidos y nuevos, normalizados; anota errores y existentes en `resultado`"""
+    validos = {}
+    numeros = {}
+    for numero, fila in enumerate(filas, 1):
+        username = str(fila.get('username') or '').strip()
+        if not username:
+            resultado.errores.append(f'Fila {numero}: falta username')
+            continue
+        if username in validos:
+            resultado.errores.append(f'Fila {numero}: {username} está repetido en la lista')
+            continue
+        try:
+            nacimiento = _fecha(str(fila.get('fecha_nacimiento') or '').strip())
+        except ValueError:
+            resultado.errores.append(f'Fila {numero}: fecha_nacimiento inválida para {username}')
+            continue
+        alumno = {
+            'username': username,
+            'password': str(fila.get('password') or ''),
+            'email': str(fila.get('email') or '').strip(),
+            'first_name': str(fila.get('first_name') or '').strip(),
+            'last_name': str(fila.get('last_name') or '').strip(),
+            'nombre_completo': str(fila.get('nombre_completo') or '').strip(),
+            'fecha_nacimiento': nacimiento,
+        }
+        # Una fila inválida haría fallar el bulk_create de todo su lote
+        errores = _errores_campos(alumno)
+        if errores:
+            resultado.errores.append(f'Fila {numero}: {"; ".join(errores)}')
+            continue
+        validos[username] = alumno
+        numeros[username] = numero
+
+    nombres = list(validos)
+    for i in range(0, len(nombres), TAMANO_LOTE):
+        lote = nombres[i:i + TAMANO_LOTE]
+        for username in User.objects.filter(username__in=lote).values_list('username', flat=True):
+            resultado.existentes.append(username)
+            del validos[username]
+
+    # Los existentes no se modifican: su contraseña no se valida
+    for username, alumno in list(validos.items()):
+        errores = _errores_clave(alumno)
+        if errores:
+            resultado.errores.append(f'Fila {numeros[username]}: {"; ".join(errores)}')
+            del validos[username]
+    return list(validos.values())
+
+
+# ============================================
+# CONTRASEÑAS
+# ============================================
+
+def _iniciar_proceso():
+    """Los procesos creados con spawn no heredan la configuración de Django"""
+    import django
+    django.setup()
+
+
+def hashear_claves(claves, procesos=None):
+    """Hashes de las contraseñas, en el mismo orden, repartidos entre procesos"""
+    procesos = procesos or os.cpu_count() or 1
+    if procesos <= 1 or len(claves) < MINIMO_PARA_PROCESOS:
+        return [make_password(clave) for clave in claves]
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+        return list(pool.map(make_password, claves, chunksize=max(1, len(claves) // (procesos * 4))))
+
+
+# ============================================
+# ALTA POR LOTES
+# ============================================
+
+def _crear_lote(alumnos, kit, ahora):
+    """Crea un lote completo de alumnos en una transacción; devuelve sus usernames"""
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(
+                username=a['username'], password=a['hash'], email=a['email'],
+                first_name=a['first_name'], last_name=a['last_name'], date_joined=ahora,
+            )
+            for a in alumnos
+        ])
+        # No todas las bases devuelven los ids de bulk_create: se leen por username
+        ids = dict(User.objects.filter(username__in=[a['username'] for a in alumnos]).values_list('username', 'id'))
+
+        Perfil.objects.bulk_create([
+            Perfil(
+                usuario_id=ids[a['username']], nombre_completo=a['nombre_completo'],
+                fecha_nacimiento=a['fecha_nacimiento'], fecha_registro=ahora,
+            )
+            for a in alumnos
+        ])
+        Inventario.objects.bulk_create([Inventario(usuario_id=ids[a['username']]) for a in alumnos])
+        ItemUsuario.objects.bulk_create([
+            ItemUsuario(usuario_id=ids[a['username']], item_id=kit.id, fecha_obtencion=ahora) for a in alumnos
+        ])
+        crear_notificaciones([
+            Notificacion(usuario_id=ids[a['username']], fecha_creacion=ahora, **BIENVENIDA) for a in alumnos
+        ])
+    return [a['username'] for a in alumnos]
+
+
+def _crear_de_a_uno(alumnos, kit, ahora, resultado):
+    """Crea los alumnos de un lote fallido por separado, informando los que no se pudo"""
+    for alumno in alumnos:
+        try:
+            resultado.creados.extend(_crear_lote([alumno], kit, ahora))
+        except IntegrityError as e:
+            if User.objects.filter(username=alumno['username']).exists():
+                # Lo creó otra petición después de validar la lista
+                resultado.existentes.append(alumno['username'])
+            else:
+                resultado.errores.append(f'{alumno["username"]}: no se pudo crear ({e})')
+
+
+def importar_alumnos(filas, lote=TAMANO_LOTE, procesos=None):
+    """Da de alta a los alumnos nuevos de la lista; devuelve un Resultado
+
+    Los que ya existen se saltean (no se modifican) y las filas inválidas se
+    informan sin detener la importación.
+    """
+    resultado = Resultado()
+    alumnos = validar_filas(filas, resultado)
+    if not alumnos:
+        return resultado
+
+    for alumno in alumnos:
+        if not alumno['password']:
+            alumno['password'] = secrets.token_urlsafe(LARGO_CLAVE_GENERADA)[:LARGO_CLAVE_GENERADA]
+            resultado.claves_generadas[alumno['username']] = alumno['password']
+    for alumno, hash_clave in zip(alumnos, hashear_claves([a['password'] for a in alumnos], procesos)):
+        alumno['hash'] = hash_clave
+        del alumno['password']
+
+    kit = obtener_item_bienvenida()
+    ahora = timezone.now()
+    for i in range(0, len(alumnos), lote):
+        try:
+            resultado.creados.extend(_crear_lote(alumnos[i:i + lote], kit, ahora))
+        except IntegrityError:
+            _crear_de_a_uno(alumnos[i:i + lote], kit, ahora, resultado)
+    return resultado
+
+
+def escribir_claves(claves, destino):
+    """CSV username,password con las contraseñas generadas"""
+    escritor = csv.writer(destino)
+    escritor.writerow(['username', 'password'])
+    for username, clave in sorted(claves.items()):
+        escritor.writerow([username, clave])
@@ -0,0 +1,179 @@
+"""
+Mapa de niveles de la aventura
+
+Construye en una pasada el estado de cada nivel para un usuario
+(completado, bloqueado, puntuación y mejor tiempo) con una consulta para los
+niveles y otra para su progreso, sin consultas por nivel.
+
+El desbloqueo usa la frontera del usuario (FronteraAventura): el orden del
+último nivel completado sin huecos desde el primero. Un nivel está abierto si
+el nivel anterior está dentro de la frontera. La frontera avanza con un
+UPDATE condicional al completar un nivel (y salta los siguientes que ya
+estuvieran completados) y se sirve desde la caché, así que comprobar un
+desbloqueo no toca la tabla de progreso.
+
+El orden de los niveles se cachea bajo la versión del catálogo de niveles,
+así una edición en el admin llega a todos los procesos. Sin caché compartida
+la frontera sólo vive en la caché lo que dura un sello local (ver
+versiones), para que un nivel completado en otro proceso se vea enseguida.
+"""
+
+import copy
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .catalogo import invalidar_catalogo, niveles
+from .models import FronteraAventura, ProgresoAventura
+from .versiones import vida_en_cache
+
+
+TIEMPO_CACHE_ORDENES = 60 * 60 * 24
+TIEMPO_CACHE_FRONTERA = 60 * 60
+
+
+def _clave_frontera(usuario_id):
+    return f'aventura:frontera:{usuario_id}'
+
+
+def _ordenes_anteriores():
+    """{orden: orden del nivel anterior} (None para el primer nivel)"""
+    catalogo = niveles()
+    # Las versiones viejas dejan de pedirse y expiran solas
+    clave = f'aventura:ordenes:v{catalogo.version}'
+    anteriores = cache.get(clave)
+    if anteriores is None:
+        ordenes = [nivel.orden for nivel in catalogo]
+        anteriores = dict(zip(ordenes, [None] + ordenes[:-1]))
+        cache.set(clave, anteriores, timeout=TIEMPO_CACHE_ORDENES)
+    return anteriores
+
+
+def invalidar_ordenes():
+    """Recarga el catálogo de niveles, y con él su orden, en todos los procesos"""
+    invalidar_catalogo('niveles')
+
+
+def calcular_frontera(ordenes, completados):
+    """Último orden del prefijo de niveles completados (0 si no hay ninguno)"""
+    frontera = 0
+    for orden in sorted(ordenes):
+        if orden not in completados:
+            break
+        frontera = orden
+    return frontera
+
+
+def obtener_frontera(usuario, completados=None):
+    """Frontera del usuario desde la caché, la tabla o, si falta, su progreso"""
+    clave = _clave_frontera(usuario.id)
+    frontera = cache.get(clave)
+    if frontera is not None:
+        return frontera
+
+    fila = FronteraAventura.objects.filter(usuario=usuario).values_list('orden_completado', flat=True).first()
+    if fila is None:
+        if completados is None:
+            completados = set(ProgresoAventura.objects.filter(
+                usuario=usuario, completado=True
+            ).values_list('nivel__orden', flat=True))
+        fila = calcular_frontera(_ordenes_anteriores(), completados)
+        FronteraAventura.objects.get_or_create(usuario=usuario, defaults={'orden_completado': fila})
+
+    cache.set(clave, fila, timeout=vida_en_cache(TIEMPO_CACHE_FRONTERA))
+    return fila
+
+
+def avanzar_frontera(usuario, nivel):
+    """Mueve la frontera al completar un nivel que estaba justo después de ella"""
+    anteriores = _ordenes_anteriores()
+    filas = FronteraAventura.objects.filter(usuario=usuario, orden_completado__lt=nivel.orden)
+    anterior = anteriores.get(nivel.orden)
+    if anterior is not None:
+        filas = filas.filter(orden_completado__gte=anterior)
+
+    if filas.update(orden_completado=nivel.orden):
+        # Niveles posteriores ya completados (p. ej. si se insertó este nivel en
+        # medio): la frontera salta hasta el último del tramo sin huecos
+        posteriores = [orden for orden in anteriores if orden > nivel.orden]
+        completados = set(ProgresoAventura.objects.filter(
+            usuario=usuario, completado=True, nivel__orden__gt=nivel.orden,
+        ).values_list('nivel__orden', flat=True)) if posteriores else set()
+        frontera = max(nivel.orden, calcular_frontera(posteriores, completados))
+        if frontera > nivel.orden:
+            FronteraAventura.objects.filter(usuario=usuario, orden_completado=nivel.orden).update(
+                orden_completado=frontera
+            )
+    elif FronteraAventura.objects.filter(usuario=usuario).exists():
+        # El nivel no estaba justo después de la frontera
+        return
+    else:
+        # Todavía no tiene fila (nunca abrió el mapa): se arma desde su progreso
+        completados = set(ProgresoAventura.objects.filter(
+            usuario=usuario, completado=True,
+        ).values_list('nivel__orden', flat=True)) | {nivel.orden}
+        fila, _ = FronteraAventura.objects.get_or_create(
+            usuario=usuario, defaults={'orden_completado': calcular_frontera(anteriores, completados)}
+        )
+        frontera = fila.orden_completado
+
+    # La caché sólo ve la frontera nueva si el lote se confirma
+    clave = _clave_frontera(usuario.id)
+    transaction.on_commit(lambda: cache.set(clave, frontera, timeout=vida_en_cache(TIEMPO_CACHE_FRONTERA)))
+
+
+def nivel_desbloqueado(usuario, nivel):
+    """Indica en O(1) si el usuario puede jugar el nivel"""
+    anteriores = _ordenes_anteriores()
+    if nivel.orden not in anteriores:
+        invalidar_ordenes()
+        anteriores = _ordenes_anteriores()
+
+    anterior = anteriores.get(nivel.orden)
+    return anterior is None or anterior <= obtener_frontera(usuario)
+
+
+class MapaAventura:
+    """Niveles de la aventura con el estado de un usuario"""
+
+    def __init__(self, usuario):
+        # Copias: el catálogo se comparte entre peticiones y aquí se anotan los niveles
+        self.niveles = [copy.copy(nivel) for nivel in niveles()]
+        progresos = {
+            p['nivel_id']: p
+            for p in ProgresoAventura.objects.filter(usuario=usuario).values(
+                'nivel_id', 'completado', 'puntuacion', 'tiempo_jugado'
+            )
+        }
+        self.frontera = obtener_frontera(usuario, completados={
+            nivel.orden for nivel in self.niveles
+            if nivel.id in progresos and progresos[nivel.id]['completado']
+        })
+
+        self.stats = {
+            'niveles_completados': 0,
+            'puntuacion_total': 0,
+            'tiempo_total': timedelta(),
+        }
+        self._bloqueados = {}
+
+        # Un nivel se desbloquea cuando el anterior está dentro de la frontera
+        anterior = None
+        for nivel in self.niveles:
+            progreso = progresos.get(nivel.id)
+            nivel.completado = bool(progreso and progreso['completado'])
+            nivel.puntuacion_obtenida = progreso['puntuacion'] if progreso else 0
+            nivel.mejor_tiempo = progreso['tiempo_jugado'] if progreso else None
+            nivel.bloqueado = anterior is not None and anterior > self.frontera
+            self._bloqueados[nivel.id] = nivel.bloqueado
+            anterior = nivel.orden
+
+            if progreso:
+                self.stats['niveles_completados'] += int(nivel.completado)
+                self.stats['puntuacion_total'] += progreso['puntuacion']
+                self.stats['tiempo_total'] += progreso['tiempo_jugado']
+
+    def esta_desbloqueado(self, nivel):
+        """Indica si el usuario puede jugar el nivel"""
+        return not self._bloqueados.get(nivel.id, True)
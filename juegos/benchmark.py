@@ -0,0 +1,463 @@
+"""
+Banco de pruebas de rendimiento de punta a punta
+
+Genera un colegio sintético (usuarios con perfil e inventario, puntuaciones
+diarias, progreso de ortografía, mensajes, logros e ítems) con bulk_create
+en lotes, y mide las vistas principales llamándolas con peticiones de un
+usuario autenticado: latencia p50/p95/p99, consultas (y N+1 detectados) y
+pico de memoria. El resultado es un diccionario listo para json.dump, así
+que dos corridas se pueden comparar con `comparar`.
+
+`medir_rafaga_login` simula a una clase entera entrando a la vez por la
+vista de login asíncrona y reporta logins por segundo.
+
+Los datos sintéticos llevan el prefijo PREFIJO en usernames y nombres, y
+`limpiar_datos` los borra sin tocar lo demás.
+"""
+
+import asyncio
+import math
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.db import connection, transaction
+from django.template import TemplateDoesNotExist
+from django.test import AsyncRequestFactory, RequestFactory
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from core.models import (
+    Inventario, Item, ItemUsuario, Logro, LogroDesbloqueado, Mensaje, Notificacion, Perfil,
+    PuntuacionDiaria,
+)
+from . import views
+from .acceso import aplicar_conexiones, esperar_conexiones, hilos_claves
+from .consultas import RegistroConsultas
+from .mensajeria import reconstruir_conversaciones
+from .middleware import obtener_usuario
+from .models import ProgresoOrtografia
+from .puntos import recalcular_puntos
+from .ranking import invalidar_indices, reconstruir_ranking
+
+
+PREFIJO = 'bench_'
+# Contraseña de todos los usuarios sintéticos
+CLAVE = 'benchmark'
+TAMANO_LOTE = 5000
+CATEGORIAS_ORTOGRAFIA = ['general', 'acentos', 'b_v', 'g_j', 'h', 'll_y']
+TIPOS_ITEM = ['ESPECIAL', 'CONSUMIBLE', 'COLECCIONABLE', 'MEDALLA']
+
+
+# ============================================
+# DATOS SINTÉTICOS
+# ============================================
+
+def _en_lotes(modelo, filas, lote=TAMANO_LOTE):
+    """bulk_create de un iterable sin tenerlo entero en memoria; devuelve cuántas filas"""
+    total = 0
+    pendientes = []
+    for fila in filas:
+        pendientes.append(fila)
+        if len(pendientes) >= lote:
+            modelo.objects.bulk_create(pendientes, batch_size=lote)
+            total += len(pendientes)
+            pendientes = []
+    if pendientes:
+        modelo.objects.bulk_create(pendientes, batch_size=lote)
+        total += len(pendientes)
+    return total
+
+
+def _catalogo(modelo, cantidad, crear):
+    """Filas del catálogo sintético (las crea si faltan)"""
+    existentes = list(modelo.objects.filter(nombre__startswith=PREFIJO).values_list('id', flat=True))
+    if len(existentes) < cantidad:
+        modelo.objects.bulk_create([crear(i) for i in range(len(existentes), cantidad)])
+        existentes = list(modelo.objects.filter(nombre__startswith=PREFIJO).values_list('id', flat=True))
+    return existentes
+
+
+def generar_datos(usuarios=10000, dias=30, mensajes_por_usuario=20, actividad=0.5, semilla=1, lote=TAMANO_LOTE):
+    """Crea el colegio sintético; devuelve {tabla: filas creadas}
+
+    Cada usuario juega con probabilidad `actividad` cada uno de los últimos
+    `dias` días (de 1 a 3 partidas de ortografía o aventura) y envía
+    `mensajes_por_usuario` mensajes a compañeros al azar.
+    """
+    azar = random.Random(semilla)
+    ahora = timezone.now()
+    hoy = ahora.date()
+    creadas = {}
+
+    inicio = User.objects.filter(username__startswith=PREFIJO).count()
+    clave = make_password(CLAVE)
+    creadas['usuarios'] = _en_lotes(User, (
+        User(username=f'{PREFIJO}{i:07d}', password=clave, date_joined=ahora - timedelta(days=dias))
+        for i in range(inicio, inicio + usuarios)
+    ), lote)
+    ids = list(
+        User.objects.filter(username__startswith=PREFIJO, perfil_core__isnull=True)
+        .order_by('id').values_list('id', flat=True)
+    )
+
+    creadas['perfiles'] = _en_lotes(Perfil, (
+        Perfil(
+            usuario_id=uid, nombre_completo=f'Estudiante {uid}', fecha_nacimiento=hoy - timedelta(days=365 * 10),
+            racha_actual=azar.randint(0, 10), ultima_conexion=ahora - timedelta(hours=azar.randint(0, 72)),
+        )
+        for uid in ids
+    ), lote)
+    creadas['inventarios'] = _en_lotes(Inventario, (Inventario(usuario_id=uid) for uid in ids), lote)
+
+    logros = _catalogo(Logro, 30, lambda i: Logro(
+        nombre=f'{PREFIJO}logro {i}', descripcion='Logro sintético', categoria='ESPECIAL', puntos=10,
+    ))
+    items = _catalogo(Item, 40, lambda i: Item(
+        nombre=f'{PREFIJO}item {i}', tipo=TIPOS_ITEM[i % len(TIPOS_ITEM)], descripcion='Ítem sintético',
+        valor=azar.randint(1, 100),
+    ))
+    inventarios = dict(Inventario.objects.filter(usuario_id__in=ids).values_list('usuario_id', 'id'))
+
+    def puntuaciones():
+        for uid in ids:
+            for dia in range(dias):
+                if azar.random() < actividad:
+                    for _ in range(azar.randint(1, 3)):
+                        yield PuntuacionDiaria(
+                            usuario_id=uid, puntos=azar.randint(0, 150),
+                            tipo_juego=azar.choice(['ortografia', 'aventura']), fecha=hoy - timedelta(days=dia),
+                        )
+
+    def progresos():
+        for uid in ids:
+            for dia in range(dias):
+                if azar.random() < actividad:
+                    yield ProgresoOrtografia(
+                        usuario_id=uid, categoria=azar.choice(CATEGORIAS_ORTOGRAFIA),
+                        aciertos=azar.randint(0, 10), errores=azar.randint(0, 5),
+                        tiempo_jugado=timedelta(seconds=azar.randint(30, 600)),
+                        fecha=ahora - timedelta(days=dia, minutes=azar.randint(0, 600)),
+                    )
+
+    def mensajes():
+        for uid in ids:
+            for _ in range(mensajes_por_usuario):
+                destinatario = azar.choice(ids)
+                if destinatario == uid:
+                    continue
+                dias_atras = azar.randint(0, dias)
+                yield Mensaje(
+                    remitente_id=uid, destinatario_id=destinatario, contenido='Hola, ¿jugamos?',
+                    leido=dias_atras > 1, fecha_envio=ahora - timedelta(days=dias_atras, minutes=azar.randint(0, 1440)),
+                )
+
+    def desbloqueados():
+        for uid in ids:
+            for logro_id in azar.sample(logros, azar.randint(0, 5)):
+                yield LogroDesbloqueado(usuario_id=uid, logro_id=logro_id)
+
+    def items_usuario():
+        for uid in ids:
+            for item_id in azar.sample(items, azar.randint(0, 8)):
+                yield ItemUsuario(
+                    usuario_id=uid, item_id=item_id, inventario_id=inventarios[uid], cantidad=azar.randint(1, 5),
+                )
+
+    def notificaciones():
+        for uid in ids:
+            for n in range(azar.randint(0, 10)):
+                yield Notificacion(
+                    usuario_id=uid, titulo='Aviso', mensaje='Notificación sintética', leida=n > 2,
+                    fecha_creacion=ahora - timedelta(days=azar.randint(0, dias)),
+                )
+
+    creadas['puntuaciones'] = _en_lotes(PuntuacionDiaria, puntuaciones(), lote)
+    creadas['progresos_ortografia'] = _en_lotes(ProgresoOrtografia, progresos(), lote)
+    creadas['mensajes'] = _en_lotes(Mensaje, mensajes(), lote)
+    creadas['logros_desbloqueados'] = _en_lotes(LogroDesbloqueado, desbloqueados(), lote)
+    creadas['items_usuario'] = _en_lotes(ItemUsuario, items_usuario(), lote)
+    creadas['notificaciones'] = _en_lotes(Notificacion, notificaciones(), lote)
+
+    # Las tablas derivadas se rehacen desde lo generado, sólo para los sintéticos
+    sinteticos = User.objects.filter(username__startswith=PREFIJO)
+    recalcular_puntos(sinteticos)
+    reconstruir_ranking(sinteticos)
+    reconstruir_conversaciones(sinteticos)
+    return creadas
+
+
+def limpiar_datos():
+    """Borra los usuarios y el catálogo sintéticos; devuelve cuántos usuarios
+
+    Sus filas de ranking y de conversaciones se van en cascada con ellos.
+    """
+    ids = list(User.objects.filter(username__startswith=PREFIJO).values_list('id', flat=True))
+    for i in range(0, len(ids), 1000):
+        with transaction.atomic():
+            User.objects.filter(id__in=ids[i:i + 1000]).delete()
+    Logro.objects.filter(nombre__startswith=PREFIJO).delete()
+    Item.objects.filter(nombre__startswith=PREFIJO).delete()
+    if ids:
+        invalidar_indices()
+    return len(ids)
+
+
+def tamanos():
+    """Filas de cada tabla involucrada (de todo el sitio, no sólo las sintéticas)"""
+    modelos = {
+        'usuarios': User, 'puntuaciones': PuntuacionDiaria, 'progresos_ortografia': ProgresoOrtografia,
+        'mensajes': Mensaje, 'notificaciones': Notificacion, 'logros_desbloqueados': LogroDesbloqueado,
+        'items_usuario': ItemUsuario,
+    }
+    return {nombre: modelo.objects.count() for nombre, modelo in modelos.items()}
+
+
+# ============================================
+# ESCENARIOS
+# ============================================
+
+def _otro_usuario(usuario_id):
+    return Mensaje.objects.filter(destinatario_id=usuario_id).values_list('remitente_id', flat=True).first() or usuario_id
+
+
+# nombre: (método, vista, argumentos de la vista, datos de la petición)
+# No hay vista de dashboard en este árbol: el perfil es la portada del usuario
+ESCENARIOS = {
+    'perfil': ('GET', views.perfil_view, lambda uid: {}, {}),
+    'ranking': ('GET', views.ranking_view, lambda uid: {}, {'periodo': 'semanal'}),
+    'logros': ('GET', views.logros_view, lambda uid: {}, {}),
+    'inventario': ('GET', views.inventario_view, lambda uid: {}, {}),
+    'bandeja': ('GET', views.mensajes_view, lambda uid: {}, {}),
+    'historial_mensajes': ('GET', views.api_historial_mensajes, lambda uid: {'usuario_id': _otro_usuario(uid)}, {}),
+    'notificaciones': ('GET', views.api_notificaciones, lambda uid: {}, {}),
+    'guardar_partida': ('POST', views.api_guardar_progreso_ortografia, lambda uid: {}, {
+        'categoria': 'general', 'aciertos': 8, 'errores': 2, 'tiempo': 90,
+    }),
+}
+
+
+def _peticion(metodo, usuario, datos):
+    """Petición de un usuario con sesión iniciada, como la dejaría el middleware"""
+    factory = RequestFactory()
+    request = factory.post('/', datos) if metodo == 'POST' else factory.get('/', datos)
+    request.session = SessionStore()
+    request.session[SESSION_KEY] = str(usuario.pk)
+    request.session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    request.session[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+    request._messages = default_storage(request)
+    request.user = SimpleLazyObject(lambda: obtener_usuario(request))
+    return request
+
+
+def _ejecutar(escenario, usuario):
+    """Corre una petición; devuelve (segundos, registro de consultas, sin_plantilla, error)"""
+    metodo, vista, argumentos, datos = escenario
+    kwargs = argumentos(usuario.pk)
+    request = _peticion(metodo, usuario, datos)
+    sin_plantilla, error = False, None
+
+    with RegistroConsultas() as registro:
+        inicio = time.perf_counter()
+        try:
+            vista(request, **kwargs)
+        except TemplateDoesNotExist:
+            # La vista ya hizo su trabajo; sólo falta la plantilla en este árbol
+            sin_plantilla = True
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        segundos = time.perf_counter() - inicio
+    return segundos, registro, sin_plantilla, error
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por rango más cercano"""
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def medir_escenario(escenario, usuarios, repeticiones=50, calentamiento=3, muestras_memoria=10):
+    """Métricas de un escenario repartiendo las peticiones entre `usuarios`"""
+    for usuario in usuarios[:calentamiento]:
+        _ejecutar(escenario, usuario)
+
+    tiempos, consultas, repetidas, errores = [], [], {}, {}
+    sin_plantilla = False
+    for i in range(repeticiones):
+        segundos, registro, falta, error = _ejecutar(escenario, usuarios[i % len(usuarios)])
+        if error:
+            errores[error] = errores.get(error, 0) + 1
+            continue
+        tiempos.append(segundos * 1000)
+        consultas.append(registro.total)
+        sin_plantilla = sin_plantilla or falta
+        for veces, origen, _ in registro.repetidas():
+            repetidas[origen] = max(veces, repetidas.get(origen, 0))
+
+    # La memoria se mide aparte: tracemalloc hace más lentas las peticiones
+    picos = []
+    for i in range(min(muestras_memoria, repeticiones)):
+        tracemalloc.start()
+        try:
+            _ejecutar(escenario, usuarios[i % len(usuarios)])
+            picos.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    if not tiempos:
+        return {'repeticiones': repeticiones, 'errores': errores}
+
+    return {
+        'repeticiones': repeticiones,
+        'p50_ms': round(percentil(tiempos, 50), 3),
+        'p95_ms': round(percentil(tiempos, 95), 3),
+        'p99_ms': round(percentil(tiempos, 99), 3),
+        'media_ms': round(statistics.fmean(tiempos), 3),
+        'consultas_media': round(statistics.fmean(consultas), 2),
+        'consultas_max': max(consultas),
+        'memoria_pico_kb': round(max(picos) / 1024, 1) if picos else None,
+        'n_mas_1': [f'{origen} x{veces}' for origen, veces in sorted(repetidas.items())],
+        'sin_plantilla': sin_plantilla,
+        'errores': errores,
+    }
+
+
+def ejecutar_benchmark(escenarios=None, repeticiones=50, muestra_usuarios=200, semilla=1, etiqueta='', rafaga_login=0):
+    """Mide los escenarios pedidos (todos por defecto) y, si se pide, una ráfaga de logins
+
+    Devuelve el resultado serializable.
+    """
+    azar = random.Random(semilla)
+    ids = list(User.objects.filter(username__startswith=PREFIJO).values_list('id', flat=True))
+    if not ids:
+        raise ValueError('No hay datos sintéticos; generarlos primero')
+    usuarios = list(User.objects.filter(id__in=azar.sample(ids, min(muestra_usuarios, len(ids)))))
+    azar.shuffle(usuarios)
+
+    resultado = {
+        'fecha': timezone.now().isoformat(),
+        'etiqueta': etiqueta,
+        'base_datos': connection.vendor,
+        'tablas': tamanos(),
+        'escenarios': {},
+    }
+    for nombre in ESCENARIOS if escenarios is None else escenarios:
+        resultado['escenarios'][nombre] = medir_escenario(ESCENARIOS[nombre], usuarios, repeticiones)
+    if rafaga_login:
+        resultado['rafaga_login'] = medir_rafaga_login(rafaga_login, semilla=semilla)
+    return resultado
+
+
+# ============================================
+# RÁFAGA DE LOGINS
+# ============================================
+
+def _peticion_login(usuario):
+    """POST anónimo al login, como lo dejaría el middleware bajo ASGI"""
+    request = AsyncRequestFactory().post('/?next=/', {'username': usuario.username, 'password': CLAVE})
+    request.session = SessionStore()
+    request._messages = default_storage(request)
+    request.user = AnonymousUser()
+    return request
+
+
+async def _rafaga(usuarios, reintentos):
+    """Todos los alumnos entran a la vez; tras un 503 esperan Retry-After y reintentan
+
+    Devuelve [(status final, segundos desde el timbre, intentos)] por alumno.
+    """
+    inicio = time.perf_counter()
+
+    async def alumno(usuario):
+        for intento in range(1, reintentos + 2):
+            try:
+                response = await views.login_view(_peticion_login(usuario))
+            except TemplateDoesNotExist:
+                # Credenciales rechazadas: la vista quiso volver a mostrar el formulario
+                return 200, time.perf_counter() - inicio, intento
+            if response.status_code != 503:
+                break
+            await asyncio.sleep(float(response['Retry-After']))
+        return response.status_code, time.perf_counter() - inicio, intento
+
+    return await asyncio.gather(*(alumno(usuario) for usuario in usuarios))
+
+
+def medir_rafaga_login(alumnos=500, referencia=20, reintentos=200, semilla=1):
+    """Logins por segundo con `alumnos` usuarios sintéticos entrando a la vez
+
+    Se compara con la referencia síncrona (el login anterior: authenticate y
+    anotar la conexión en la misma petición, uno tras otro como en un único
+    worker) medida sobre los primeros `referencia` alumnos.
+    """
+    ids = list(User.objects.filter(username__startswith=PREFIJO).values_list('id', flat=True))
+    if len(ids) < alumnos:
+        raise ValueError(f'Hay {len(ids)} usuarios sintéticos y la ráfaga necesita {alumnos}')
+    usuarios = list(User.objects.filter(id__in=random.Random(semilla).sample(ids, alumnos)))
+
+    resultados = async_to_sync(_rafaga)(usuarios, reintentos)
+    exitosos = [total for status, total, _ in resultados if status == 302]
+    segundos = max(exitosos, default=0)
+    latencias = [total * 1000 for total in exitosos] or [0]
+
+    inicio = time.perf_counter()
+    esperar_conexiones()
+    anotar_ms = (time.perf_counter() - inicio) * 1000
+
+    inicio = time.perf_counter()
+    for usuario in usuarios[:referencia]:
+        authenticate(username=usuario.username, password=CLAVE)
+        aplicar_conexiones({usuario.id: timezone.now()})
+    segundos_referencia = time.perf_counter() - inicio
+
+    return {
+        'alumnos': alumnos,
+        'hilos_claves': hilos_claves(),
+        'segundos': round(segundos, 3),
+        'logins_por_segundo': round(len(exitosos) / segundos, 2) if segundos else 0,
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'reintentos': sum(intentos - 1 for _, _, intentos in resultados),
+        'fallidos': alumnos - len(exitosos),
+        'anotar_conexiones_ms': round(anotar_ms, 3),
+        'referencia_sincronica': {
+            'logins': min(referencia, alumnos),
+            'logins_por_segundo': round(min(referencia, alumnos) / segundos_referencia, 2)
+            if segundos_referencia else None,
+        },
+    }
+
+
+METRICAS_COMPARADAS = ('p50_ms', 'p95_ms', 'consultas_media', 'memoria_pico_kb')
+
+
+def comparar(anterior, actual):
+    """Diferencias entre dos resultados: [(escenario, métrica, antes, después, % de cambio)]"""
+    filas = []
+    for nombre, metricas in actual['escenarios'].items():
+        previas = anterior.get('escenarios', {}).get(nombre)
+        if previas is None:
+            continue
+        for metrica in METRICAS_COMPARADAS:
+            antes, despues = previas.get(metrica), metricas.get(metrica)
+            if antes is None or despues is None:
+                continue
+            cambio = (despues - antes) / antes * 100 if antes else 0.0
+            filas.append((nombre, metrica, antes, despues, round(cambio, 1)))
+
+    if anterior.get('rafaga_login') and actual.get('rafaga_login'):
+        antes = anterior['rafaga_login']['logins_por_segundo']
+        despues = actual['rafaga_login']['logins_por_segundo']
+        cambio = (despues - antes) / antes * 100 if antes else 0.0
+        filas.append(('rafaga_login', 'logins_por_segundo', antes, despues, round(cambio, 1)))
+    return filas
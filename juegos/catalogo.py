@@ -0,0 +1,108 @@
+"""
+Catálogos estáticos en memoria: ítems, logros y niveles de aventura
+
+Son tablas chicas que sólo cambian desde el admin, así que cada proceso las
+carga una vez y las sirve desde memoria, con mapas por id y por nombre. Cada
+catálogo tiene un sello de versión en la caché compartida; las señales lo
+suben al editar una fila y el proceso que ve un sello distinto recarga el
+catálogo entero y lo reemplaza de una vez, así una petición nunca ve medio
+catálogo viejo y medio nuevo. Sin caché compartida el sello caduca cada
+JUEGOS_VIDA_VERSIONES_LOCALES segundos (ver versiones).
+
+Las filas se comparten entre peticiones: no hay que modificarlas. Quien
+necesite anotarlas (como el mapa de la aventura) trabaja sobre copias.
+"""
+
+import threading
+from types import MappingProxyType
+
+from django.db import transaction
+
+from core.models import Item, Logro
+
+from .models import AventuraNivel
+from .versiones import incrementar_version, obtener_version
+
+
+class Catalogo:
+    """Foto inmutable de una tabla: filas en orden y mapas por id y por nombre"""
+
+    def __init__(self, modelo, filas, campo_nombre, version):
+        self.modelo = modelo
+        self.version = version
+        self.filas = tuple(filas)
+        self.por_id = MappingProxyType({fila.pk: fila for fila in self.filas})
+        self.por_nombre = MappingProxyType({getattr(fila, campo_nombre): fila for fila in self.filas})
+
+    def __iter__(self):
+        return iter(self.filas)
+
+    def __len__(self):
+        return len(self.filas)
+
+    def obtener(self, pk):
+        """Fila por id; lanza DoesNotExist del modelo como lo haría .get()"""
+        try:
+            return self.por_id[int(pk)]
+        except (KeyError, TypeError, ValueError):
+            raise self.modelo.DoesNotExist(f'{self.modelo.__name__} {pk!r} no existe')
+
+
+# nombre: (modelo, campo del mapa por nombre, orden)
+CATALOGOS = {
+    'items': (Item, 'nombre', ('id',)),
+    'logros': (Logro, 'nombre', ('categoria', 'dificultad', 'id')),
+    'niveles': (AventuraNivel, 'nivel', ('orden',)),
+}
+
+_cargados = {}
+_lock = threading.Lock()
+
+
+def _clave_version(nombre):
+    return f'catalogo:version:{nombre}'
+
+
+def obtener_catalogo(nombre):
+    """Catálogo vigente de este proceso, recargado si su versión cambió"""
+    version = obtener_version(_clave_version(nombre))
+    catalogo = _cargados.get(nombre)
+    if catalogo is not None and catalogo.version == version:
+        return catalogo
+
+    modelo, campo_nombre, orden = CATALOGOS[nombre]
+    catalogo = Catalogo(modelo, modelo.objects.order_by(*orden), campo_nombre, version)
+    with _lock:
+        _cargados[nombre] = catalogo
+    return catalogo
+
+
+def items():
+    return obtener_catalogo('items')
+
+
+def logros():
+    return obtener_catalogo('logros')
+
+
+def niveles():
+    return obtener_catalogo('niveles')
+
+
+def invalidar_catalogo(nombre):
+    """Recarga el catálogo en todos los procesos
+
+    Se sube la versión enseguida (para que la transacción actual vea sus
+    cambios) y otra vez al confirmar, porque otro proceso pudo recargar entre
+    ambos momentos con la versión nueva y los datos todavía sin confirmar.
+    """
+    incrementar_version(_clave_version(nombre))
+    transaction.on_commit(lambda: incrementar_version(_clave_version(nombre)))
+
+
+def asegurar_item(nombre, **defaults):
+    """Ítem del catálogo por nombre; lo crea (una sola vez) si no existe"""
+    item = items().por_nombre.get(nombre)
+    if item is None:
+        item = Item.objects.get_or_create(nombre=nombre, defaults=defaults)[0]
+    return item
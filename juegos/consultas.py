@@ -0,0 +1,219 @@
+"""
+Medición de consultas SQL por vista
+
+RegistroConsultas se engancha a todas las conexiones (execute_wrapper) y
+anota cada consulta con su huella (el SQL con los parámetros aparte y las
+listas IN colapsadas), su duración y la línea del proyecto que la lanzó.
+Una misma huella repetida muchas veces en una petición es casi siempre un
+N+1: un .get() o un acceso a una relación dentro de un bucle.
+
+ConsultasMiddleware lo aplica a cada petición cuando está activo y deja el
+resultado en cabeceras (X-Consultas, X-Consultas-Tiempo, X-Consultas-N1).
+Los presupuestos por URL se declaran en settings:
+
+    JUEGOS_MEDIR_CONSULTAS = DEBUG
+    JUEGOS_PRESUPUESTO_CONSULTAS = {'juegos:ranking': 10, '/api/notificaciones/': 5}
+    JUEGOS_PRESUPUESTO_CONSULTAS_DEFECTO = None
+    JUEGOS_UMBRAL_N_MAS_1 = 5
+    JUEGOS_CONSULTAS_ESTRICTO = False
+
+Las claves son nombres de URL resueltos (con su namespace) o rutas; un
+nombre que no existe en las URLs nunca coincide. En modo estricto
+un exceso lanza PresupuestoConsultasExcedido en lugar de sólo avisar en el
+log; `presupuesto_consultas` lo activa dentro de un test.
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+UMBRAL_N_MAS_1 = 5
+
+_LISTA_PARAMETROS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_ESPACIOS = re.compile(r'\s+')
+_ESTE_ARCHIVO = os.path.abspath(__file__)
+
+
+class PresupuestoConsultasExcedido(AssertionError):
+    """Una vista superó su presupuesto de consultas o repitió una consulta en bucle"""
+
+
+def huella(sql):
+    """SQL normalizado: igual para dos consultas que sólo difieren en parámetros"""
+    return _ESPACIOS.sub(' ', _LISTA_PARAMETROS.sub('(...)', sql)).strip()
+
+
+def _origen():
+    """Primera línea del proyecto (fuera de Django y de este módulo) en la pila"""
+    base = str(settings.BASE_DIR)
+    marco = sys._getframe(2)
+    while marco is not None:
+        archivo = marco.f_code.co_filename
+        # Las comprensiones (<listcomp>, <genexpr>) se atribuyen a la función que las contiene
+        nombre = marco.f_code.co_name
+        if (
+            archivo.startswith(base) and archivo != _ESTE_ARCHIVO and 'site-packages' not in archivo
+            and (not nombre.startswith('<') or nombre == '<module>')
+        ):
+            return f'{os.path.relpath(archivo, base)}:{marco.f_lineno} {marco.f_code.co_name}'
+        marco = marco.f_back
+    return '?'
+
+
+class RegistroConsultas:
+    """Consultas ejecutadas en todas las conexiones mientras el registro está abierto"""
+
+    def __init__(self):
+        self.consultas = []
+        self._pila = None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((huella(sql), time.perf_counter() - inicio, _origen()))
+
+    def __enter__(self):
+        self._pila = ExitStack()
+        for alias in connections:
+            self._pila.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._pila.close()
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+    @property
+    def tiempo(self):
+        """Segundos pasados en la base de datos"""
+        return sum(duracion for _, duracion, _ in self.consultas)
+
+    def repetidas(self, umbral=UMBRAL_N_MAS_1):
+        """Huellas ejecutadas `umbral` veces o más: [(veces, origen, huella)], la peor primero"""
+        grupos = {}
+        for sql, _, origen in self.consultas:
+            veces, primer_origen = grupos.get(sql, (0, origen))
+            grupos[sql] = (veces + 1, primer_origen)
+        return sorted(
+            ((veces, origen, sql) for sql, (veces, origen) in grupos.items() if veces >= umbral),
+            reverse=True,
+        )
+
+    def problemas(self, maximo=None, umbral=UMBRAL_N_MAS_1):
+        """Descripción de cada exceso encontrado (lista vacía si todo está bien)"""
+        problemas = []
+        if maximo is not None and self.total > maximo:
+            problemas.append(f'{self.total} consultas (presupuesto: {maximo})')
+        for veces, origen, sql in self.repetidas(umbral):
+            problemas.append(f'N+1 en {origen}: {veces} veces {sql[:200]}')
+        return problemas
+
+
+def presupuesto_para(request):
+    """Máximo de consultas para la URL de la petición, o None si no tiene"""
+    presupuestos = getattr(settings, 'JUEGOS_PRESUPUESTO_CONSULTAS', {})
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is not None and coincidencia.view_name in presupuestos:
+        return presupuestos[coincidencia.view_name]
+    if request.path in presupuestos:
+        return presupuestos[request.path]
+    return getattr(settings, 'JUEGOS_PRESUPUESTO_CONSULTAS_DEFECTO', None)
+
+
+def medir_consultas():
+    return getattr(settings, 'JUEGOS_MEDIR_CONSULTAS', settings.DEBUG)
+
+
+def umbral_n_mas_1():
+    return getattr(settings, 'JUEGOS_UMBRAL_N_MAS_1', UMBRAL_N_MAS_1)
+
+
+class ConsultasMiddleware:
+    """Mide las consultas de cada petición y aplica los presupuestos de settings
+
+    Va primero en MIDDLEWARE para contar también las del resto de middleware.
+    Bajo ASGI las conexiones son de cada hilo, así que el registro se abre y
+    se cierra en el hilo que Django reserva para el código síncrono de la
+    petición: ve las consultas del middleware y las vistas síncronas y las
+    de sync_to_async (thread_sensitive, lo habitual). Las que corren en un
+    pool propio, como la verificación de contraseñas de acceso, no se miden.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not medir_consultas():
+            return self.get_response(request)
+
+        with RegistroConsultas() as registro:
+            response = self.get_response(request)
+        return self.anotar(request, response, registro)
+
+    async def __acall__(self, request):
+        if not medir_consultas():
+            return await self.get_response(request)
+
+        registro = RegistroConsultas()
+        await sync_to_async(registro.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(registro.__exit__)(None, None, None)
+        return self.anotar(request, response, registro)
+
+    def anotar(self, request, response, registro):
+        """Cabeceras de la medición y aviso (o error en modo estricto) si hubo excesos"""
+        response['X-Consultas'] = str(registro.total)
+        response['X-Consultas-Tiempo'] = f'{registro.tiempo * 1000:.1f}ms'
+        repetidas = registro.repetidas(umbral_n_mas_1())
+        if repetidas:
+            response['X-Consultas-N1'] = '; '.join(f'{origen} x{veces}' for veces, origen, _ in repetidas)
+
+        problemas = registro.problemas(presupuesto_para(request), umbral_n_mas_1())
+        if problemas:
+            mensaje = f'{request.method} {request.path}: ' + '; '.join(problemas)
+            if getattr(settings, 'JUEGOS_CONSULTAS_ESTRICTO', False):
+                raise PresupuestoConsultasExcedido(mensaje)
+            logger.warning(mensaje)
+        return response
+
+
+@contextmanager
+def presupuesto_consultas(maximo=None, umbral=UMBRAL_N_MAS_1):
+    """Falla si el bloque supera `maximo` consultas o repite una `umbral` veces
+
+    Sirve como `with` o como decorador de un test. Además activa el modo
+    estricto del middleware, así cada petición del test client se compara
+    con el presupuesto de su URL.
+    """
+    from django.test.utils import override_settings
+
+    with override_settings(JUEGOS_MEDIR_CONSULTAS=True, JUEGOS_CONSULTAS_ESTRICTO=True):
+        with RegistroConsultas() as registro:
+            yield registro
+
+    problemas = registro.problemas(maximo, umbral)
+    if problemas:
+        raise PresupuestoConsultasExcedido('\n'.join(problemas))
@@ -0,0 +1,12 @@
+"""
+Procesadores de contexto de la aplicación juegos
+"""
+
+from .notificaciones import contar_no_leidas
+
+
+def notificaciones(request):
+    """Contador del globo de notificaciones para todas las plantillas"""
+    if not request.user.is_authenticated:
+        return {}
+    return {'notificaciones_no_leidas': contar_no_leidas(request.user.id)}
@@ -0,0 +1,47 @@
+"""
+Cursores para paginación por clave (keyset)
+
+Un cursor apunta a una fila por su par (fecha, id) y viaja como texto opaco
+'microsegundos-id', seguro para usar en la query string.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def codificar_cursor(fecha, objeto_id):
+    """Cursor opaco para la fila (fecha, id)"""
+    return f'{(fecha - _EPOCA) // timedelta(microseconds=1)}-{objeto_id}'
+
+
+# Los ids son BIGINT: uno más grande no cabe en la consulta
+ID_MAXIMO = 2 ** 63 - 1
+
+
+def decodificar_cursor(cursor):
+    """(fecha, id) de un cursor; ValueError si no es válido"""
+    microsegundos, _, objeto_id = cursor.partition('-')
+    objeto_id = int(objeto_id)
+    if not 0 <= objeto_id <= ID_MAXIMO:
+        raise ValueError(f'Cursor fuera de rango: {cursor}')
+    try:
+        # Un número enorme pero bien formado desborda timedelta/datetime
+        return _EPOCA + timedelta(microseconds=int(microsegundos)), objeto_id
+    except OverflowError:
+        raise ValueError(f'Cursor fuera de rango: {cursor}')
+
+
+def filtro_antes(campo, cursor):
+    """Q de las filas anteriores al cursor en el orden (campo, id)"""
+    fecha, objeto_id = decodificar_cursor(cursor)
+    return Q(**{f'{campo}__lt': fecha}) | Q(**{campo: fecha, 'id__lt': objeto_id})
+
+
+def filtro_despues(campo, cursor):
+    """Q de las filas posteriores al cursor en el orden (campo, id)"""
+    fecha, objeto_id = decodificar_cursor(cursor)
+    return Q(**{f'{campo}__gt': fecha}) | Q(**{campo: fecha, 'id__gt': objeto_id})
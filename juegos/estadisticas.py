@@ -0,0 +1,94 @@
+"""
+Estadísticas globales del ranking
+
+Total de usuarios, activos en el último día, puntos de todo el sitio y el
+mejor jugador de hoy. Son agregados sobre tablas enteras que pueden tener
+unos segundos de atraso, así que se calculan como mucho cada
+TIEMPO_FRESCO segundos y se sirven desde la caché.
+
+Al vencer, un solo proceso las recalcula: el que gana el cerrojo
+(cache.add). Mientras tanto los demás siguen sirviendo el valor anterior,
+que se guarda bastante más tiempo que TIEMPO_FRESCO. Sólo si no hay ningún
+valor (caché vacía) esperan un momento a que el primero termine.
+"""
+
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import Perfil
+
+from .ranking import obtener_ranking
+
+
+CLAVE_ESTADISTICAS = 'ranking:estadisticas'
+CLAVE_CERROJO = 'ranking:estadisticas:cerrojo'
+# Segundos que un cálculo se considera al día
+TIEMPO_FRESCO = 60
+# Cuánto se conserva el último cálculo para servirlo mientras se rehace
+TIEMPO_CACHE_ESTADISTICAS = 60 * 60
+# Si el proceso que recalcula muere, otro lo reintenta pasado este tiempo
+TIEMPO_CERROJO = 30
+ESPERA_MAXIMA = 2.0
+INTERVALO_ESPERA = 0.05
+
+
+def calcular_estadisticas():
+    """Recalcula las estadísticas desde la base de datos"""
+    top = obtener_ranking('diario', 'todos', limite=1)
+    return {
+        'total_usuarios': User.objects.count(),
+        'activos_hoy': Perfil.objects.filter(
+            ultima_conexion__gte=timezone.now() - timedelta(days=1)
+        ).count(),
+        'puntos_totales': Perfil.objects.aggregate(total=Sum('puntos_totales'))['total'] or 0,
+        'top_hoy': {
+            'usuario': {'id': top[0]['usuario_id'], 'username': top[0]['username']},
+            'puntos': top[0]['puntos'],
+        } if top else None,
+    }
+
+
+def refrescar_estadisticas():
+    """Recalcula y guarda las estadísticas; devuelve los valores nuevos"""
+    valores = calcular_estadisticas()
+    cache.set(CLAVE_ESTADISTICAS, (time.time(), valores), timeout=TIEMPO_CACHE_ESTADISTICAS)
+    return valores
+
+
+def _refrescar_con_cerrojo():
+    """Recalcula si nadie más lo está haciendo; devuelve los valores o None"""
+    if not cache.add(CLAVE_CERROJO, 1, timeout=TIEMPO_CERROJO):
+        return None
+    try:
+        return refrescar_estadisticas()
+    finally:
+        cache.delete(CLAVE_CERROJO)
+
+
+def obtener_estadisticas():
+    """Estadísticas globales con a lo sumo TIEMPO_FRESCO segundos de atraso (aprox.)"""
+    guardado = cache.get(CLAVE_ESTADISTICAS)
+    if guardado is not None:
+        calculado, valores = guardado
+        if time.time() - calculado < TIEMPO_FRESCO:
+            return valores
+        # Vencidas: se rehacen una vez y, si otro ya está en eso, se sirve lo anterior
+        return _refrescar_con_cerrojo() or valores
+
+    valores = _refrescar_con_cerrojo()
+    if valores is not None:
+        return valores
+
+    # Caché vacía y otro proceso calculando: se espera su resultado un momento
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while time.monotonic() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        guardado = cache.get(CLAVE_ESTADISTICAS)
+        if guardado is not None:
+            return guardado[1]
+    return calcular_estadisticas()
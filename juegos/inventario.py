@@ -0,0 +1,211 @@
+"""
+Resumen del inventario de un usuario
+
+Los contadores de la página de inventario (ítems por tipo, equipados, valor
+total, rareza máxima y progreso de la colección) salen de una sola
+consulta de agregación condicional sobre ItemUsuario y se guardan en la
+caché por usuario. La versión del usuario sube al dar, usar o equipar un
+ítem (ver signals) y la global al editar el catálogo de ítems.
+
+Los ítems de la página se leen aparte con una consulta (select_related) y
+se reparten por tipo en una sola pasada.
+
+Dar y usar ítems son UPDATE condicionales de una sentencia (cantidad =
+cantidad ± n, y al usar sólo donde alcanza), así dos clics seguidos no
+gastan la misma unidad dos veces ni pierden una entrega.
+"""
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, Sum, Value, When
+
+from core.models import Item, ItemUsuario
+
+from . import catalogo
+from .versiones import incrementar_version, obtener_version
+
+
+CLAVE_VERSION_GLOBAL = 'inventario:version'
+TIEMPO_CACHE_RESUMEN = 60 * 60
+
+# Rarezas de menor a mayor
+RAREZAS = [rareza for rareza, _ in Item.RAREZAS]
+
+# Tipo de ítem -> nombre del grupo en la página
+GRUPOS = {
+    'ESPECIAL': 'especiales',
+    'CONSUMIBLE': 'consumibles',
+    'COLECCIONABLE': 'coleccionables',
+    'MEDALLA': 'medallas',
+}
+
+
+def _clave_version(usuario_id):
+    return f'inventario:version:{usuario_id}'
+
+
+def _clave_resumen(usuario_id):
+    return (
+        f'inventario:resumen:{usuario_id}'
+        f':v{obtener_version(CLAVE_VERSION_GLOBAL)}.{obtener_version(_clave_version(usuario_id))}'
+    )
+
+
+def invalidar_inventario(usuario_id):
+    """Descarta el resumen del usuario cuando se confirme la transacción actual"""
+    transaction.on_commit(lambda: incrementar_version(_clave_version(usuario_id)))
+
+
+def invalidar_inventarios():
+    """Descarta todos los resúmenes (tras editar el catálogo de ítems)"""
+    transaction.on_commit(lambda: incrementar_version(CLAVE_VERSION_GLOBAL))
+
+
+def calcular_resumen(usuario_id):
+    """Contadores del inventario en una consulta"""
+    rareza = Case(
+        *[When(item__rareza=nombre, then=Value(orden)) for orden, nombre in enumerate(RAREZAS)],
+        default=Value(-1),
+        output_field=IntegerField(),
+    )
+    por_tipo = {f'tipo_{tipo}': Count('id', filter=Q(item__tipo=tipo)) for tipo in GRUPOS}
+
+    fila = ItemUsuario.objects.filter(usuario_id=usuario_id).aggregate(
+        total=Count('id'),
+        equipados=Count('id', filter=Q(equipado=True)),
+        valor_total=Sum(F('item__valor') * F('cantidad')),
+        rareza_maxima=Max(rareza),
+        **por_tipo,
+    )
+    total_coleccionables = sum(1 for item in catalogo.items() if item.tipo == 'COLECCIONABLE')
+    obtenidos = fila['tipo_COLECCIONABLE']
+
+    return {
+        'stats': {
+            'total_items': fila['total'],
+            'items_equipados': fila['equipados'],
+            'valor_total': fila['valor_total'] or 0,
+            'rareza_maxima': RAREZAS[max(fila['rareza_maxima'] or 0, 0)],
+            'por_tipo': {GRUPOS[tipo]: fila[f'tipo_{tipo}'] for tipo in GRUPOS},
+        },
+        'stats_coleccion': {
+            'total': total_coleccionables,
+            'obtenidos': obtenidos,
+            'porcentaje': (obtenidos / total_coleccionables * 100) if total_coleccionables > 0 else 0,
+        },
+    }
+
+
+def obtener_resumen(usuario_id):
+    """Resumen del inventario desde la caché (lo calcula si falta)"""
+    clave = _clave_resumen(usuario_id)
+    resumen = cache.get(clave)
+    if resumen is None:
+        resumen = calcular_resumen(usuario_id)
+        cache.set(clave, resumen, timeout=TIEMPO_CACHE_RESUMEN)
+    return resumen
+
+
+def agrupar_items(usuario_id):
+    """{'todos': [...], 'especiales': [...], ...} con una consulta y una pasada"""
+    grupos = {'todos': []}
+    grupos.update({grupo: [] for grupo in GRUPOS.values()})
+
+    for item_usuario in ItemUsuario.objects.filter(usuario_id=usuario_id).select_related('item'):
+        grupos['todos'].append(item_usuario)
+        grupo = GRUPOS.get(item_usuario.item.tipo)
+        if grupo:
+            grupos[grupo].append(item_usuario)
+    return grupos
+
+
+# ============================================
+# OPERACIONES ATÓMICAS
+# ============================================
+
+def _por_item(cantidades):
+    """Expresión SQL con la cantidad de cada item_id"""
+    return Case(
+        *[When(item_id=item_id, then=Value(cantidad)) for item_id, cantidad in cantidades.items()],
+        output_field=IntegerField(),
+    )
+
+
+class _SinExistencias(Exception):
+    pass
+
+
+def usar_items(usuario_id, cantidades):
+    """Descuenta {item_id: cantidad} del inventario, todo o nada
+
+    Un solo UPDATE descuenta sólo en las filas que tienen suficiente; si
+    alguna no alcanza no se descuenta nada y devuelve None. Si no, devuelve
+    {item_id: cantidad restante}; las filas que quedan en cero se borran.
+    """
+    try:
+        with transaction.atomic():
+            descuento = _por_item(cantidades)
+            usadas = ItemUsuario.objects.filter(
+                usuario_id=usuario_id, item_id__in=cantidades, cantidad__gte=descuento,
+            ).update(cantidad=F('cantidad') - descuento)
+            if usadas < len(cantidades):
+                raise _SinExistencias
+
+            restantes = dict(
+                ItemUsuario.objects.filter(usuario_id=usuario_id, item_id__in=cantidades)
+                .values_list('item_id', 'cantidad')
+            )
+            agotados = [item_id for item_id, cantidad in restantes.items() if cantidad <= 0]
+            if agotados:
+                ItemUsuario.objects.filter(usuario_id=usuario_id, item_id__in=agotados, cantidad__lte=0).delete()
+            invalidar_inventario(usuario_id)
+    except _SinExistencias:
+        return None
+    return restantes
+
+
+def usar_item(usuario_id, item_id, cantidad=1):
+    """Descuenta unidades de un ítem; devuelve las que quedan o None si no alcanzaban"""
+    restantes = usar_items(usuario_id, {item_id: cantidad})
+    return None if restantes is None else restantes[item_id]
+
+
+def _dar_uno(usuario_id, item_id, cantidad):
+    """Upsert de una fila de ItemUsuario"""
+    filas = ItemUsuario.objects.filter(usuario_id=usuario_id, item_id=item_id)
+    if filas.update(cantidad=F('cantidad') + cantidad):
+        return
+    try:
+        with transaction.atomic():
+            ItemUsuario.objects.create(usuario_id=usuario_id, item_id=item_id, cantidad=cantidad)
+    except IntegrityError:
+        # Otra petición creó la fila entre el UPDATE y el INSERT
+        filas.update(cantidad=F('cantidad') + cantidad)
+
+
+def dar_items(usuario_id, cantidades):
+    """Suma {item_id: cantidad} al inventario, creando las filas que falten
+
+    Las existentes se suben con un UPDATE y las nuevas se insertan juntas;
+    unique_together (usuario, item) resuelve la carrera con otra entrega.
+    """
+    with transaction.atomic():
+        existentes = ItemUsuario.objects.filter(usuario_id=usuario_id, item_id__in=cantidades)
+        if existentes.update(cantidad=F('cantidad') + _por_item(cantidades)) < len(cantidades):
+            tenia = set(existentes.values_list('item_id', flat=True))
+            nuevos = [item_id for item_id in cantidades if item_id not in tenia]
+            try:
+                with transaction.atomic():
+                    ItemUsuario.objects.bulk_create([
+                        ItemUsuario(usuario_id=usuario_id, item_id=item_id, cantidad=cantidades[item_id])
+                        for item_id in nuevos
+                    ])
+            except IntegrityError:
+                for item_id in nuevos:
+                    _dar_uno(usuario_id, item_id, cantidades[item_id])
+        invalidar_inventario(usuario_id)
+
+
+def dar_item(usuario_id, item_id, cantidad=1):
+    """Suma unidades de un ítem al inventario"""
+    dar_items(usuario_id, {item_id: cantidad})
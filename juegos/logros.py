@@ -0,0 +1,403 @@
+"""
+Evaluación de logros de la Academia
+
+Reúne en una sola consulta todas las métricas que necesitan las reglas de
+los logros (niveles completados, aciertos, puntos, racha, amigos) y evalúa
+cada Logro contra esa foto en memoria. Así la galería de logros cuesta un
+número fijo de consultas, sin importar cuántos logros existan.
+
+Los desbloqueos se disparan con eventos tipados (publicar_evento) al guardar
+una partida. Cada evento suma sus deltas a los contadores del usuario en la
+caché (cache.incr) y solo evalúa las reglas suscritas a su tipo; un posible
+desbloqueo se confirma con las métricas de la BD. Los nuevos desbloqueos y sus
+notificaciones se escriben con bulk_create(ignore_conflicts=True), por
+defecto desde un hilo en segundo plano, fuera del tiempo de respuesta.
+
+Las reglas se arman con el catálogo de logros en memoria y se cachean bajo su
+versión, así una edición en el admin llega también a los demás procesos.
+"""
+
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Amistad, Logro, LogroDesbloqueado, Notificacion
+from . import catalogo
+from .models import AventuraNivel, ProgresoAventura, ProgresoOrtografia
+from .notificaciones import crear_notificaciones
+
+logger = logging.getLogger(__name__)
+
+
+# Métrica del usuario que mide cada tipo de logro
+METRICA_POR_TIPO = {
+    'AVENTURA': 'niveles_completados',
+    'ORTOGRAFIA': 'aciertos_ortografia',
+    'PUNTOS': 'puntos_totales',
+    'RACHA': 'racha_maxima',
+    'SOCIAL': 'amigos',
+}
+
+
+def _total(queryset, expresion):
+    """Subconsulta escalar con un agregado sobre las filas de un usuario"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values('usuario').annotate(total=expresion).values('total')[:1],
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def obtener_metricas(usuario_id):
+    """Calcula en una consulta todas las métricas que usan las reglas de logros"""
+    amigos = Amistad.objects.filter(
+        Q(usuario1=OuterRef('pk')) | Q(usuario2=OuterRef('pk')),
+        estado='ACEPTADA',
+    ).order_by().values('estado').annotate(total=Count('id')).values('total')[:1]
+
+    metricas = User.objects.filter(pk=usuario_id).annotate(
+        niveles_completados=_total(
+            ProgresoAventura.objects.filter(usuario=OuterRef('pk'), completado=True),
+            Count('id'),
+        ),
+        aciertos_ortografia=_total(
+            ProgresoOrtografia.objects.filter(usuario=OuterRef('pk')),
+            Sum('aciertos'),
+        ),
+        amigos=Coalesce(Subquery(amigos, output_field=IntegerField()), 0),
+        puntos_totales=Coalesce(F('perfil_core__puntos_totales'), 0),
+        racha_maxima=Coalesce(F('perfil_core__racha_maxima'), 0),
+    ).values(*METRICA_POR_TIPO.values()).first()
+
+    return metricas or dict.fromkeys(METRICA_POR_TIPO.values(), 0)
+
+
+def calcular_progreso(logro, metricas):
+    """Progreso de un logro según las métricas ya calculadas del usuario"""
+    metrica = METRICA_POR_TIPO.get(logro.tipo)
+    actual = metricas.get(metrica, 0) if metrica else 0
+
+    return {
+        'actual': actual,
+        'necesario': logro.cantidad_necesaria,
+        'porcentaje': (actual / logro.cantidad_necesaria * 100) if logro.cantidad_necesaria > 0 else 0
+    }
+
+
+class EvaluacionLogros:
+    """Estado de todos los logros para un usuario, calculado en tres consultas"""
+
+    def __init__(self, usuario):
+        self.usuario = usuario
+        self.logros = list(catalogo.logros())
+        self.desbloqueos = list(
+            LogroDesbloqueado.objects.filter(usuario=usuario).select_related('logro')
+        )
+        self.desbloqueados = {d.logro_id: d.fecha_desbloqueo for d in self.desbloqueos}
+        self.metricas = obtener_metricas(usuario.id)
+
+    def progreso(self, logro):
+        """Progreso de un logro; None si ya está desbloqueado"""
+        if logro.id in self.desbloqueados:
+            return None
+        return calcular_progreso(logro, self.metricas)
+
+    def recientes(self, limite=5):
+        """Últimos logros desbloqueados"""
+        return sorted(self.desbloqueos, key=lambda d: d.fecha_desbloqueo, reverse=True)[:limite]
+
+    def proximos(self):
+        """Logros bloqueados con algún avance, ordenados por lo que les falta"""
+        proximos = []
+
+        for logro in self.logros:
+            progreso = self.progreso(logro)
+            if progreso and progreso['actual'] > 0:
+                proximos.append({
+                    'logro': logro,
+                    'progreso': progreso,
+                    'faltante': progreso['necesario'] - progreso['actual']
+                })
+
+        return sorted(proximos, key=lambda x: x['faltante'])
+
+    def stats_rareza(self):
+        """Logros totales y obtenidos por rareza"""
+        rarezas = {rareza: {'total': 0, 'obtenidos': 0} for rareza, _ in Logro.RAREZAS}
+
+        for logro in self.logros:
+            stats = rarezas.setdefault(logro.rareza, {'total': 0, 'obtenidos': 0})
+            stats['total'] += 1
+            if logro.id in self.desbloqueados:
+                stats['obtenidos'] += 1
+
+        for stats in rarezas.values():
+            stats['porcentaje'] = (stats['obtenidos'] / stats['total'] * 100) if stats['total'] > 0 else 0
+
+        return rarezas
+
+
+# ============================================
+# DESBLOQUEO POR EVENTOS
+# ============================================
+
+EVENTO_AVENTURA = 'AVENTURA'
+EVENTO_ORTOGRAFIA = 'ORTOGRAFIA'
+EVENTO_SOCIAL = 'SOCIAL'
+
+# Tipos de Logro que puede desbloquear cada tipo de evento
+SUSCRIPCIONES = {
+    EVENTO_AVENTURA: ('AVENTURA', 'PUNTOS'),
+    EVENTO_ORTOGRAFIA: ('ORTOGRAFIA', 'PUNTOS'),
+    EVENTO_SOCIAL: ('SOCIAL',),
+}
+
+# Logros que la academia crea al migrar (ver juegos.management.crear_datos_base)
+LOGRO_TODOS_LOS_NIVELES = 'Maestro de la Aventura'
+LOGROS_BASE = [
+    {
+        'nombre': LOGRO_TODOS_LOS_NIVELES,
+        'descripcion': 'Completar todos los niveles de aventura',
+        'categoria': 'AVENTURA',
+        'tipo': 'AVENTURA',
+        'rareza': 'LEGENDARIO',
+        'icono': 'crown',
+        'puntos': 1000,
+    },
+    {
+        'nombre': 'Maestro de la Ortografía',
+        'descripcion': 'Alcanzar 1000 aciertos en ortografía',
+        'categoria': 'ORTOGRAFIA',
+        'tipo': 'ORTOGRAFIA',
+        'cantidad_necesaria': 1000,
+        'rareza': 'LEGENDARIO',
+        'icono': 'pencil-alt',
+        'puntos': 1000,
+    },
+]
+
+TIEMPO_CACHE_REGLAS = 60 * 60 * 24
+TIEMPO_CACHE_METRICAS = 60 * 60
+
+
+class EventoLogro:
+    """Evento de juego que puede desbloquear logros"""
+
+    def __init__(self, tipo, usuario_id, deltas=None):
+        if tipo not in SUSCRIPCIONES:
+            raise ValueError(f'Tipo de evento desconocido: {tipo}')
+        self.tipo = tipo
+        self.usuario_id = usuario_id
+        # Cambios conocidos en las métricas; None en un valor obliga a recalcular
+        self.deltas = deltas or {}
+
+    def __repr__(self):
+        return f'EventoLogro({self.tipo}, usuario={self.usuario_id}, {self.deltas})'
+
+
+def asegurar_logros_base():
+    """Crea los logros base si no existen y ajusta el de todos los niveles"""
+    for datos in LOGROS_BASE:
+        datos = dict(datos)
+        Logro.objects.get_or_create(nombre=datos.pop('nombre'), defaults=datos)
+    actualizar_logro_todos_los_niveles()
+
+
+def actualizar_logro_todos_los_niveles():
+    """El logro de todos los niveles exige tantos niveles como existan"""
+    Logro.objects.filter(nombre=LOGRO_TODOS_LOS_NIVELES).update(
+        cantidad_necesaria=AventuraNivel.objects.count()
+    )
+    # update() no envía señales: se invalida a mano el catálogo (y con él las reglas)
+    invalidar_reglas()
+
+
+def invalidar_reglas():
+    """Recarga el catálogo de logros, y con él las reglas, en todos los procesos"""
+    catalogo.invalidar_catalogo('logros')
+
+
+def _reglas():
+    """Reglas agrupadas por tipo: {tipo: [(logro_id, nombre, cantidad), ...]}"""
+    logros = catalogo.logros()
+    # Las versiones viejas dejan de pedirse y expiran solas
+    clave = f'logros:reglas:v{logros.version}'
+    reglas = cache.get(clave)
+    if reglas is None:
+        reglas = {}
+        for logro in logros:
+            if logro.tipo in METRICA_POR_TIPO and logro.cantidad_necesaria > 0:
+                reglas.setdefault(logro.tipo, []).append((logro.id, logro.nombre, logro.cantidad_necesaria))
+        cache.set(clave, reglas, timeout=TIEMPO_CACHE_REGLAS)
+    return reglas
+
+
+def _clave_metrica(usuario_id, metrica):
+    return f'logros:metricas:{usuario_id}:{metrica}'
+
+
+def _clave_desbloqueados(usuario_id):
+    return f'logros:desbloqueados:{usuario_id}'
+
+
+def _guardar_metricas(usuario_id, metricas, pisar=()):
+    """Inicializa los contadores que falten sin pisar los que otro proceso ya sumó
+
+    Las métricas de `pisar` (cambios desconocidos) se reemplazan por el valor de la BD.
+    """
+    for metrica, valor in metricas.items():
+        clave = _clave_metrica(usuario_id, metrica)
+        if metrica in pisar:
+            cache.set(clave, valor, timeout=TIEMPO_CACHE_METRICAS)
+        else:
+            cache.add(clave, valor, timeout=TIEMPO_CACHE_METRICAS)
+
+
+def _metricas_actualizadas(evento):
+    """Aplica los deltas del evento a los contadores en caché
+
+    Cada métrica es una clave aparte que se suma con cache.incr, atómico
+    entre procesos, así dos eventos simultáneos no pierden un delta. Si falta
+    algún contador o el evento trae un cambio desconocido (None), se
+    recalculan desde la BD.
+    """
+    usuario_id = evento.usuario_id
+    desconocidas = {metrica for metrica, valor in evento.deltas.items() if valor is None}
+
+    if not desconocidas:
+        metricas = {}
+        try:
+            for metrica, valor in evento.deltas.items():
+                metricas[metrica] = cache.incr(_clave_metrica(usuario_id, metrica), valor)
+        except ValueError:
+            # El contador no está en caché
+            pass
+        else:
+            claves = {_clave_metrica(usuario_id, m): m for m in METRICA_POR_TIPO.values() if m not in metricas}
+            guardadas = cache.get_many(list(claves))
+            if len(guardadas) == len(claves):
+                metricas.update({claves[clave]: valor for clave, valor in guardadas.items()})
+                return metricas
+
+    metricas = obtener_metricas(usuario_id)
+    _guardar_metricas(usuario_id, metricas, pisar=desconocidas)
+    return metricas
+
+
+def _desbloqueados(usuario_id):
+    clave = _clave_desbloqueados(usuario_id)
+    desbloqueados = cache.get(clave)
+    if desbloqueados is None:
+        desbloqueados = set(
+            LogroDesbloqueado.objects.filter(usuario_id=usuario_id).values_list('logro_id', flat=True)
+        )
+        cache.set(clave, desbloqueados, timeout=TIEMPO_CACHE_METRICAS)
+    return desbloqueados
+
+
+def procesar_evento(evento):
+    """Evalúa las reglas suscritas al evento y guarda los logros nuevos"""
+    desbloqueados = _desbloqueados(evento.usuario_id)
+    reglas = _reglas()
+
+    def candidatos_con(metricas):
+        candidatos = {}
+        for tipo in SUSCRIPCIONES[evento.tipo]:
+            actual = metricas.get(METRICA_POR_TIPO[tipo], 0)
+            for logro_id, nombre, cantidad in reglas.get(tipo, []):
+                if logro_id not in desbloqueados and actual >= cantidad:
+                    candidatos[logro_id] = nombre
+        return candidatos
+
+    candidatos = candidatos_con(_metricas_actualizadas(evento))
+    if candidatos:
+        # Los contadores en caché pueden adelantarse (un evento contado dos
+        # veces al reinicializarlos): se confirma contra la BD antes de desbloquear
+        candidatos = candidatos_con(obtener_metricas(evento.usuario_id))
+    if not candidatos:
+        return set()
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        LogroDesbloqueado.objects.bulk_create(
+            [
+                LogroDesbloqueado(usuario_id=evento.usuario_id, logro_id=logro_id, fecha_desbloqueo=ahora)
+                for logro_id in candidatos
+            ],
+            ignore_conflicts=True,
+        )
+        # Solo notificar los que insertó este evento (otro pudo adelantarse)
+        nuevos = set(LogroDesbloqueado.objects.filter(
+            usuario_id=evento.usuario_id,
+            logro_id__in=candidatos,
+            fecha_desbloqueo=ahora,
+        ).values_list('logro_id', flat=True))
+        crear_notificaciones(
+            [
+                Notificacion(
+                    usuario_id=evento.usuario_id,
+                    titulo='¡Nuevo logro!',
+                    mensaje=f'Has desbloqueado: {candidatos[logro_id]}',
+                    tipo='LOGRO',
+                    fecha_creacion=ahora,
+                )
+                for logro_id in nuevos
+            ]
+        )
+
+    cache.set(
+        _clave_desbloqueados(evento.usuario_id),
+        desbloqueados | set(candidatos),
+        timeout=TIEMPO_CACHE_METRICAS,
+    )
+    return nuevos
+
+
+# Cola de eventos pendientes y su hilo consumidor (uno por proceso)
+_cola = queue.Queue()
+_trabajador = None
+_lock_trabajador = threading.Lock()
+
+
+def _procesar_cola():
+    while True:
+        evento = _cola.get()
+        try:
+            close_old_connections()
+            procesar_evento(evento)
+        except Exception:
+            logger.exception('Error procesando %r', evento)
+        finally:
+            close_old_connections()
+            _cola.task_done()
+
+
+def _encolar(evento):
+    global _trabajador
+    with _lock_trabajador:
+        if _trabajador is None or not _trabajador.is_alive():
+            _trabajador = threading.Thread(target=_procesar_cola, name='logros', daemon=True)
+            _trabajador.start()
+    _cola.put(evento)
+
+
+def publicar_evento(usuario, tipo, **deltas):
+    """Publica un evento de juego; los logros se evalúan tras el commit"""
+    evento = EventoLogro(tipo, usuario.id, deltas)
+
+    if getattr(settings, 'JUEGOS_LOGROS_EN_SEGUNDO_PLANO', True):
+        transaction.on_commit(lambda: _encolar(evento))
+    else:
+        procesar_evento(evento)
+
+    return evento
@@ -0,0 +1,5 @@
+def crear_datos_base(sender, **kwargs):
+    """Crea los datos base de la academia después de migrar (ver JuegosConfig)"""
+    from juegos.logros import asegurar_logros_base
+
+    asegurar_logros_base()
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from juegos.retencion import TAMANO_LOTE, aplicar_retencion
+
+
+class Command(BaseCommand):
+    """Archiva y borra notificaciones y mensajes vencidos"""
+
+    help = 'Aplica los plazos de retención de Notificacion y Mensaje, archivando lo borrado en JSONL comprimido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directorio', help='Carpeta de los archivos (por defecto JUEGOS_DIRECTORIO_ARCHIVO)')
+        parser.add_argument('--sin-archivo', action='store_true', help='Borrar sin guardar una copia')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Filas por transacción de borrado')
+        parser.add_argument('--simular', action='store_true', help='Sólo contar lo que se borraría')
+
+    def handle(self, *args, **options):
+        resumen = aplicar_retencion(
+            directorio=options['directorio'],
+            archivar=not options['sin_archivo'],
+            lote=options['lote'],
+            simular=options['simular'],
+        )
+
+        verbo = 'Se borrarían' if options['simular'] else 'Borradas'
+        for tipo, total in resumen['notificaciones'].items():
+            if total:
+                self.stdout.write(f'  Notificaciones {tipo}: {total}')
+        total_notificaciones = sum(resumen['notificaciones'].values())
+        for ruta in resumen['archivos']:
+            self.stdout.write(f'  Archivo: {ruta}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {verbo}: {total_notificaciones} notificaciones y {resumen["mensajes"]} mensajes'
+        ))
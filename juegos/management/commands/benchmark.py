@@ -0,0 +1,88 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from juegos.benchmark import ESCENARIOS, comparar, ejecutar_benchmark, generar_datos, limpiar_datos
+
+
+class Command(BaseCommand):
+    """Genera datos sintéticos y mide las vistas principales"""
+
+    help = 'Benchmark de punta a punta: latencia p50/p95, consultas y memoria por vista, en JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generar', action='store_true', help='Crear antes los datos sintéticos')
+        parser.add_argument('--usuarios', type=int, default=10000, help='Usuarios sintéticos a crear')
+        parser.add_argument('--dias', type=int, default=30, help='Días de actividad generados')
+        parser.add_argument('--mensajes', type=int, default=20, help='Mensajes enviados por usuario')
+        parser.add_argument('--limpiar', action='store_true', help='Sólo borrar los datos sintéticos')
+        parser.add_argument(
+            '--escenarios', nargs='+', choices=sorted(ESCENARIOS), help='Vistas a medir (por defecto todas)'
+        )
+        parser.add_argument('--repeticiones', type=int, default=50, help='Peticiones medidas por vista')
+        parser.add_argument(
+            '--rafaga-login', type=int, default=0, metavar='ALUMNOS',
+            help='Medir logins por segundo con ALUMNOS entrando a la vez (sin --escenarios, sólo eso)',
+        )
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--etiqueta', default='', help='Nombre de la corrida (rama, commit...)')
+        parser.add_argument('--salida', help='Archivo JSON del resultado (por defecto, la salida estándar)')
+        parser.add_argument('--comparar', help='Resultado JSON de una corrida anterior')
+
+    def handle(self, *args, **options):
+        if options['limpiar']:
+            total = limpiar_datos()
+            self.stdout.write(self.style.SUCCESS(f'✅ Datos sintéticos borrados: {total} usuarios'))
+            return
+
+        if options['generar']:
+            creadas = generar_datos(
+                usuarios=options['usuarios'],
+                dias=options['dias'],
+                mensajes_por_usuario=options['mensajes'],
+                semilla=options['semilla'],
+            )
+            for tabla, total in creadas.items():
+                self.stderr.write(f'  {tabla}: {total}')
+
+        escenarios = options['escenarios']
+        if escenarios is None and options['rafaga_login']:
+            escenarios = []
+
+        try:
+            resultado = ejecutar_benchmark(
+                escenarios=escenarios,
+                repeticiones=options['repeticiones'],
+                semilla=options['semilla'],
+                etiqueta=options['etiqueta'],
+                rafaga_login=options['rafaga_login'],
+            )
+        except ValueError as e:
+            raise CommandError(f'{e} (usar --generar)')
+
+        texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto + '\n')
+        else:
+            self.stdout.write(texto)
+
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as archivo:
+                anterior = json.load(archivo)
+            for nombre, metrica, antes, despues, cambio in comparar(anterior, resultado):
+                self.stderr.write(f'  {nombre:20} {metrica:16} {antes:>10} -> {despues:>10} ({cambio:+.1f}%)')
+
+        for nombre, metricas in resultado['escenarios'].items():
+            if metricas.get('errores'):
+                self.stderr.write(self.style.WARNING(f'  {nombre}: {metricas["errores"]}'))
+        if 'rafaga_login' in resultado:
+            rafaga = resultado['rafaga_login']
+            self.stderr.write(
+                f'  Ráfaga de {rafaga["alumnos"]} logins: {rafaga["logins_por_segundo"]}/s '
+                f'(síncrono: {rafaga["referencia_sincronica"]["logins_por_segundo"]}/s)'
+            )
+        destino = options['salida'] or 'la salida estándar'
+        self.stderr.write(self.style.SUCCESS(
+            f'✅ Benchmark de {len(resultado["escenarios"])} vistas escrito en {destino}'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from juegos.alumnos import TAMANO_LOTE, escribir_claves, importar_alumnos, leer_lista
+
+
+class Command(BaseCommand):
+    """Da de alta una lista de alumnos con su perfil, inventario y bienvenida"""
+
+    help = 'Importa alumnos desde un CSV o JSON (username, password, nombre_completo, fecha_nacimiento, email...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Lista de clase en CSV (con encabezado) o JSON')
+        parser.add_argument('--formato', choices=['csv', 'json'], help='Por defecto se deduce del contenido')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Alumnos por transacción')
+        parser.add_argument('--procesos', type=int, help='Procesos para hashear contraseñas (por defecto, uno por CPU)')
+        parser.add_argument('--claves', help='CSV donde guardar las contraseñas generadas')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], encoding='utf-8-sig') as archivo:
+                filas = leer_lista(archivo.read(), options['formato'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {options["archivo"]}: {e}')
+
+        resultado = importar_alumnos(filas, lote=options['lote'], procesos=options['procesos'])
+
+        for error in resultado.errores:
+            self.stderr.write(self.style.WARNING(f'  {error}'))
+        if resultado.existentes:
+            self.stdout.write(f'  Ya existían (sin cambios): {len(resultado.existentes)}')
+        if resultado.claves_generadas:
+            if options['claves']:
+                with open(options['claves'], 'w', newline='', encoding='utf-8') as destino:
+                    escribir_claves(resultado.claves_generadas, destino)
+                self.stdout.write(f'  Contraseñas generadas en {options["claves"]}')
+            else:
+                escribir_claves(resultado.claves_generadas, self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'✅ Alumnos creados: {len(resultado.creados)}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from juegos.puntos import recalcular_puntos
+
+
+class Command(BaseCommand):
+    """Recalcula los puntos de los perfiles a partir del libro de puntos"""
+
+    help = 'Rehace Perfil.puntos_totales y nivel_maestria desde PuntuacionDiaria'
+
+    def handle(self, *args, **options):
+        total = recalcular_puntos()
+        self.stdout.write(self.style.SUCCESS(f'✅ Puntos recalculados: {total} perfiles'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from juegos.mensajeria import reconstruir_conversaciones
+
+
+class Command(BaseCommand):
+    """Recalcula la bandeja de conversaciones a partir de los mensajes"""
+
+    help = 'Reconstruye la tabla Conversacion desde el historial de Mensaje'
+
+    def handle(self, *args, **options):
+        total = reconstruir_conversaciones()
+        self.stdout.write(self.style.SUCCESS(f'✅ Conversaciones reconstruidas: {total} filas'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from juegos.ranking import reconstruir_ranking
+
+
+class Command(BaseCommand):
+    """Recalcula el ranking materializado a partir de PuntuacionDiaria"""
+
+    help = 'Reconstruye la tabla RankingMaterializado (días, semanas, meses y total) desde las puntuaciones diarias'
+
+    def handle(self, *args, **options):
+        total = reconstruir_ranking()
+        self.stdout.write(self.style.SUCCESS(f'✅ Ranking reconstruido: {total} filas'))
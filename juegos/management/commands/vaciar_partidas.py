@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from juegos.partidas import recuperar_spool
+
+
+class Command(BaseCommand):
+    """Aplica las partidas diferidas que quedaron en el spool"""
+
+    help = 'Guarda las partidas pendientes que dejaron en el spool procesos ya terminados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directorio', help='Carpeta del spool (por defecto JUEGOS_DIRECTORIO_SPOOL)')
+
+    def handle(self, *args, **options):
+        total = recuperar_spool(options['directorio'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Partidas recuperadas: {total}'))
@@ -0,0 +1,166 @@
+"""
+Bandeja de mensajes privados
+
+Mantiene la tabla Conversacion con el último mensaje y los no leídos de cada
+par (usuario, otro usuario). Se actualiza al enviar un mensaje y al abrir
+la conversación, así que la bandeja se arma con una sola consulta indexada
+en vez de recorrer todo el historial y contar los no leídos por contacto.
+
+El historial de una conversación se pagina por cursor (fecha_envio, id): cada
+página es un rango del índice compuesto de Mensaje, así que su costo no crece
+con la longitud del chat. Sólo se marcan como leídos los mensajes visibles.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from core.models import Conversacion, Mensaje
+
+from .cursores import codificar_cursor, filtro_antes
+from .push import EVENTO_MENSAJE, publicar
+
+
+def _actualizar_o_crear(usuario_id, otro_id, cambios, valores_iniciales):
+    """Upsert atómico de una fila de Conversacion"""
+    filas = Conversacion.objects.filter(usuario_id=usuario_id, otro_usuario_id=otro_id)
+    if filas.update(**cambios):
+        return
+
+    try:
+        with transaction.atomic():
+            Conversacion.objects.create(usuario_id=usuario_id, otro_usuario_id=otro_id, **valores_iniciales)
+    except IntegrityError:
+        # Otra petición creó la fila entre el UPDATE y el INSERT
+        filas.update(**cambios)
+
+
+def registrar_mensaje(mensaje):
+    """Actualiza la conversación de ambos participantes con un mensaje nuevo"""
+    ultimo = {
+        'ultimo_mensaje_id': mensaje.id,
+        'fecha_ultimo_mensaje': mensaje.fecha_envio,
+    }
+
+    _actualizar_o_crear(mensaje.remitente_id, mensaje.destinatario_id, ultimo, ultimo)
+    _actualizar_o_crear(
+        mensaje.destinatario_id, mensaje.remitente_id,
+        dict(ultimo, no_leidos=F('no_leidos') + 1),
+        dict(ultimo, no_leidos=1),
+    )
+    publicar(mensaje.destinatario_id, EVENTO_MENSAJE, {
+        'id': mensaje.id,
+        'remitente_id': mensaje.remitente_id,
+        'contenido': mensaje.contenido,
+        'fecha': mensaje.fecha_envio.strftime('%H:%M'),
+    })
+
+
+def marcar_leidos(usuario, otro_usuario, mensajes=None):
+    """Marca como leídos los mensajes recibidos de otro usuario
+
+    Con `mensajes` sólo se marcan esos (la ventana visible) y el contador de la
+    bandeja baja en la misma cantidad; sin ellos se marca toda la conversación.
+    """
+    pendientes = Mensaje.objects.filter(
+        remitente=otro_usuario,
+        destinatario=usuario,
+        leido=False
+    )
+    conversacion = Conversacion.objects.filter(usuario=usuario, otro_usuario=otro_usuario, no_leidos__gt=0)
+
+    if mensajes is None:
+        pendientes.update(leido=True)
+        conversacion.update(no_leidos=0)
+        return
+
+    ids = [m.id for m in mensajes if m.remitente_id == otro_usuario.id and not m.leido]
+    if not ids:
+        return
+    marcados = pendientes.filter(id__in=ids).update(leido=True)
+    if marcados:
+        conversacion.update(no_leidos=Greatest(F('no_leidos') - marcados, 0))
+    for mensaje in mensajes:
+        if mensaje.id in ids:
+            mensaje.leido = True
+
+
+def obtener_conversaciones(usuario):
+    """Conversaciones del usuario, la más reciente primero"""
+    return [
+        {
+            'usuario': conversacion.otro_usuario,
+            'ultimo_mensaje': conversacion.ultimo_mensaje,
+            'no_leidos': conversacion.no_leidos,
+        }
+        for conversacion in Conversacion.objects.filter(
+            usuario=usuario
+        ).select_related('otro_usuario', 'ultimo_mensaje').order_by('-fecha_ultimo_mensaje')
+    ]
+
+
+def reconstruir_conversaciones(usuarios=None):
+    """Recalcula la tabla Conversacion desde el historial de mensajes
+
+    Con `usuarios` (un queryset de User) sólo rehace las bandejas de ellos.
+    """
+    conversaciones = {}
+
+    mensajes = Mensaje.objects.all()
+    filas = Conversacion.objects.all()
+    if usuarios is not None:
+        mensajes = mensajes.filter(Q(remitente__in=usuarios) | Q(destinatario__in=usuarios))
+        filas = filas.filter(usuario__in=usuarios)
+        ids = set(usuarios.values_list('id', flat=True))
+
+    mensajes = mensajes.order_by('-fecha_envio', '-id').values_list(
+        'id', 'remitente_id', 'destinatario_id', 'fecha_envio', 'leido'
+    )
+    for mensaje_id, remitente_id, destinatario_id, fecha, leido in mensajes.iterator(chunk_size=2000):
+        for par in ((remitente_id, destinatario_id), (destinatario_id, remitente_id)):
+            if par not in conversaciones:
+                conversaciones[par] = Conversacion(
+                    usuario_id=par[0],
+                    otro_usuario_id=par[1],
+                    ultimo_mensaje_id=mensaje_id,
+                    fecha_ultimo_mensaje=fecha,
+                )
+        if not leido:
+            conversaciones[(destinatario_id, remitente_id)].no_leidos += 1
+
+    if usuarios is not None:
+        conversaciones = {par: fila for par, fila in conversaciones.items() if par[0] in ids}
+
+    with transaction.atomic():
+        filas.delete()
+        Conversacion.objects.bulk_create(conversaciones.values(), batch_size=1000)
+
+    return len(conversaciones)
+
+
+# ============================================
+# HISTORIAL PAGINADO
+# ============================================
+
+MENSAJES_POR_PAGINA = 30
+
+
+def pagina_mensajes(usuario, otro_usuario, antes=None, limite=MENSAJES_POR_PAGINA):
+    """Página de mensajes de una conversación anteriores al cursor `antes`
+
+    Devuelve (mensajes en orden cronológico, cursor de la página anterior o
+    None si ya no hay más).
+    """
+    mensajes = Mensaje.objects.filter(
+        Q(remitente=usuario, destinatario=otro_usuario) |
+        Q(remitente=otro_usuario, destinatario=usuario)
+    )
+    if antes:
+        mensajes = mensajes.filter(filtro_antes('fecha_envio', antes))
+
+    pagina = list(mensajes.order_by('-fecha_envio', '-id')[:limite + 1])
+    hay_mas = len(pagina) > limite
+    pagina = pagina[:limite]
+    pagina.reverse()
+
+    return pagina, codificar_cursor(pagina[0].fecha_envio, pagina[0].id) if hay_mas else None
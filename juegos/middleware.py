@@ -0,0 +1,56 @@
+"""
+Middleware de la aplicación juegos
+"""
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .perfiles import cargar_usuario
+
+
+def obtener_usuario(request):
+    """Usuario de la sesión con su perfil, desde la caché si es posible
+
+    Repite las comprobaciones de django.contrib.auth.get_user sobre el
+    usuario cargado (la caché se invalida al guardar User); ante cualquier caso raro
+    (backend desconocido, hash de sesión distinto, usuario inactivo) delega
+    en él para conservar su comportamiento.
+    """
+    try:
+        usuario_id = int(request.session[SESSION_KEY])
+        backend = request.session[BACKEND_SESSION_KEY]
+    except (KeyError, TypeError, ValueError):
+        return auth.get_user(request)
+
+    if backend in settings.AUTHENTICATION_BACKENDS:
+        usuario = cargar_usuario(usuario_id)
+    else:
+        usuario = None
+    hash_sesion = request.session.get(HASH_SESSION_KEY)
+    if (
+        usuario is None
+        or not usuario.is_active
+        or not hash_sesion
+        or not constant_time_compare(hash_sesion, usuario.get_session_auth_hash())
+    ):
+        return auth.get_user(request)
+
+    usuario.backend = backend
+    # Alias que usan las vistas (request.user.perfil)
+    if hasattr(usuario, 'perfil_core'):
+        usuario.perfil = usuario.perfil_core
+    return usuario
+
+
+class PerfilMiddleware(MiddlewareMixin):
+    """Carga request.user junto con su Perfil e Inventario en una consulta
+
+    Va después de AuthenticationMiddleware y reemplaza su usuario perezoso.
+    """
+
+    def process_request(self, request):
+        request.user = SimpleLazyObject(lambda: obtener_usuario(request))
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("juegos", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RankingMaterializado",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "periodo",
+                    models.CharField(
+                        choices=[
+                            ("diario", "Diario"),
+                            ("semanal", "Semanal"),
+                            ("mensual", "Mensual"),
+                            ("total", "Total"),
+                        ],
+                        max_length=10,
+                        verbose_name="período",
+                    ),
+                ),
+                (
+                    "juego",
+                    models.CharField(
+                        choices=[
+                            ("todos", "Todos"),
+                            ("aventura", "Aventura"),
+                            ("ortografia", "Ortografía"),
+                        ],
+                        max_length=20,
+                        verbose_name="juego",
+                    ),
+                ),
+                ("inicio_periodo", models.DateField(verbose_name="inicio del período")),
+                ("puntos", models.IntegerField(default=0, verbose_name="puntos")),
+                ("partidas", models.IntegerField(default=0, verbose_name="partidas")),
+                (
+                    "usuario",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rankings",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "posición de ranking",
+                "verbose_name_plural": "ranking materializado",
+                "indexes": [
+                    models.Index(
+                        fields=["periodo", "juego", "inicio_periodo", "-puntos"],
+                        name="ranking_periodo_puntos_idx",
+                    )
+                ],
+                "unique_together": {("periodo", "juego", "inicio_periodo", "usuario")},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("juegos", "0002_ranking_materializado"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FronteraAventura",
+            fields=[
+                (
+                    "usuario",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="frontera_aventura",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "orden_completado",
+                    models.IntegerField(default=0, verbose_name="orden completado"),
+                ),
+            ],
+            options={
+                "verbose_name": "frontera de aventura",
+                "verbose_name_plural": "fronteras de aventura",
+            },
+        ),
+    ]
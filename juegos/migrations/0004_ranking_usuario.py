@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("juegos", "0003_frontera_aventura"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="rankingmaterializado",
+            index=models.Index(
+                fields=["usuario", "periodo", "juego", "-inicio_periodo"],
+                name="ranking_usuario_idx",
+            ),
+        ),
+    ]
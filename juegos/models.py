@@ -59,6 +59,22 @@ class ProgresoAventura(models.Model):
         return f"{self.usuario.username} - {_('Nivel')} {self.nivel.nivel}"
 
 
+class FronteraAventura(models.Model):
+    """Último nivel (por orden) hasta el que el usuario completó la aventura sin huecos"""
+    
+    usuario = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='frontera_aventura'
+    )
+    orden_completado = models.IntegerField(_("orden completado"), default=0)
+    
+    class Meta:
+        verbose_name = _("frontera de aventura")
+        verbose_name_plural = _("fronteras de aventura")
+    
+    def __str__(self):
+        return f"{self.usuario.username} - {_('orden')} {self.orden_completado}"
+
+
 # ============================================
 # MODELOS DE ORTOGRAFÍA
 # ============================================
@@ -100,4 +116,50 @@ class ProgresoOrtografia(models.Model):
         verbose_name_plural = _("progresos de ortografía")
     
     def __str__(self):
-        return f"{self.usuario.username} - {self.categoria} - {self.fecha.date()}"
\ No newline at end of file
+        return f"{self.usuario.username} - {self.categoria} - {self.fecha.date()}"
+
+
+# ============================================
+# MODELOS DE RANKING
+# ============================================
+
+class RankingMaterializado(models.Model):
+    """Totales acumulados por usuario, período y juego para el ranking"""
+
+    PERIODOS = [
+        ('diario', _("Diario")),
+        ('semanal', _("Semanal")),
+        ('mensual', _("Mensual")),
+        ('total', _("Total")),
+    ]
+
+    JUEGOS = [
+        ('todos', _("Todos")),
+        ('aventura', _("Aventura")),
+        ('ortografia', _("Ortografía")),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rankings')
+    periodo = models.CharField(_("período"), max_length=10, choices=PERIODOS)
+    juego = models.CharField(_("juego"), max_length=20, choices=JUEGOS)
+    inicio_periodo = models.DateField(_("inicio del período"))
+    puntos = models.IntegerField(_("puntos"), default=0)
+    partidas = models.IntegerField(_("partidas"), default=0)
+
+    class Meta:
+        verbose_name = _("posición de ranking")
+        verbose_name_plural = _("ranking materializado")
+        unique_together = ['periodo', 'juego', 'inicio_periodo', 'usuario']
+        indexes = [
+            models.Index(
+                fields=['periodo', 'juego', 'inicio_periodo', '-puntos'],
+                name='ranking_periodo_puntos_idx',
+            ),
+            models.Index(
+                fields=['usuario', 'periodo', 'juego', '-inicio_periodo'],
+                name='ranking_usuario_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.username} - {self.periodo}/{self.juego} - {self.puntos}"
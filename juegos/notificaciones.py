@@ -0,0 +1,159 @@
+"""
+Centro de notificaciones
+
+El contador de no leídas de cada usuario vive en la caché bajo un sello de
+versión por usuario, así que el globo del menú y los sondeos periódicos
+cuestan dos lecturas de caché y no un COUNT. Crear notificaciones o
+marcarlas como leídas sube el sello al confirmar, y la próxima lectura
+recalcula con una sola consulta indexada. Un lector que contó antes de ese
+commit guarda su total bajo el sello viejo, que ya nadie lee: nunca deja un
+contador desactualizado.
+
+El listado se pagina por cursor (fecha_creacion, id) y el día de cada fila se
+calcula en SQL; las filas ya llegan ordenadas, así que agruparlas por día es
+una sola pasada. Los sondeos piden sólo lo posterior a su último cursor, y
+cada notificación nueva se empuja además por el canal SSE (juegos.push).
+"""
+
+from itertools import groupby
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import TruncDate
+
+from core.models import Notificacion
+
+from .cursores import codificar_cursor, filtro_antes, filtro_despues
+from .push import EVENTO_NOTIFICACION, publicar
+from .versiones import incrementar_version, obtener_version
+
+
+NOTIFICACIONES_POR_PAGINA = 30
+TIEMPO_CACHE_CONTADOR = 60 * 60 * 24
+
+
+def _clave_version(usuario_id):
+    return f'notificaciones:version:{usuario_id}'
+
+
+def _clave_no_leidas(usuario_id):
+    """Clave del contador bajo la versión vigente del usuario"""
+    return f'notificaciones:no_leidas:{usuario_id}:v{obtener_version(_clave_version(usuario_id))}'
+
+
+def _invalidar_contador(usuario_id):
+    """Sube la versión del contador cuando la transacción se confirma"""
+    transaction.on_commit(lambda: incrementar_version(_clave_version(usuario_id)))
+
+
+def invalidar_contadores(usuario_ids):
+    """Descarta los contadores en caché (se recalculan en la próxima lectura)"""
+    for usuario_id in usuario_ids:
+        incrementar_version(_clave_version(usuario_id))
+
+
+def contar_no_leidas(usuario_id):
+    """Notificaciones sin leer del usuario (normalmente desde la caché)"""
+    # La versión se lee antes de contar: si un commit la sube mientras tanto,
+    # este total queda bajo la clave vieja
+    clave = _clave_no_leidas(usuario_id)
+    total = cache.get(clave)
+    if total is None:
+        total = Notificacion.objects.filter(usuario_id=usuario_id, leida=False).count()
+        cache.add(clave, total, timeout=TIEMPO_CACHE_CONTADOR)
+    return total
+
+
+def crear_notificacion(usuario, titulo, mensaje, tipo='SISTEMA'):
+    """Crea una notificación e invalida el contador del usuario"""
+    notificacion = Notificacion.objects.create(usuario=usuario, titulo=titulo, mensaje=mensaje, tipo=tipo)
+    _invalidar_contador(notificacion.usuario_id)
+    _empujar(notificacion)
+    return notificacion
+
+
+def crear_notificaciones(notificaciones):
+    """bulk_create de notificaciones manteniendo los contadores"""
+    notificaciones = Notificacion.objects.bulk_create(notificaciones)
+    for usuario_id in {notificacion.usuario_id for notificacion in notificaciones}:
+        _invalidar_contador(usuario_id)
+    for notificacion in notificaciones:
+        _empujar(notificacion)
+    return notificaciones
+
+
+def marcar_leidas(usuario, notificaciones=None):
+    """Marca como leídas las notificaciones dadas (o todas) del usuario"""
+    pendientes = Notificacion.objects.filter(usuario=usuario, leida=False)
+    if notificaciones is not None:
+        ids = [n.id for n in notificaciones if not n.leida]
+        if not ids:
+            return 0
+        pendientes = pendientes.filter(id__in=ids)
+
+    marcadas = pendientes.update(leida=True)
+    if marcadas:
+        _invalidar_contador(usuario.id)
+    return marcadas
+
+
+def serializar_notificacion(notificacion):
+    return {
+        'id': notificacion.id,
+        'titulo': notificacion.titulo,
+        'mensaje': notificacion.mensaje,
+        'tipo': notificacion.tipo,
+        'leida': notificacion.leida,
+        'fecha': notificacion.fecha_creacion.isoformat(),
+    }
+
+
+def _cursor(notificacion):
+    return codificar_cursor(notificacion.fecha_creacion, notificacion.id)
+
+
+def evento_notificacion(notificacion):
+    """Evento del canal en vivo para una notificación (su id es el cursor)"""
+    return {
+        'id': _cursor(notificacion) if notificacion.id else None,
+        'tipo': EVENTO_NOTIFICACION,
+        'datos': serializar_notificacion(notificacion),
+    }
+
+
+def _empujar(notificacion):
+    evento = evento_notificacion(notificacion)
+    publicar(notificacion.usuario_id, evento['tipo'], evento['datos'], evento['id'])
+
+
+def pagina_notificaciones(usuario, antes=None, limite=NOTIFICACIONES_POR_PAGINA):
+    """Página de notificaciones agrupadas por día, la más reciente primero
+
+    Devuelve ({día: [notificaciones]}, cursor de la página siguiente o None).
+    """
+    notificaciones = Notificacion.objects.filter(usuario=usuario).annotate(dia=TruncDate('fecha_creacion'))
+    if antes:
+        notificaciones = notificaciones.filter(filtro_antes('fecha_creacion', antes))
+
+    pagina = list(notificaciones.order_by('-fecha_creacion', '-id')[:limite + 1])
+    hay_mas = len(pagina) > limite
+    pagina = pagina[:limite]
+
+    agrupadas = {dia: list(filas) for dia, filas in groupby(pagina, key=lambda n: n.dia)}
+    return agrupadas, _cursor(pagina[-1]) if hay_mas else None
+
+
+def notificaciones_desde(usuario, cursor, limite=NOTIFICACIONES_POR_PAGINA):
+    """Notificaciones posteriores al cursor, en orden cronológico, y el nuevo cursor"""
+    nuevas = list(
+        Notificacion.objects.filter(usuario=usuario)
+        .filter(filtro_despues('fecha_creacion', cursor))
+        .order_by('fecha_creacion', 'id')[:limite]
+    )
+    return nuevas, _cursor(nuevas[-1]) if nuevas else cursor
+
+
+def cursor_mas_reciente(usuario):
+    """Cursor de la última notificación del usuario (None si no tiene)"""
+    ultima = Notificacion.objects.filter(usuario=usuario).order_by('-fecha_creacion', '-id').first()
+    return _cursor(ultima) if ultima else None
@@ -0,0 +1,546 @@
+"""
+Guardado de partidas, directo o diferido
+
+Cada partida terminada es un evento (aventura u ortografía) que se aplica con
+`aplicar_lote`: progreso, libro de puntos, perfil, ranking, frontera de la
+aventura y logros. En modo directo el lote es la propia partida.
+
+Con JUEGOS_ESCRITURA_DIFERIDA = True las partidas se encolan en memoria y se
+anotan en un archivo local (spool) antes de responder. Un hilo las vacía cada
+JUEGOS_ESCRITURA_DIFERIDA_MS milisegundos en un único lote: bulk_create de
+las filas nuevas, bulk_update del progreso de aventura y una sola suma de
+puntos y ranking por usuario. Así las horas pico hacen unas pocas
+transacciones en lugar de varias escrituras por respuesta.
+
+Antes de mostrar datos de un usuario con partidas pendientes se vacía la cola
+(`asegurar_escrito`), de modo que cada alumno siempre ve lo que acaba de
+jugar. La cola es de cada proceso: esa garantía sólo vale si la lectura cae
+en el mismo proceso que guardó la partida; otro proceso puede mostrarla con
+hasta JUEGOS_ESCRITURA_DIFERIDA_MS de atraso.
+
+Los archivos llevan el PID y el momento de arranque del proceso (de /proc;
+sin /proc, un uuid), así un proceso nuevo que reciba el PID de uno caído no
+confunde sus archivos con los propios. Si el proceso muere, `recuperar_spool`
+(al crear la cola, antes de abrir un archivo nuevo, o con el comando
+vaciar_partidas) aplica lo que quedó en los archivos. Cada archivo se
+reclama antes renombrándolo (os.replace es atómico), así dos procesos que
+arrancan a la vez no aplican el mismo. Un corte justo entre el commit
+de un lote y el borrado de su archivo podría aplicarlo dos veces; el archivo
+se borra inmediatamente después del commit para que esa ventana sea mínima.
+
+Una partida que no se puede aplicar (p. ej. "database is locked") no se
+pierde: vuelve a la cola y a su spool antes de borrar el archivo del lote, y
+se reintenta en el siguiente vaciado. Tras MAX_INTENTOS se aparta en
+descartadas-*.jsonl, que ya no se recupera solo, para revisarla a mano.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core.models import Perfil, PuntuacionDiaria
+from .aventura import avanzar_frontera
+from .logros import EVENTO_AVENTURA, EVENTO_ORTOGRAFIA, publicar_evento
+from . import catalogo
+from .models import ProgresoAventura, ProgresoOrtografia
+from .puntos import sumar_puntos
+from .ranking import actualizar_ranking
+
+logger = logging.getLogger(__name__)
+
+
+PARTIDA_AVENTURA = 'aventura'
+PARTIDA_ORTOGRAFIA = 'ortografia'
+INTERVALO_MS = 200
+# Vaciados que puede fallar una partida antes de apartarla en descartadas-*.jsonl
+MAX_INTENTOS = 20
+
+
+def partida_aventura(usuario_id, nivel_id, puntuacion, tiempo, completado, momento=None):
+    """Evento de un nivel de aventura jugado (tiempo en segundos)"""
+    return {
+        'tipo': PARTIDA_AVENTURA,
+        'usuario_id': usuario_id,
+        'nivel_id': nivel_id,
+        'puntuacion': puntuacion,
+        'tiempo': tiempo,
+        'completado': completado,
+        'momento': (momento or timezone.now()).isoformat(),
+    }
+
+
+def partida_ortografia(usuario_id, categoria, aciertos, errores, tiempo, momento=None):
+    """Evento de una partida de ortografía (tiempo en segundos)"""
+    return {
+        'tipo': PARTIDA_ORTOGRAFIA,
+        'usuario_id': usuario_id,
+        'categoria': categoria,
+        'aciertos': aciertos,
+        'errores': errores,
+        'tiempo': tiempo,
+        'momento': (momento or timezone.now()).isoformat(),
+    }
+
+
+def puntos_partida(evento):
+    """Puntos que suma una partida (aventura sólo si se completó)"""
+    if evento['tipo'] == PARTIDA_AVENTURA:
+        return evento['puntuacion'] if evento['completado'] else 0
+    # 10 por acierto, -5 por error
+    return max(0, evento['aciertos'] * 10 - evento['errores'] * 5)
+
+
+def _suma_puntos(evento):
+    return evento['tipo'] == PARTIDA_ORTOGRAFIA or evento['completado']
+
+
+# ============================================
+# APLICAR UN LOTE
+# ============================================
+
+def _guardar_aventura(eventos, momentos):
+    """update_or_create en bloque; devuelve los (usuario, nivel) creados"""
+    # Como en update_or_create, gana la última partida de cada nivel
+    ultimos = {(e['usuario_id'], e['nivel_id']): e for e in eventos}
+    existentes = {
+        (p.usuario_id, p.nivel_id): p
+        for p in ProgresoAventura.objects.filter(
+            usuario_id__in={u for u, _ in ultimos},
+            nivel_id__in={n for _, n in ultimos},
+        )
+        if (p.usuario_id, p.nivel_id) in ultimos
+    }
+
+    nuevos, modificados = [], []
+    for clave, evento in ultimos.items():
+        progreso = existentes.get(clave) or ProgresoAventura(usuario_id=clave[0], nivel_id=clave[1])
+        progreso.puntuacion = evento['puntuacion']
+        progreso.tiempo_jugado = timedelta(seconds=evento['tiempo'])
+        progreso.completado = evento['completado']
+        progreso.fecha_completado = momentos[id(evento)] if evento['completado'] else None
+        (modificados if clave in existentes else nuevos).append(progreso)
+
+    ProgresoAventura.objects.bulk_update(
+        modificados, ['puntuacion', 'tiempo_jugado', 'completado', 'fecha_completado'], batch_size=500
+    )
+    ProgresoAventura.objects.bulk_create(nuevos, batch_size=500)
+    return set(ultimos) - set(existentes)
+
+
+def aplicar_lote(eventos):
+    """Aplica partidas en una transacción; devuelve {usuario_id: (puntos_totales, nivel)}"""
+    momentos = {id(e): datetime.fromisoformat(e['momento']) for e in eventos}
+    aventura = [e for e in eventos if e['tipo'] == PARTIDA_AVENTURA]
+    ortografia = [e for e in eventos if e['tipo'] == PARTIDA_ORTOGRAFIA]
+    puntuadas = [e for e in eventos if _suma_puntos(e)]
+
+    with transaction.atomic():
+        creados = _guardar_aventura(aventura, momentos) if aventura else set()
+        ProgresoOrtografia.objects.bulk_create([
+            ProgresoOrtografia(
+                usuario_id=e['usuario_id'],
+                categoria=e['categoria'],
+                aciertos=e['aciertos'],
+                errores=e['errores'],
+                tiempo_jugado=timedelta(seconds=e['tiempo']),
+                fecha=momentos[id(e)],
+            )
+            for e in ortografia
+        ], batch_size=500)
+
+        # Libro de puntos: una fila por partida
+        PuntuacionDiaria.objects.bulk_create([
+            PuntuacionDiaria(
+                usuario_id=e['usuario_id'],
+                puntos=puntos_partida(e),
+                tipo_juego=e['tipo'].upper(),
+                fecha=timezone.localdate(momentos[id(e)]),
+            )
+            for e in puntuadas
+        ], batch_size=500)
+
+        # Perfil y ranking: una suma por usuario (y por juego y día)
+        por_usuario = Counter()
+        por_dia = defaultdict(lambda: [0, 0])
+        for e in puntuadas:
+            por_usuario[e['usuario_id']] += puntos_partida(e)
+            dia = por_dia[(e['usuario_id'], e['tipo'].upper(), timezone.localdate(momentos[id(e)]))]
+            dia[0] += puntos_partida(e)
+            dia[1] += 1
+        totales = {usuario_id: sumar_puntos(usuario_id, puntos) for usuario_id, puntos in por_usuario.items()}
+        for (usuario_id, tipo_juego, fecha), (puntos, cantidad) in por_dia.items():
+            actualizar_ranking(User(id=usuario_id), puntos, tipo_juego, fecha, partidas=cantidad)
+
+        # Frontera de la aventura, en el orden en que se jugó
+        completados = [e for e in aventura if e['completado']]
+        niveles = catalogo.niveles().por_id
+        for e in completados:
+            avanzar_frontera(User(id=e['usuario_id']), niveles[e['nivel_id']])
+
+        # Logros: un evento por usuario y juego con los cambios acumulados
+        for usuario_id, grupo in itertools.groupby(
+            sorted(completados, key=lambda e: e['usuario_id']), key=lambda e: e['usuario_id']
+        ):
+            grupo = list(grupo)
+            # Si algún nivel ya existía no sabemos si es nuevo: se recalculan
+            niveles_jugados = {e['nivel_id'] for e in grupo}
+            todos_nuevos = all((usuario_id, nivel_id) in creados for nivel_id in niveles_jugados)
+            publicar_evento(
+                User(id=usuario_id), EVENTO_AVENTURA,
+                puntos_totales=sum(puntos_partida(e) for e in grupo),
+                niveles_completados=len(niveles_jugados) if todos_nuevos else None,
+            )
+        for usuario_id, grupo in itertools.groupby(
+            sorted(ortografia, key=lambda e: e['usuario_id']), key=lambda e: e['usuario_id']
+        ):
+            grupo = list(grupo)
+            publicar_evento(
+                User(id=usuario_id), EVENTO_ORTOGRAFIA,
+                puntos_totales=sum(puntos_partida(e) for e in grupo),
+                aciertos_ortografia=sum(e['aciertos'] for e in grupo),
+            )
+
+    return totales
+
+
+# ============================================
+# ESCRITURA DIFERIDA
+# ============================================
+
+def escritura_diferida_activa():
+    return getattr(settings, 'JUEGOS_ESCRITURA_DIFERIDA', False)
+
+
+def directorio_spool():
+    return Path(getattr(settings, 'JUEGOS_DIRECTORIO_SPOOL', Path(settings.BASE_DIR) / 'spool'))
+
+
+class ColaPartidas:
+    """Partidas pendientes de este proceso con su copia en el spool"""
+
+    def __init__(self, directorio):
+        self.directorio = Path(directorio)
+        self.pendientes = []
+        self.por_usuario = Counter()
+        self.lotes = []
+        self._archivo = None
+        self._secuencia = itertools.count()
+        self._lock = threading.Lock()
+        # Un solo vaciado a la vez; quien lee espera a que termine el que está en curso
+        self.lock_vaciado = threading.Lock()
+
+    @property
+    def ruta_spool(self):
+        return self.directorio / f'partidas-{marca_proceso()}.jsonl'
+
+    def _encolar(self, eventos):
+        """Anota los eventos en el spool y los deja pendientes (con el lock tomado)"""
+        if self._archivo is None:
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            self._archivo = open(self.ruta_spool, 'a', encoding='utf-8')
+        self._archivo.writelines(json.dumps(e, separators=(',', ':')) + '\n' for e in eventos)
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self.pendientes.extend(eventos)
+        self.por_usuario.update(e['usuario_id'] for e in eventos)
+
+    def agregar(self, evento):
+        with self._lock:
+            self._encolar([evento])
+
+    def devolver(self, eventos):
+        """Vuelve a encolar partidas que no se pudieron aplicar"""
+        if eventos:
+            with self._lock:
+                self._encolar(eventos)
+
+    def tomar(self):
+        """Saca las partidas pendientes y cierra su archivo para aplicarlas"""
+        with self._lock:
+            lote, self.pendientes = self.pendientes, []
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+                destino = self.ruta_spool.with_name(f'partidas-{marca_proceso()}-{next(self._secuencia)}.lote')
+                os.replace(self.ruta_spool, destino)
+                self.lotes.append(destino)
+            return lote
+
+    def confirmar(self, lote, fallidas=()):
+        """Borra los archivos ya aplicados y descuenta las partidas
+
+        Las `fallidas` se anotan antes en el spool actual y siguen pendientes.
+        """
+        with self._lock:
+            if fallidas:
+                self._encolar(fallidas)
+            for ruta in self.lotes:
+                ruta.unlink(missing_ok=True)
+            self.lotes = []
+            self.por_usuario.subtract(e['usuario_id'] for e in lote)
+            self.por_usuario += Counter()
+
+    def pendientes_de(self, usuario_id):
+        with self._lock:
+            return self.por_usuario[usuario_id]
+
+    def puntos_pendientes(self, usuario_id):
+        with self._lock:
+            return sum(
+                puntos_partida(e) for e in self.pendientes
+                if e['usuario_id'] == usuario_id and _suma_puntos(e)
+            )
+
+
+_cola = None
+_lock_cola = threading.Lock()
+_hilo = None
+_despertar = threading.Event()
+
+
+def obtener_cola():
+    global _cola
+    with _lock_cola:
+        if _cola is None:
+            # Lo que dejaron procesos caídos se aplica antes de abrir el archivo
+            # propio; lo que falle queda en esta cola
+            cola = ColaPartidas(directorio_spool())
+            recuperar_spool(cola=cola)
+            _cola = cola
+            atexit.register(vaciar)
+        return _cola
+
+
+def _aplicar_con_reintento(lote, directorio):
+    """Aplica el lote; si falla, partida por partida
+
+    Devuelve (totales, fallidas): las partidas que no se aplicaron y aún
+    tienen intentos; las que los agotan se apartan en `directorio`.
+    """
+    try:
+        return aplicar_lote(lote), []
+    except Exception:
+        logger.exception('Error al aplicar un lote de %s partidas; se reintenta una a una', len(lote))
+
+    totales = {}
+    fallidas = []
+    for evento in lote:
+        try:
+            totales.update(aplicar_lote([evento]))
+        except Exception:
+            logger.exception('No se pudo aplicar la partida; se reintentará: %s', evento)
+            fallidas.append(evento)
+    return totales, _apartar_agotadas(fallidas, directorio)
+
+
+def _apartar_agotadas(fallidas, directorio):
+    """Cuenta un intento más; las que llegan a MAX_INTENTOS van a descartadas-*.jsonl"""
+    reintentar, agotadas = [], []
+    for evento in fallidas:
+        evento['intentos'] = evento.get('intentos', 0) + 1
+        (agotadas if evento['intentos'] >= MAX_INTENTOS else reintentar).append(evento)
+
+    if agotadas:
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        with open(directorio / f'descartadas-{marca_proceso()}.jsonl', 'a', encoding='utf-8') as archivo:
+            archivo.writelines(json.dumps(e, separators=(',', ':')) + '\n' for e in agotadas)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        logger.error('%s partidas apartadas tras %s intentos en %s', len(agotadas), MAX_INTENTOS, directorio)
+    return reintentar
+
+
+def vaciar():
+    """Aplica ahora todas las partidas pendientes de este proceso"""
+    if _cola is None:
+        return {}
+    with _cola.lock_vaciado:
+        lote = _cola.tomar()
+        if not lote:
+            return {}
+        totales, fallidas = _aplicar_con_reintento(lote, _cola.directorio)
+        _cola.confirmar(lote, fallidas)
+        return totales
+
+
+def asegurar_escrito(usuario_id):
+    """Vacía la cola si el usuario tiene partidas pendientes (lectura tras escritura)
+
+    Sólo ve las partidas pendientes de este proceso.
+    """
+    if _cola is not None and _cola.pendientes_de(usuario_id):
+        vaciar()
+
+
+def _vaciar_periodicamente(intervalo):
+    while True:
+        _despertar.wait(intervalo)
+        _despertar.clear()
+        try:
+            close_old_connections()
+            vaciar()
+        except Exception:
+            logger.exception('Error al vaciar las partidas pendientes')
+
+
+def _iniciar_hilo():
+    global _hilo
+    intervalo = getattr(settings, 'JUEGOS_ESCRITURA_DIFERIDA_MS', INTERVALO_MS)
+    if not intervalo:
+        # Sin vaciado automático: sólo al leer o con vaciar()
+        return
+    with _lock_cola:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(
+                target=_vaciar_periodicamente, args=(intervalo / 1000,), name='partidas', daemon=True
+            )
+            _hilo.start()
+
+
+def guardar_partida(evento):
+    """Guarda una partida; devuelve (puntos_totales, nivel) del usuario
+
+    En modo diferido los totales incluyen las partidas aún pendientes.
+    """
+    if not escritura_diferida_activa():
+        totales = aplicar_lote([evento])
+        if evento['usuario_id'] in totales:
+            return totales[evento['usuario_id']]
+        return _totales_perfil(evento['usuario_id'])
+
+    cola = obtener_cola()
+    cola.agregar(evento)
+    _iniciar_hilo()
+    puntos, nivel = _totales_perfil(evento['usuario_id'])
+    return puntos + cola.puntos_pendientes(evento['usuario_id']), nivel
+
+
+def _totales_perfil(usuario_id):
+    return Perfil.objects.filter(usuario_id=usuario_id).values_list(
+        'puntos_totales', 'nivel_maestria'
+    ).first() or (0, 1)
+
+
+def recuperar_spool(directorio=None, cola=None):
+    """Aplica las partidas que dejaron en el spool procesos que ya no existen
+
+    Las que fallan pasan a `cola` si se da; si no, se quedan en el archivo
+    reclamado, que se retoma cuando termine este proceso.
+    """
+    directorio = Path(directorio or directorio_spool())
+    if not directorio.is_dir():
+        return 0
+
+    recuperadas = 0
+    propia = marca_proceso()
+    # También los que reclamó otro recuperador que murió a mitad de camino
+    for ruta in sorted([*directorio.glob('partidas-*'), *directorio.glob('recuperando-*')]):
+        pid, inicio = _dueno(ruta)
+        if f'{pid}-{inicio}' == propia or _dueno_vivo(pid, inicio):
+            continue
+        ruta = _reclamar(ruta)
+        if ruta is None:
+            continue
+        with open(ruta, encoding='utf-8') as archivo:
+            # Una última línea cortada por la caída del proceso se ignora
+            eventos = []
+            for linea in archivo:
+                try:
+                    eventos.append(json.loads(linea))
+                except ValueError:
+                    logger.warning('Línea inválida en %s', ruta)
+        fallidas = _aplicar_con_reintento(eventos, directorio)[1] if eventos else []
+        if fallidas and cola is None:
+            _reescribir(ruta, fallidas)
+        else:
+            if fallidas:
+                cola.devolver(fallidas)
+            ruta.unlink(missing_ok=True)
+        recuperadas += len(eventos) - len(fallidas)
+    return recuperadas
+
+
+def _reescribir(ruta, eventos):
+    """Deja en el archivo sólo `eventos`, reemplazándolo de una vez"""
+    # El temporal no coincide con los patrones que se recuperan
+    temporal = ruta.with_name(f'.{ruta.name}.tmp')
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        archivo.writelines(json.dumps(e, separators=(',', ':')) + '\n' for e in eventos)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def _reclamar(ruta):
+    """Renombra el archivo a nombre de este proceso; None si otro lo reclamó antes"""
+    original = ruta.name.split('-', 3)[3] if ruta.name.startswith('recuperando-') else ruta.name
+    destino = ruta.with_name(f'recuperando-{marca_proceso()}-{original}')
+    try:
+        os.replace(ruta, destino)
+    except FileNotFoundError:
+        return None
+    return destino
+
+
+# ============================================
+# DUEÑOS DE LOS ARCHIVOS
+# ============================================
+
+_marcas = {}
+
+
+def _inicio_proceso(pid):
+    """Momento de arranque del proceso según el sistema, o None si no se sabe (sin /proc)"""
+    try:
+        with open(f'/proc/{pid}/stat', encoding='ascii') as archivo:
+            # El campo 22 (starttime); el nombre entre paréntesis puede tener espacios
+            return archivo.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def marca_proceso():
+    """'{pid}-{arranque}': distingue a este proceso de otro que reciba luego el mismo PID"""
+    pid = os.getpid()
+    # Por PID: un worker creado con fork no hereda la marca de su padre
+    if pid not in _marcas:
+        _marcas[pid] = f'{pid}-{_inicio_proceso(pid) or uuid.uuid4().hex}'
+    return _marcas[pid]
+
+
+def _dueno(ruta):
+    """(pid, arranque) del proceso que escribió o reclamó el archivo"""
+    partes = ruta.name.split('-')
+    inicio = partes[2].split('.')[0] if len(partes) > 2 else None
+    return int(partes[1].split('.')[0]), inicio
+
+
+def _dueno_vivo(pid, inicio):
+    if not _proceso_vivo(pid):
+        return False
+    actual = _inicio_proceso(pid)
+    # Sin /proc no se distingue un PID reutilizado: se da por vivo
+    return actual is None or actual == inicio
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,66 @@
+"""
+Usuario con su perfil precargado
+
+Carga User, Perfil e Inventario con una sola consulta (select_related) y
+guarda el resultado en la caché bajo el id del usuario y su versión. La
+versión sube al guardar cualquiera de los tres (ver signals) o al sumar
+puntos con UPDATE, así que una petición con la caché caliente no hace
+ninguna consulta.
+
+Un cambio de contraseña o de is_active tiene que pasar por save() (como
+hacen set_password, el admin y los formularios de auth) para que la sesión
+lo vea: un UPDATE directo sobre auth_user no sube la versión.
+
+Esa versión sólo llega a otros procesos con una caché compartida; con
+LocMemCache el usuario no se guarda en la caché y cada petición hace la
+consulta con select_related.
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from .versiones import cache_compartida, incrementar_version, obtener_version
+
+
+CLAVE_VERSION_GLOBAL = 'perfil:version'
+TIEMPO_CACHE_USUARIO = 60 * 60
+
+
+def _clave_version(usuario_id):
+    return f'perfil:version:{usuario_id}'
+
+
+def _clave_usuario(usuario_id):
+    return (
+        f'perfil:usuario:{usuario_id}'
+        f':v{obtener_version(CLAVE_VERSION_GLOBAL)}.{obtener_version(_clave_version(usuario_id))}'
+    )
+
+
+def invalidar_perfil(usuario_id):
+    """Descarta el usuario en caché cuando se confirme la transacción actual"""
+    transaction.on_commit(lambda: incrementar_version(_clave_version(usuario_id)))
+
+
+def invalidar_perfiles():
+    """Descarta todos los usuarios en caché (tras cambios masivos)"""
+    transaction.on_commit(lambda: incrementar_version(CLAVE_VERSION_GLOBAL))
+
+
+def cargar_usuario(usuario_id):
+    """User con perfil_core e inventario_core ya cargados, o None si no existe
+
+    Si el usuario no tiene perfil o inventario, select_related lo deja anotado
+    y acceder a la relación falla sin otra consulta.
+    """
+    clave = _clave_usuario(usuario_id) if cache_compartida() else None
+    usuario = cache.get(clave) if clave else None
+
+    if usuario is None:
+        usuario = User.objects.select_related('perfil_core', 'inventario_core').filter(pk=usuario_id).first()
+        if usuario is None:
+            return None
+        if clave:
+            cache.set(clave, usuario, timeout=TIEMPO_CACHE_USUARIO)
+    return usuario
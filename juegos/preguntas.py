@@ -0,0 +1,195 @@
+"""
+Banco de preguntas de ortografía
+
+Guarda en memoria los ids de PreguntaOrtografia agrupados por categoría y
+dificultad en arreglos compactos. Elegir k preguntas al azar cuesta O(k) y
+se traen con un solo in_bulk, en lugar de ordenar la tabla entera con
+order_by('?'). Un sello de versión en la
+caché (que suben las señales del admin al confirmar) avisa a cada proceso de
+que debe recargar el banco.
+
+Las preguntas también se sirven ya serializadas: paquetes JSON por categoría
+de ortografía guardados en la caché bajo su número de versión, con un ETag para las peticiones condicionales. La práctica
+general une fragmentos JSON de cada pregunta; los de las preguntas usadas
+hace poco quedan en memoria (hasta MAX_FRAGMENTOS) y sólo los que faltan se
+piden a la BD.
+"""
+
+import hashlib
+import json
+import random
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import PreguntaOrtografia
+from .versiones import incrementar_version, obtener_version
+
+
+CLAVE_VERSION = 'preguntas:version'
+# Los paquetes de versiones viejas dejan de pedirse y expiran solos
+TIEMPO_CACHE_PAQUETES = 60 * 60 * 24
+# Fragmentos JSON de preguntas que guarda cada proceso
+MAX_FRAGMENTOS = 2000
+
+
+class BancoPreguntas:
+    """Ids de preguntas agrupados para muestrear sin reemplazo"""
+
+    def __init__(self, filas, version=0):
+        self.version = version
+        self.todas = array('q')
+        self.por_categoria = {}
+        self.por_clave = {}
+
+        for pregunta_id, categoria, dificultad in filas:
+            self.todas.append(pregunta_id)
+            self.por_categoria.setdefault(categoria, array('q')).append(pregunta_id)
+            self.por_clave.setdefault((categoria, dificultad), array('q')).append(pregunta_id)
+
+    def __len__(self):
+        return len(self.todas)
+
+    def ids(self, categoria=None, dificultad=None):
+        """Arreglo de ids que cumplen el filtro"""
+        if categoria is None and dificultad is None:
+            return self.todas
+        if dificultad is None:
+            return self.por_categoria.get(categoria, array('q'))
+        if categoria is None:
+            return array('q', (
+                pregunta_id
+                for (_, dif), ids in self.por_clave.items() if dif == dificultad
+                for pregunta_id in ids
+            ))
+        return self.por_clave.get((categoria, dificultad), array('q'))
+
+    def muestrear(self, cantidad, categoria=None, dificultad=None, rng=random):
+        """Hasta `cantidad` ids distintos elegidos al azar"""
+        ids = self.ids(categoria, dificultad)
+        return rng.sample(ids, min(cantidad, len(ids)))
+
+
+_banco = None
+_lock = threading.Lock()
+
+
+def invalidar_banco():
+    """Avisa a todos los procesos de que el banco cambió (se llama desde el admin)
+
+    La versión sube al confirmar: antes, alguien podría guardar en la caché
+    compartida un paquete con filas que luego se deshacen.
+    """
+    transaction.on_commit(lambda: incrementar_version(CLAVE_VERSION))
+
+
+def obtener_banco():
+    """Banco vigente de este proceso, recargado si la versión cambió"""
+    global _banco
+    version = obtener_version(CLAVE_VERSION)
+
+    with _lock:
+        if _banco is None or _banco.version != version:
+            _banco = BancoPreguntas(
+                PreguntaOrtografia.objects.order_by('id').values_list('id', 'categoria', 'dificultad'),
+                version=version,
+            )
+        return _banco
+
+
+# ============================================
+# PAQUETES PRE-SERIALIZADOS
+# ============================================
+
+class PaquetePreguntas:
+    """Preguntas listas para insertar en la página como JSON"""
+
+    def __init__(self, contenido, total, etag=None):
+        self.contenido = contenido
+        self.total = total
+        self.etag = etag
+
+    @classmethod
+    def desde_fragmentos(cls, fragmentos):
+        """Une fragmentos JSON (bytes) de preguntas en una lista"""
+        contenido = b'[' + b','.join(fragmentos) + b']'
+        return cls(contenido, len(fragmentos), f'"{hashlib.sha1(contenido).hexdigest()}"')
+
+    @property
+    def texto(self):
+        return self.contenido.decode('utf-8')
+
+
+def _fragmento(datos):
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def serializar_pregunta_ortografia(p):
+    return {
+        'id': p.id,
+        'palabra': p.palabra,
+        'opciones': p.opciones,
+        'correcta': p.palabra_correcta,
+        'categoria': p.categoria,
+        'dificultad': p.dificultad,
+    }
+
+
+def paquete_ortografia(categoria):
+    """Preguntas de una categoría de ortografía, desde la caché si la versión no cambió"""
+    clave = f'preguntas:paquete:ortografia:{categoria}:v{obtener_version(CLAVE_VERSION)}'
+    paquete = cache.get(clave)
+    if paquete is None:
+        paquete = PaquetePreguntas.desde_fragmentos([
+            _fragmento(serializar_pregunta_ortografia(p))
+            for p in PreguntaOrtografia.objects.filter(categoria=categoria).order_by('id')
+        ])
+        cache.set(clave, paquete, timeout=TIEMPO_CACHE_PAQUETES)
+    return paquete
+
+
+# Fragmentos JSON recientes de este proceso, del más viejo al más nuevo
+_fragmentos = (None, OrderedDict())
+
+
+def _obtener_fragmentos(ids, version):
+    """{id: fragmento} de las preguntas pedidas; las que faltan, con un solo in_bulk"""
+    global _fragmentos
+    with _lock:
+        if _fragmentos[0] != version:
+            _fragmentos = (version, OrderedDict())
+        guardados = _fragmentos[1]
+        encontrados = {}
+        for pregunta_id in ids:
+            if pregunta_id in guardados:
+                guardados.move_to_end(pregunta_id)
+                encontrados[pregunta_id] = guardados[pregunta_id]
+    faltan = [pregunta_id for pregunta_id in ids if pregunta_id not in encontrados]
+    if not faltan:
+        return encontrados
+
+    nuevos = {
+        pregunta_id: _fragmento(serializar_pregunta_ortografia(p))
+        for pregunta_id, p in PreguntaOrtografia.objects.in_bulk(faltan).items()
+    }
+    encontrados.update(nuevos)
+    with _lock:
+        if _fragmentos[0] == version:
+            guardados = _fragmentos[1]
+            guardados.update(nuevos)
+            while len(guardados) > MAX_FRAGMENTOS:
+                guardados.popitem(last=False)
+    return encontrados
+
+
+def paquete_practica(cantidad=20, categoria=None, dificultad=None):
+    """Práctica al azar: ids del banco y un solo in_bulk para los fragmentos que falten"""
+    banco = obtener_banco()
+    ids = banco.muestrear(cantidad, categoria, dificultad)
+    fragmentos = _obtener_fragmentos(ids, banco.version)
+    return PaquetePreguntas.desde_fragmentos(
+        [fragmentos[pregunta_id] for pregunta_id in ids if pregunta_id in fragmentos]
+    )
@@ -0,0 +1,63 @@
+"""
+Libro de puntos de los usuarios
+
+Cada partida se anota en PuntuacionDiaria (sólo se insertan filas, nunca se
+modifican; lo hace juegos.partidas) y se suma al perfil con un único UPDATE:
+
+    puntos_totales = puntos_totales + %s, nivel_maestria = ...
+
+sin leer la fila antes, así dos partidas simultáneas no se pisan y sólo se
+escriben las dos columnas afectadas. El nivel se recalcula en la misma
+sentencia a partir de los puntos nuevos y nunca baja. Si algo se
+desincroniza, `recalcular_puntos` rehace los totales desde el libro.
+"""
+
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from core.models import Perfil, PuntuacionDiaria
+from .perfiles import invalidar_perfil, invalidar_perfiles
+
+
+PUNTOS_POR_NIVEL = 1000
+
+
+def _nivel_para(puntos):
+    """Expresión SQL del nivel para una expresión de puntos"""
+    return Greatest(F('nivel_maestria'), puntos / Value(PUNTOS_POR_NIVEL) + 1)
+
+
+def sumar_puntos(usuario_id, puntos):
+    """Suma puntos al perfil en un solo UPDATE; devuelve (puntos_totales, nivel_maestria)"""
+    perfiles = Perfil.objects.filter(usuario_id=usuario_id)
+    cambios = {
+        'puntos_totales': F('puntos_totales') + puntos,
+        'nivel_maestria': _nivel_para(F('puntos_totales') + puntos),
+    }
+
+    with transaction.atomic():
+        if not perfiles.update(**cambios):
+            Perfil.objects.get_or_create(usuario_id=usuario_id)
+            perfiles.update(**cambios)
+        invalidar_perfil(usuario_id)
+        return perfiles.values_list('puntos_totales', 'nivel_maestria').get()
+
+
+def recalcular_puntos(usuarios=None):
+    """Rehace puntos_totales (y sube niveles) desde el libro
+
+    Con `usuarios` (un queryset de User) sólo toca sus perfiles; si no, todos.
+    """
+    total_libro = Coalesce(
+        Subquery(
+            PuntuacionDiaria.objects.filter(usuario_id=OuterRef('usuario_id'))
+            .order_by().values('usuario_id').annotate(total=Sum('puntos')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+    perfiles = Perfil.objects.all() if usuarios is None else Perfil.objects.filter(usuario__in=usuarios)
+    total = perfiles.update(puntos_totales=total_libro, nivel_maestria=_nivel_para(total_libro))
+    invalidar_perfiles()
+    return total
@@ -0,0 +1,142 @@
+"""
+Canal de eventos en vivo (Server-Sent Events)
+
+Reparte en este proceso las notificaciones y mensajes nuevos a los clientes
+conectados, en lugar de que cada navegador pregunte cada pocos segundos.
+Las vistas (síncronas) y el worker de logros publican con `publicar` al
+confirmarse la transacción; cada conexión SSE tiene su cola asyncio en el
+event loop del servidor ASGI y recibe los eventos con call_soon_threadsafe.
+
+El reparto es en memoria: con varios procesos cada uno sólo ve lo que
+publican sus propias peticiones. Los clientes se recuperan igual al
+reconectar con Last-Event-ID (el cursor de la última notificación), porque
+lo perdido se reenvía desde la tabla.
+"""
+
+import asyncio
+import json
+import threading
+
+from django.db import transaction
+
+
+EVENTO_NOTIFICACION = 'notificacion'
+EVENTO_MENSAJE = 'mensaje'
+
+# Eventos pendientes por conexión antes de cortarla para que se resincronice
+TAMANO_COLA = 100
+# Comentario SSE periódico para que proxies y navegador no corten la conexión
+INTERVALO_LATIDO = 15
+# Las conexiones se renuevan solas; así una desconexión que el servidor no
+# detecta no deja la suscripción viva para siempre
+DURACION_MAXIMA = 5 * 60
+REINTENTO_MS = 3000
+
+
+class Suscripcion:
+    """Cola de eventos de una conexión, atada al event loop que la creó"""
+
+    def __init__(self, usuario_id, loop):
+        self.usuario_id = usuario_id
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=TAMANO_COLA)
+        self.desbordada = False
+
+    def _entregar(self, evento):
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordada = True
+
+    async def siguiente(self, timeout):
+        """Próximo evento, o None si pasa `timeout` sin eventos"""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class CanalEventos:
+    """Suscripciones por usuario de este proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones = {}
+
+    def suscribir(self, usuario_id):
+        """Nueva suscripción en el event loop actual"""
+        suscripcion = Suscripcion(usuario_id, asyncio.get_running_loop())
+        with self._lock:
+            self._suscripciones.setdefault(usuario_id, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.usuario_id)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._suscripciones[suscripcion.usuario_id]
+
+    def conectados(self, usuario_id):
+        with self._lock:
+            return len(self._suscripciones.get(usuario_id, ()))
+
+    def publicar(self, usuario_id, evento):
+        """Entrega el evento a cada conexión del usuario (seguro desde cualquier hilo)"""
+        with self._lock:
+            suscripciones = list(self._suscripciones.get(usuario_id, ()))
+
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._entregar, evento)
+            except RuntimeError:
+                # El loop de esa conexión ya se cerró
+                self.cancelar(suscripcion)
+
+
+canal = CanalEventos()
+
+
+def publicar(usuario_id, tipo, datos, evento_id=None):
+    """Publica un evento cuando la transacción actual se confirma"""
+    evento = {'id': evento_id, 'tipo': tipo, 'datos': datos}
+    transaction.on_commit(lambda: canal.publicar(usuario_id, evento))
+
+
+def formatear_sse(tipo, datos, evento_id=None):
+    """Bloque de texto de un evento SSE"""
+    lineas = []
+    if evento_id:
+        lineas.append(f'id: {evento_id}')
+    lineas.append(f'event: {tipo}')
+    lineas.append(f'data: {json.dumps(datos, ensure_ascii=False, separators=(",", ":"))}')
+    return '\n'.join(lineas) + '\n\n'
+
+
+async def flujo_eventos(suscripcion, pendientes=(), duracion=DURACION_MAXIMA, latido=INTERVALO_LATIDO):
+    """Generador asíncrono del cuerpo SSE de una conexión
+
+    Primero envía los eventos `pendientes` (lo perdido desde Last-Event-ID) y
+    luego los publicados mientras dure la conexión. Cancela la suscripción al
+    terminar.
+    """
+    loop = asyncio.get_running_loop()
+    enviados = {evento['id'] for evento in pendientes if evento['id']}
+    try:
+        yield f'retry: {REINTENTO_MS}\n\n'
+        for evento in pendientes:
+            yield formatear_sse(evento['tipo'], evento['datos'], evento['id'])
+
+        fin = loop.time() + duracion
+        while (restante := fin - loop.time()) > 0:
+            evento = await suscripcion.siguiente(min(latido, restante))
+            if suscripcion.desbordada:
+                # El cliente reconecta con Last-Event-ID y recupera lo perdido
+                return
+            if evento is None:
+                yield ': latido\n\n'
+            elif evento['id'] is None or evento['id'] not in enviados:
+                yield formatear_sse(evento['tipo'], evento['datos'], evento['id'])
+    finally:
+        canal.cancelar(suscripcion)
@@ -0,0 +1,389 @@
+"""
+Ranking materializado de la Academia
+
+Mantiene los totales por usuario, período y juego en la tabla
+RankingMaterializado. Cada partida guardada suma sus puntos de forma
+incremental, de modo que leer una página del ranking es un único recorrido
+por el índice (período, juego, inicio, -puntos).
+
+Las filas de períodos pasados se conservan, así que la tabla es también el
+resumen diario, semanal y mensual de PuntuacionDiaria: los días activos y la
+racha se leen de las filas diarias (una por día) en lugar de las partidas.
+
+La posición de un usuario se cuenta en un IndicePosiciones por ranking
+(período, juego, inicio): un árbol de Fenwick sobre cubetas de ANCHO_CUBETA
+puntos, cargado desde RankingMaterializado en memoria del proceso. Contar
+cuántos tienen más puntos cuesta O(log n) en el árbol más un recorrido de la
+propia cubeta, que tiene a lo sumo ANCHO_CUBETA puntajes distintos.
+
+Cada índice guarda el sello de `versiones` con el que se cargó. Las partidas
+suben el sello de sus rankings al confirmarse; el proceso que las guardó
+aplica a su índice el total ya confirmado del usuario (se toma el máximo,
+porque los totales sólo crecen, así que aplicarlo dos veces o fuera de orden
+no cuenta de más). Cualquier otro salto de versión, de otro proceso o de
+reconstruir_ranking, hace que el índice se recargue en la siguiente
+consulta. Con LocMemCache los sellos caducan a los 30 segundos, que es lo
+que puede tardar en verse una partida guardada por otro worker.
+"""
+
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from core.models import PuntuacionDiaria
+from .models import RankingMaterializado
+from .versiones import incrementar_version, obtener_version
+
+
+# Fecha fija que identifica al período "total" (no tiene inicio real)
+INICIO_TOTAL = date(2000, 1, 1)
+
+PERIODOS = [periodo for periodo, _ in RankingMaterializado.PERIODOS]
+JUEGOS = [juego for juego, _ in RankingMaterializado.JUEGOS]
+
+
+def inicio_periodo(periodo, hoy=None):
+    """Obtiene la fecha de inicio del período al que pertenece `hoy`"""
+    hoy = hoy or timezone.now().date()
+
+    if periodo == 'diario':
+        return hoy
+    elif periodo == 'semanal':
+        return hoy - timedelta(days=hoy.weekday())
+    elif periodo == 'mensual':
+        return hoy.replace(day=1)
+    else:
+        return INICIO_TOTAL
+
+
+def normalizar_juego(juego):
+    """Convierte un tipo de juego ('AVENTURA', 'todos', ...) a su clave de ranking"""
+    juego = (juego or 'todos').lower()
+    return juego if juego in JUEGOS else 'todos'
+
+
+def actualizar_ranking(usuario, puntos, tipo_juego, fecha=None, partidas=1):
+    """Suma los puntos de una partida (o de `partidas` del mismo día) a todos los rankings afectados"""
+    fecha = fecha or timezone.now().date()
+    juegos = {'todos', normalizar_juego(tipo_juego)}
+
+    rankings = []
+    for periodo in PERIODOS:
+        inicio = inicio_periodo(periodo, fecha)
+        for juego in juegos:
+            _sumar_puntos(usuario.id, periodo, juego, inicio, puntos, partidas)
+            rankings.append((periodo, juego, inicio))
+
+    usuario_id = usuario.id
+    transaction.on_commit(lambda: _sincronizar_indices(usuario_id, rankings))
+
+
+def _sumar_puntos(usuario_id, periodo, juego, inicio, puntos, partidas=1):
+    """Upsert atómico de una fila del ranking"""
+    filtro = {
+        'usuario_id': usuario_id,
+        'periodo': periodo,
+        'juego': juego,
+        'inicio_periodo': inicio,
+    }
+    incremento = {
+        'puntos': F('puntos') + puntos,
+        'partidas': F('partidas') + partidas,
+    }
+
+    if RankingMaterializado.objects.filter(**filtro).update(**incremento):
+        return
+
+    try:
+        with transaction.atomic():
+            RankingMaterializado.objects.create(puntos=puntos, partidas=partidas, **filtro)
+    except IntegrityError:
+        # Otra petición creó la fila entre el UPDATE y el INSERT
+        RankingMaterializado.objects.filter(**filtro).update(**incremento)
+
+
+def obtener_ranking(periodo='total', juego='todos', limite=100):
+    """Devuelve las primeras filas del ranking con los datos del perfil en una consulta"""
+    return list(
+        RankingMaterializado.objects.filter(
+            periodo=periodo if periodo in PERIODOS else 'total',
+            juego=normalizar_juego(juego),
+            inicio_periodo=inicio_periodo(periodo),
+            puntos__gt=0,
+        ).order_by('-puntos', 'usuario_id').values(
+            'usuario_id',
+            'puntos',
+            'partidas',
+            username=F('usuario__username'),
+            nivel=F('usuario__perfil_core__nivel_maestria'),
+            racha=F('usuario__perfil_core__racha_actual'),
+            ultima_actividad=F('usuario__perfil_core__ultima_conexion'),
+        )[:limite]
+    )
+
+
+def reconstruir_ranking(usuarios=None):
+    """Recalcula el ranking materializado, con toda su historia, desde PuntuacionDiaria
+
+    Agrupa las partidas por (usuario, juego, día) en SQL y deriva de esos días
+    las filas semanales, mensuales y totales. Con `usuarios` (un queryset de
+    User) sólo rehace las filas de ellos.
+    """
+    acumulado = defaultdict(lambda: [0, 0])
+
+    puntuaciones = PuntuacionDiaria.objects.all()
+    existentes = RankingMaterializado.objects.all()
+    if usuarios is not None:
+        puntuaciones = puntuaciones.filter(usuario__in=usuarios)
+        existentes = existentes.filter(usuario__in=usuarios)
+
+    dias = puntuaciones.values('usuario_id', 'tipo_juego', 'fecha').annotate(
+        total_puntos=Sum('puntos'),
+        total_partidas=Count('id'),
+    ).order_by()
+    for item in dias.iterator(chunk_size=2000):
+        juegos = {'todos', normalizar_juego(item['tipo_juego'])}
+        for periodo in PERIODOS:
+            inicio = inicio_periodo(periodo, item['fecha'])
+            for juego in juegos:
+                fila = acumulado[(item['usuario_id'], periodo, juego, inicio)]
+                fila[0] += item['total_puntos'] or 0
+                fila[1] += item['total_partidas']
+
+    filas = [
+        RankingMaterializado(
+            usuario_id=usuario_id,
+            periodo=periodo,
+            juego=juego,
+            inicio_periodo=inicio,
+            puntos=puntos,
+            partidas=partidas,
+        )
+        for (usuario_id, periodo, juego, inicio), (puntos, partidas) in acumulado.items()
+    ]
+
+    with transaction.atomic():
+        existentes.delete()
+        RankingMaterializado.objects.bulk_create(filas, batch_size=1000)
+        invalidar_indices()
+
+    return len(filas)
+
+
+# ============================================
+# ACTIVIDAD DIARIA
+# ============================================
+
+def dias_activos(usuario_id):
+    """Cantidad de días con al menos una partida (una fila diaria por día)"""
+    return RankingMaterializado.objects.filter(usuario_id=usuario_id, periodo='diario', juego='todos').count()
+
+
+def ultimo_dia_activo(usuario_id):
+    """Último día con partidas del usuario, o None"""
+    return RankingMaterializado.objects.filter(
+        usuario_id=usuario_id, periodo='diario', juego='todos'
+    ).order_by('-inicio_periodo').values_list('inicio_periodo', flat=True).first()
+
+
+def ultimos_dias_activos(usuario_ids):
+    """{usuario_id: último día con partidas} de varios usuarios en una consulta"""
+    return dict(
+        RankingMaterializado.objects.filter(usuario_id__in=usuario_ids, periodo='diario', juego='todos')
+        .values('usuario_id').annotate(ultimo=Max('inicio_periodo')).values_list('usuario_id', 'ultimo')
+    )
+
+
+# ============================================
+# CONSULTA DE POSICIONES
+# ============================================
+
+# Ancho en puntos de cada cubeta del árbol de Fenwick
+ANCHO_CUBETA = 32
+
+_indices = {}
+_lock = threading.Lock()
+
+
+class IndicePosiciones:
+    """Cuántos usuarios de un ranking superan un puntaje, en O(log n)
+
+    Un árbol de Fenwick cuenta los usuarios de cada cubeta de ANCHO_CUBETA
+    puntos; dentro de la cubeta del puntaje buscado se recorren sus puntajes
+    distintos, que son a lo sumo ANCHO_CUBETA. El árbol duplica su tamaño
+    cuando un puntaje cae más allá de la última cubeta.
+    """
+
+    def __init__(self, puntos_por_usuario, version=None, ancho=ANCHO_CUBETA):
+        self.version = version
+        self.ancho = ancho
+        self.puntos = {}
+        self.cubetas = defaultdict(lambda: defaultdict(int))
+        for usuario_id, puntos in puntos_por_usuario:
+            if puntos > 0:
+                self.puntos[usuario_id] = puntos
+                self.cubetas[puntos // ancho][puntos] += 1
+        self._construir_arbol(max(self.cubetas, default=0) + 1)
+
+    def _construir_arbol(self, necesarias):
+        """Arma el árbol en O(cubetas) con al menos `necesarias` cubetas"""
+        tamano = 1
+        while tamano < necesarias:
+            tamano *= 2
+        arbol = [0] * (tamano + 1)
+        for cubeta, puntajes in self.cubetas.items():
+            arbol[cubeta + 1] += sum(puntajes.values())
+        for i in range(1, tamano + 1):
+            padre = i + (i & -i)
+            if padre <= tamano:
+                arbol[padre] += arbol[i]
+        self.arbol = arbol
+
+    def _sumar(self, cubeta, delta):
+        i = cubeta + 1
+        while i < len(self.arbol):
+            self.arbol[i] += delta
+            i += i & -i
+
+    def _hasta(self, cubeta):
+        """Usuarios en las cubetas 0..cubeta"""
+        total = 0
+        i = min(cubeta + 1, len(self.arbol) - 1)
+        while i > 0:
+            total += self.arbol[i]
+            i -= i & -i
+        return total
+
+    def mayores(self, puntos):
+        """Usuarios con más de `puntos` puntos"""
+        cubeta = puntos // self.ancho
+        en_cubeta = sum(
+            cantidad for puntaje, cantidad in self.cubetas.get(cubeta, {}).items() if puntaje > puntos
+        )
+        return len(self.puntos) - self._hasta(cubeta) + en_cubeta
+
+    def posicion(self, usuario_id):
+        """Posición del usuario (los empates la comparten), o None si no tiene puntos"""
+        puntos = self.puntos.get(usuario_id)
+        if puntos is None:
+            return None
+        return self.mayores(puntos) + 1
+
+    def fijar(self, usuario_id, puntos):
+        """Lleva el total del usuario a `puntos` si es mayor que el que tenía"""
+        anterior = self.puntos.get(usuario_id, 0)
+        if puntos <= anterior:
+            return
+        if anterior > 0:
+            cubeta = anterior // self.ancho
+            self.cubetas[cubeta][anterior] -= 1
+            if not self.cubetas[cubeta][anterior]:
+                del self.cubetas[cubeta][anterior]
+                if not self.cubetas[cubeta]:
+                    del self.cubetas[cubeta]
+            self._sumar(cubeta, -1)
+
+        self.puntos[usuario_id] = puntos
+        cubeta = puntos // self.ancho
+        self.cubetas[cubeta][puntos] += 1
+        if cubeta + 1 < len(self.arbol):
+            self._sumar(cubeta, 1)
+        else:
+            self._construir_arbol(cubeta + 1)
+
+
+def _clave_version(periodo, juego, inicio):
+    return f'ranking:version:{periodo}:{juego}:{inicio.isoformat()}'
+
+
+def obtener_indice(periodo='total', juego='todos'):
+    """Índice del ranking actual (periodo, juego); lo recarga si su versión cambió"""
+    periodo = periodo if periodo in PERIODOS else 'total'
+    juego = normalizar_juego(juego)
+    inicio = inicio_periodo(periodo)
+    version = obtener_version(_clave_version(periodo, juego, inicio))
+
+    with _lock:
+        indice = _indices.get((periodo, juego, inicio))
+        if indice is not None and indice.version == version:
+            return indice
+
+        filas = RankingMaterializado.objects.filter(
+            periodo=periodo, juego=juego, inicio_periodo=inicio, puntos__gt=0
+        ).values_list('usuario_id', 'puntos')
+        indice = IndicePosiciones(filas.iterator(chunk_size=2000), version)
+
+        # Los índices de períodos ya cerrados no se vuelven a consultar
+        for clave in [c for c in _indices if c[:2] == (periodo, juego) and c[2] != inicio]:
+            del _indices[clave]
+        _indices[(periodo, juego, inicio)] = indice
+        return indice
+
+
+def _sincronizar_indices(usuario_id, rankings):
+    """Tras confirmar una partida: sube los sellos y aplica el total a los índices cargados
+
+    Un índice cuya versión no era la anterior al salto perdió escrituras de
+    otro proceso y se descarta para recargarlo en la próxima consulta.
+    """
+    vigentes = []
+    for periodo, juego, inicio in rankings:
+        version = incrementar_version(_clave_version(periodo, juego, inicio))
+        clave = (periodo, juego, inicio)
+        with _lock:
+            indice = _indices.get(clave)
+            if indice is None:
+                continue
+            if indice.version in (version - 1, version):
+                indice.version = version
+                vigentes.append(clave)
+            else:
+                del _indices[clave]
+
+    if not vigentes:
+        return
+
+    filtro = reduce(or_, (
+        Q(periodo=periodo, juego=juego, inicio_periodo=inicio) for periodo, juego, inicio in vigentes
+    ))
+    totales = RankingMaterializado.objects.filter(filtro, usuario_id=usuario_id).values_list(
+        'periodo', 'juego', 'inicio_periodo', 'puntos'
+    )
+    with _lock:
+        for periodo, juego, inicio, puntos in totales:
+            indice = _indices.get((periodo, juego, inicio))
+            if indice is not None:
+                indice.fijar(usuario_id, puntos)
+
+
+def invalidar_indices():
+    """Recarga todos los índices al confirmarse la transacción actual
+
+    Para cambios que pueden bajar totales o quitar filas (reconstruir_ranking,
+    borrar usuarios), que la sincronización por máximo no refleja.
+    """
+    def invalidar():
+        for periodo in PERIODOS:
+            inicio = inicio_periodo(periodo)
+            for juego in JUEGOS:
+                incrementar_version(_clave_version(periodo, juego, inicio))
+        with _lock:
+            _indices.clear()
+
+    transaction.on_commit(invalidar)
+
+
+def obtener_posicion(usuario_id, periodo='total', juego='todos'):
+    """Posición de un usuario en el ranking (periodo, juego), o None si no tiene puntos
+
+    Los empates comparten posición. Como obtener_ranking, sólo cuenta a
+    quienes tienen más de cero puntos. Con el índice cargado y al día no
+    hace ninguna consulta.
+    """
+    return obtener_indice(periodo, juego).posicion(usuario_id)
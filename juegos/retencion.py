@@ -0,0 +1,166 @@
+"""
+Retención e histórico de Notificacion y Mensaje
+
+Borra las filas viejas en lotes pequeños (cada lote en su propia transacción,
+así ninguna consulta bloquea la tabla mucho tiempo) y, antes de borrarlas, las
+guarda en archivos JSONL comprimidos con gzip. Así las tablas calientes sólo
+conservan lo reciente y los listados por usuario siguen siendo rápidos.
+
+Los plazos se configuran en settings:
+
+    JUEGOS_RETENCION_NOTIFICACIONES = {'LOGRO': 365, 'SISTEMA': 30, ...}
+    JUEGOS_RETENCION_NO_LEIDAS = 365
+    JUEGOS_RETENCION_MENSAJES = 365
+    JUEGOS_DIRECTORIO_ARCHIVO = BASE_DIR / 'archivo'
+
+Las notificaciones leídas vencen según su tipo; las no leídas sólo al pasar
+JUEGOS_RETENCION_NO_LEIDAS. De los mensajes se borran los leídos que no son
+el último de ninguna conversación, para que la bandeja no quede sin vista
+previa ni cambien sus contadores.
+"""
+
+import gzip
+import json
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Conversacion, Mensaje, Notificacion
+
+from .notificaciones import invalidar_contadores
+
+
+# Días que se conserva cada tipo de notificación ya leída
+RETENCION_NOTIFICACIONES = {
+    'BIENVENIDA': 30,
+    'MENSAJE': 30,
+    'SISTEMA': 90,
+    'AMISTAD': 90,
+    'LOGRO': 365,
+}
+RETENCION_NOTIFICACIONES_OTRAS = 90
+RETENCION_NO_LEIDAS = 365
+RETENCION_MENSAJES = 365
+TAMANO_LOTE = 500
+
+
+def plazos_notificaciones():
+    """{tipo: días} con los valores de settings sobre los predeterminados"""
+    plazos = dict(RETENCION_NOTIFICACIONES)
+    plazos.update(getattr(settings, 'JUEGOS_RETENCION_NOTIFICACIONES', {}))
+    return plazos
+
+
+def directorio_archivo():
+    return Path(getattr(settings, 'JUEGOS_DIRECTORIO_ARCHIVO', Path(settings.BASE_DIR) / 'archivo'))
+
+
+class Archivo:
+    """Archivo JSONL comprimido que se abre al escribir la primera fila"""
+
+    def __init__(self, directorio, nombre):
+        self.ruta = Path(directorio) / f'{nombre}-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz'
+        self.filas = 0
+        self._archivo = None
+
+    def escribir(self, filas):
+        if self._archivo is None:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            self._archivo = gzip.open(self.ruta, 'at', encoding='utf-8')
+        for fila in filas:
+            self._archivo.write(json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+        # Lo archivado queda en disco antes de borrarlo de la tabla
+        self._archivo.flush()
+        self.filas += len(filas)
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+
+
+def purgar_en_lotes(queryset, orden, archivo=None, lote=TAMANO_LOTE, simular=False):
+    """Archiva y borra las filas del queryset en lotes; devuelve cuántas borró
+
+    Cada lote se vuelve a consultar en orden de `orden` (un campo indexado),
+    así el recorrido no depende de OFFSET. Con `simular` sólo se cuenta.
+    """
+    if simular:
+        return queryset.count()
+
+    borradas = 0
+    while True:
+        filas = list(queryset.order_by(orden, 'id').values()[:lote])
+        if not filas:
+            return borradas
+
+        if archivo is not None:
+            archivo.escribir(filas)
+        with transaction.atomic():
+            borradas += queryset.model.objects.filter(id__in=[fila['id'] for fila in filas]).delete()[0]
+
+        if len(filas) < lote:
+            return borradas
+
+
+def purgar_notificaciones(ahora=None, archivo=None, lote=TAMANO_LOTE, simular=False):
+    """Aplica los plazos por tipo; devuelve {tipo: filas borradas}"""
+    ahora = ahora or timezone.now()
+    plazos = plazos_notificaciones()
+    tipos = set(plazos) | set(Notificacion.objects.values_list('tipo', flat=True).distinct())
+    resultado = {}
+
+    for tipo in sorted(tipos):
+        dias = plazos.get(tipo, RETENCION_NOTIFICACIONES_OTRAS)
+        leidas = Notificacion.objects.filter(
+            tipo=tipo, leida=True, fecha_creacion__lt=ahora - timedelta(days=dias)
+        )
+        resultado[tipo] = purgar_en_lotes(leidas, 'fecha_creacion', archivo, lote, simular)
+
+    # Las no leídas tienen un plazo único; hay que descartar los contadores de sus dueños
+    dias = getattr(settings, 'JUEGOS_RETENCION_NO_LEIDAS', RETENCION_NO_LEIDAS)
+    no_leidas = Notificacion.objects.filter(leida=False, fecha_creacion__lt=ahora - timedelta(days=dias))
+    usuarios = set() if simular else set(no_leidas.values_list('usuario_id', flat=True).distinct())
+    resultado['no_leidas'] = purgar_en_lotes(no_leidas, 'fecha_creacion', archivo, lote, simular)
+    if usuarios:
+        invalidar_contadores(usuarios)
+
+    return resultado
+
+
+def purgar_mensajes(ahora=None, archivo=None, lote=TAMANO_LOTE, simular=False):
+    """Borra los mensajes leídos más viejos que el plazo; devuelve cuántos"""
+    ahora = ahora or timezone.now()
+    dias = getattr(settings, 'JUEGOS_RETENCION_MENSAJES', RETENCION_MENSAJES)
+    viejos = Mensaje.objects.filter(
+        leido=True, fecha_envio__lt=ahora - timedelta(days=dias)
+    ).exclude(
+        id__in=Conversacion.objects.filter(ultimo_mensaje__isnull=False).values('ultimo_mensaje_id')
+    )
+    return purgar_en_lotes(viejos, 'fecha_envio', archivo, lote, simular)
+
+
+def aplicar_retencion(directorio=None, archivar=True, lote=TAMANO_LOTE, simular=False):
+    """Purga ambas tablas; devuelve el resumen y las rutas de los archivos"""
+    directorio = directorio or directorio_archivo()
+    ahora = timezone.now()
+    archivos = {
+        'notificaciones': Archivo(directorio, 'notificaciones') if archivar and not simular else None,
+        'mensajes': Archivo(directorio, 'mensajes') if archivar and not simular else None,
+    }
+
+    try:
+        resumen = {
+            'notificaciones': purgar_notificaciones(ahora, archivos['notificaciones'], lote, simular),
+            'mensajes': purgar_mensajes(ahora, archivos['mensajes'], lote, simular),
+        }
+    finally:
+        for archivo in archivos.values():
+            if archivo is not None:
+                archivo.cerrar()
+
+    resumen['archivos'] = [str(a.ruta) for a in archivos.values() if a is not None and a.filas]
+    return resumen
@@ -0,0 +1,59 @@
+"""
+Señales de la aplicación juegos
+
+Mantienen al día las cachés de los servicios cuando se editan los
+catálogos desde el admin o cambian los datos de un usuario.
+"""
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Inventario, Item, ItemUsuario, Logro, Perfil
+from . import catalogo, inventario, logros, perfiles, preguntas
+from .models import AventuraNivel, PreguntaOrtografia
+
+
+@receiver([post_save, post_delete], sender=AventuraNivel)
+def actualizar_logro_aventura(sender, **kwargs):
+    """El logro de todos los niveles sigue al número de niveles"""
+    logros.actualizar_logro_todos_los_niveles()
+
+
+@receiver([post_save, post_delete], sender=PreguntaOrtografia)
+def invalidar_banco_preguntas(sender, **kwargs):
+    """El banco de preguntas se recarga tras editar una pregunta"""
+    preguntas.invalidar_banco()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidar_usuario(sender, instance, **kwargs):
+    """El usuario precargado con su perfil se vuelve a leer"""
+    perfiles.invalidar_perfil(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Perfil)
+@receiver([post_save, post_delete], sender=Inventario)
+def invalidar_perfil_usuario(sender, instance, **kwargs):
+    """El usuario precargado con su perfil se vuelve a leer"""
+    perfiles.invalidar_perfil(instance.usuario_id)
+
+
+@receiver([post_save, post_delete], sender=ItemUsuario)
+def invalidar_resumen_inventario(sender, instance, **kwargs):
+    """El resumen del inventario se recalcula al dar, usar o equipar un ítem"""
+    inventario.invalidar_inventario(instance.usuario_id)
+
+
+@receiver([post_save, post_delete], sender=Item)
+def invalidar_resumenes_inventario(sender, **kwargs):
+    """El valor o la rareza de un ítem cambia el resumen de todos sus dueños"""
+    inventario.invalidar_inventarios()
+
+
+@receiver([post_save, post_delete], sender=Item)
+@receiver([post_save, post_delete], sender=Logro)
+@receiver([post_save, post_delete], sender=AventuraNivel)
+def invalidar_catalogos(sender, **kwargs):
+    """Los procesos recargan el catálogo editado y lo derivado de él (reglas, orden de niveles)"""
+    catalogo.invalidar_catalogo({Item: 'items', Logro: 'logros', AventuraNivel: 'niveles'}[sender])
@@ -0,0 +1,25 @@
+"""
+Tareas periódicas de la aplicación juegos
+
+Se registran en Celery si está instalado (ver JuegosConfig.programar_tareas_periodicas);
+sin Celery son funciones normales que se pueden llamar desde cron con su
+comando de gestión equivalente.
+"""
+
+try:
+    from celery import shared_task
+except ImportError:
+    def shared_task(funcion):
+        return funcion
+
+from .retencion import aplicar_retencion
+
+
+@shared_task
+def limpiar_notificaciones():
+    """Aplica la retención de notificaciones y mensajes (python manage.py aplicar_retencion)"""
+    resumen = aplicar_retencion()
+    return {
+        'notificaciones': sum(resumen['notificaciones'].values()),
+        'mensajes': resumen['mensajes'],
+    }
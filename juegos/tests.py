@@ -1,3 +1,1877 @@
-from django.test import TestCase
+"""
+Tests para la aplicación juegos de Academia Digital
+Cubre los servicios de ranking, logros y progreso de los juegos
+"""
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import JsonResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.core.cache import cache
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from collections import OrderedDict
+from datetime import timedelta
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from core.models import (
+    Amistad, Conversacion, Item, ItemUsuario, Logro, LogroDesbloqueado, Mensaje, Notificacion, Perfil,
+    PuntuacionDiaria,
+)
+from .models import (
+    AventuraNivel, FronteraAventura, PreguntaOrtografia, ProgresoAventura, ProgresoOrtografia,
+    RankingMaterializado,
+)
+from . import acceso, alumnos, aventura, benchmark, catalogo, consultas, estadisticas, inventario, logros, mensajeria, notificaciones, partidas, perfiles, preguntas, puntos, push, ranking, retencion, versiones
+from .middleware import obtener_usuario
+from .views import login_view, respuesta_paquete
+
+# ============================================
+# TESTS DE RANKING
+# ============================================
+
+class RankingMaterializadoTest(TestCase):
+    """Pruebas para el ranking materializado"""
+
+    def setUp(self):
+        self.usuarios = []
+        for i in range(3):
+            usuario = User.objects.create_user(username=f'jugador{i}', password='pass123')
+            Perfil.objects.create(usuario=usuario, nivel_maestria=i + 1)
+            self.usuarios.append(usuario)
+
+    def registrar(self, usuario, puntos, tipo_juego, fecha=None):
+        fecha = fecha or timezone.now().date()
+        PuntuacionDiaria.objects.create(
+            usuario=usuario, puntos=puntos, tipo_juego=tipo_juego, fecha=fecha
+        )
+        ranking.actualizar_ranking(usuario, puntos, tipo_juego, fecha)
+
+    def test_actualizacion_incremental(self):
+        """Cada partida suma a todos los períodos del juego y a 'todos'"""
+        self.registrar(self.usuarios[0], 50, 'AVENTURA')
+        self.registrar(self.usuarios[0], 30, 'AVENTURA')
+
+        fila = RankingMaterializado.objects.get(
+            usuario=self.usuarios[0], periodo='semanal', juego='aventura'
+        )
+        self.assertEqual(fila.puntos, 80)
+        self.assertEqual(fila.partidas, 2)
+        # 4 períodos x ('todos', 'aventura')
+        self.assertEqual(RankingMaterializado.objects.count(), 8)
+
+    def test_obtener_ranking_ordenado_en_una_consulta(self):
+        """La lectura del ranking es una sola consulta e incluye el perfil"""
+        self.registrar(self.usuarios[0], 10, 'AVENTURA')
+        self.registrar(self.usuarios[1], 40, 'ORTOGRAFIA')
+        self.registrar(self.usuarios[2], 25, 'AVENTURA')
+
+        with self.assertNumQueries(1):
+            filas = ranking.obtener_ranking('diario', 'todos')
+
+        self.assertEqual([f['username'] for f in filas], ['jugador1', 'jugador2', 'jugador0'])
+        self.assertEqual(filas[0]['nivel'], 2)
+
+        aventura = ranking.obtener_ranking('total', 'aventura')
+        self.assertEqual([f['username'] for f in aventura], ['jugador2', 'jugador0'])
+
+    def test_periodos_anteriores_no_cuentan(self):
+        """Los puntos de semanas pasadas no aparecen en el ranking semanal"""
+        hace_un_mes = timezone.now().date() - timedelta(days=40)
+        self.registrar(self.usuarios[0], 100, 'AVENTURA', fecha=hace_un_mes)
+
+        self.assertEqual(ranking.obtener_ranking('semanal'), [])
+        self.assertEqual(len(ranking.obtener_ranking('total')), 1)
+
+    def test_reconstruir_desde_puntuaciones(self):
+        """La reconstrucción coincide con las actualizaciones incrementales"""
+        self.registrar(self.usuarios[0], 10, 'AVENTURA')
+        self.registrar(self.usuarios[0], 15, 'ORTOGRAFIA')
+        self.registrar(self.usuarios[1], 5, 'AVENTURA')
+        incremental = set(RankingMaterializado.objects.values_list(
+            'usuario_id', 'periodo', 'juego', 'puntos', 'partidas'
+        ))
+
+        ranking.reconstruir_ranking()
+
+        reconstruido = set(RankingMaterializado.objects.values_list(
+            'usuario_id', 'periodo', 'juego', 'puntos', 'partidas'
+        ))
+        self.assertEqual(incremental, reconstruido)
+
+    def test_reconstruir_conserva_la_historia(self):
+        """La reconstrucción incluye días, semanas y meses pasados"""
+        hoy = timezone.now().date()
+        for dias in (0, 1, 1, 40):
+            self.registrar(self.usuarios[0], 10, 'AVENTURA', fecha=hoy - timedelta(days=dias))
+        campos = ('usuario_id', 'periodo', 'juego', 'inicio_periodo', 'puntos', 'partidas')
+        incremental = set(RankingMaterializado.objects.values_list(*campos))
+
+        ranking.reconstruir_ranking()
+
+        self.assertEqual(set(RankingMaterializado.objects.values_list(*campos)), incremental)
+        ayer = RankingMaterializado.objects.get(
+            usuario=self.usuarios[0], periodo='diario', juego='todos', inicio_periodo=hoy - timedelta(days=1)
+        )
+        self.assertEqual((ayer.puntos, ayer.partidas), (20, 2))
+
+    def test_actividad_desde_filas_diarias(self):
+        """Días activos y última actividad salen del resumen diario"""
+        hoy = timezone.now().date()
+        self.registrar(self.usuarios[0], 10, 'AVENTURA', fecha=hoy - timedelta(days=3))
+        self.registrar(self.usuarios[0], 10, 'ORTOGRAFIA', fecha=hoy - timedelta(days=3))
+        self.registrar(self.usuarios[0], 10, 'AVENTURA', fecha=hoy - timedelta(days=1))
+
+        self.assertEqual(ranking.dias_activos(self.usuarios[0].id), 2)
+        self.assertEqual(ranking.ultimo_dia_activo(self.usuarios[0].id), hoy - timedelta(days=1))
+        self.assertIsNone(ranking.ultimo_dia_activo(self.usuarios[1].id))
+
+
+class PosicionesRankingTest(TestCase):
+    """Pruebas para la consulta de posiciones en O(log n)"""
+
+    def setUp(self):
+        cache.clear()
+        ranking._indices.clear()
+        self.usuarios = [
+            User.objects.create_user(username=f'alumno{i}', password='pass123')
+            for i in range(4)
+        ]
+        for usuario, cantidad in zip(self.usuarios, [30, 50, 30, 10]):
+            ranking.actualizar_ranking(usuario, cantidad, 'ORTOGRAFIA')
+
+    def test_posiciones_con_empates(self):
+        """Los empates comparten posición y el siguiente salta"""
+        posiciones = [ranking.obtener_posicion(u.id) for u in self.usuarios]
+        self.assertEqual(posiciones, [2, 1, 2, 4])
+
+    def test_usuario_sin_puntos(self):
+        """Un usuario fuera del ranking, o con cero puntos, no tiene posición"""
+        nuevo = User.objects.create_user(username='nuevo', password='pass123')
+        ranking.actualizar_ranking(nuevo, 0, 'ORTOGRAFIA')
+        self.assertIsNone(ranking.obtener_posicion(nuevo.id))
+        self.assertIsNone(ranking.obtener_posicion(nuevo.id, 'semanal'))
+        self.assertIsNone(ranking.obtener_posicion(self.usuarios[0].id, 'total', 'aventura'))
+        self.assertEqual(ranking.obtener_posicion(self.usuarios[3].id), 4)
+
+    def test_indice_se_actualiza_sin_recargar(self):
+        """Las partidas del propio proceso llevan al índice el total confirmado"""
+        ranking.obtener_indice('total', 'todos')
+        with self.captureOnCommitCallbacks(execute=True):
+            ranking.actualizar_ranking(self.usuarios[3], 100, 'AVENTURA')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ranking.obtener_posicion(self.usuarios[3].id), 1)
+            self.assertEqual(ranking.obtener_posicion(self.usuarios[1].id), 2)
+
+    def test_rollback_no_toca_el_indice(self):
+        """Una partida que se revierte no llega al índice ni sube la versión"""
+        ranking.obtener_indice('total', 'todos')
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                ranking.actualizar_ranking(self.usuarios[3], 100, 'AVENTURA')
+                raise RuntimeError
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ranking.obtener_posicion(self.usuarios[3].id), 4)
+
+    def test_escritura_de_otro_proceso_recarga_el_indice(self):
+        """Si la versión en caché avanza, el índice se recarga desde la tabla"""
+        ranking.obtener_indice('total', 'todos')
+        RankingMaterializado.objects.filter(
+            usuario=self.usuarios[3], periodo='total', juego='todos'
+        ).update(puntos=999)
+        versiones.incrementar_version(
+            ranking._clave_version('total', 'todos', ranking.INICIO_TOTAL)
+        )
+
+        self.assertEqual(ranking.obtener_posicion(self.usuarios[3].id), 1)
+        self.assertEqual(ranking.obtener_posicion(self.usuarios[1].id), 2)
+
+    def test_reconstruir_recarga_los_indices(self):
+        """Tras reconstruir el ranking los totales pueden bajar: el índice se recarga"""
+        ranking.obtener_indice('total', 'todos')
+        with self.captureOnCommitCallbacks(execute=True):
+            ranking.reconstruir_ranking()
+
+        self.assertIsNone(ranking.obtener_posicion(self.usuarios[1].id))
+
+    def test_cubetas_y_crecimiento_del_arbol(self):
+        """El conteo es exacto dentro de una cubeta y más allá de la última"""
+        indice = ranking.IndicePosiciones([(1, 5), (2, 7), (3, 40), (4, 0)], ancho=8)
+        self.assertEqual([indice.posicion(u) for u in (1, 2, 3, 4)], [3, 2, 1, None])
+
+        indice.fijar(1, 500)
+        indice.fijar(2, 6)
+        self.assertEqual([indice.posicion(u) for u in (1, 2, 3)], [1, 3, 2])
+        self.assertEqual(indice.mayores(39), 2)
+        self.assertEqual(indice.mayores(500), 0)
+
+
+# ============================================
+# TESTS DE AVENTURA
+# ============================================
+
+class MapaAventuraTest(TestCase):
+    """Pruebas para el mapa de niveles de la aventura"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='testuser', password='testpass123')
+        self.niveles = [
+            AventuraNivel.objects.create(
+                nivel=orden, orden=orden, titulo=f'Nivel {orden}', descripcion='Desc'
+            )
+            for orden in range(1, 5)
+        ]
+        ProgresoAventura.objects.create(
+            usuario=self.usuario, nivel=self.niveles[0], completado=True,
+            puntuacion=80, tiempo_jugado=timedelta(seconds=40),
+        )
+        ProgresoAventura.objects.create(
+            usuario=self.usuario, nivel=self.niveles[1], completado=False,
+            puntuacion=20, tiempo_jugado=timedelta(seconds=15),
+        )
+
+    def test_estado_en_una_consulta(self):
+        """Con el catálogo de niveles cargado, el mapa sólo consulta el progreso"""
+        aventura.obtener_frontera(self.usuario)
+        catalogo.niveles()
+
+        with self.assertNumQueries(1):
+            mapa = aventura.MapaAventura(self.usuario)
+
+        self.assertEqual([n.bloqueado for n in mapa.niveles], [False, False, True, True])
+        self.assertEqual([n.completado for n in mapa.niveles], [True, False, False, False])
+        self.assertEqual(mapa.niveles[1].puntuacion_obtenida, 20)
+        self.assertIsNone(mapa.niveles[2].mejor_tiempo)
+        self.assertEqual(mapa.stats, {
+            'niveles_completados': 1,
+            'puntuacion_total': 100,
+            'tiempo_total': timedelta(seconds=55),
+        })
+
+    def test_esta_desbloqueado(self):
+        """El primer nivel siempre está abierto; los demás tras completar el anterior"""
+        mapa = aventura.MapaAventura(self.usuario)
+        self.assertTrue(mapa.esta_desbloqueado(self.niveles[0]))
+        self.assertTrue(mapa.esta_desbloqueado(self.niveles[1]))
+        self.assertFalse(mapa.esta_desbloqueado(self.niveles[2]))
+
+    def test_desbloqueo_sin_tocar_el_progreso(self):
+        """Con la frontera en caché, comprobar un desbloqueo no consulta la BD"""
+        aventura.obtener_frontera(self.usuario)
+        self.assertEqual(FronteraAventura.objects.get(usuario=self.usuario).orden_completado, 1)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(aventura.nivel_desbloqueado(self.usuario, self.niveles[1]))
+            self.assertFalse(aventura.nivel_desbloqueado(self.usuario, self.niveles[2]))
+
+    def test_avanzar_frontera(self):
+        """Completar el nivel siguiente a la frontera la mueve; repetir uno viejo no"""
+        aventura.obtener_frontera(self.usuario)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            aventura.avanzar_frontera(self.usuario, self.niveles[0])
+        self.assertEqual(aventura.obtener_frontera(self.usuario), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            aventura.avanzar_frontera(self.usuario, self.niveles[1])
+        self.assertEqual(aventura.obtener_frontera(self.usuario), 2)
+        self.assertTrue(aventura.nivel_desbloqueado(self.usuario, self.niveles[2]))
+
+        # Un nivel bloqueado no salta la frontera
+        aventura.avanzar_frontera(self.usuario, self.niveles[3])
+        self.assertEqual(FronteraAventura.objects.get(usuario=self.usuario).orden_completado, 2)
+
+    def test_avanzar_frontera_sin_fila(self):
+        """Un usuario nuevo que completa el nivel 1 sin haber abierto el mapa avanza igual"""
+        nuevo = User.objects.create_user(username='nueva_exploradora', password='pass123')
+        ProgresoAventura.objects.create(usuario=nuevo, nivel=self.niveles[0], completado=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            aventura.avanzar_frontera(nuevo, self.niveles[0])
+
+        self.assertEqual(FronteraAventura.objects.get(usuario=nuevo).orden_completado, 1)
+        with self.assertNumQueries(0):
+            self.assertTrue(aventura.nivel_desbloqueado(nuevo, self.niveles[1]))
+            self.assertFalse(aventura.nivel_desbloqueado(nuevo, self.niveles[2]))
+
+    def test_frontera_salta_niveles_ya_completados(self):
+        """Completar el hueco lleva la frontera hasta el último nivel completado seguido"""
+        aventura.obtener_frontera(self.usuario)
+        for nivel in self.niveles[2:]:
+            ProgresoAventura.objects.create(usuario=self.usuario, nivel=nivel, completado=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            aventura.avanzar_frontera(self.usuario, self.niveles[1])
+
+        self.assertEqual(FronteraAventura.objects.get(usuario=self.usuario).orden_completado, 4)
+        self.assertEqual(aventura.obtener_frontera(self.usuario), 4)
+
+    def test_frontera_revertida_no_queda_en_cache(self):
+        """Si el lote se revierte, la caché conserva la frontera anterior"""
+        aventura.obtener_frontera(self.usuario)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                aventura.avanzar_frontera(self.usuario, self.niveles[1])
+                raise RuntimeError
+
+        self.assertEqual(aventura.obtener_frontera(self.usuario), 1)
+        self.assertFalse(aventura.nivel_desbloqueado(self.usuario, self.niveles[2]))
+
+    def test_nivel_nuevo_al_final(self):
+        """Un nivel agregado tras completar todos queda desbloqueado"""
+        for nivel in self.niveles[1:]:
+            ProgresoAventura.objects.update_or_create(
+                usuario=self.usuario, nivel=nivel, defaults={'completado': True}
+            )
+        self.assertEqual(aventura.obtener_frontera(self.usuario), 4)
+
+        nuevo = AventuraNivel.objects.create(nivel=5, orden=5, titulo='Nivel 5', descripcion='Desc')
+        self.assertTrue(aventura.nivel_desbloqueado(self.usuario, nuevo))
+
+    def test_orden_sigue_la_version_del_catalogo(self):
+        """Un cambio de orden publicado por otro proceso se ve con la versión nueva"""
+        self.assertEqual(aventura._ordenes_anteriores()[3], 2)
+
+        # update() no envía señales: es lo que ve un proceso que no hizo el cambio
+        AventuraNivel.objects.filter(pk=self.niveles[2].pk).update(orden=10)
+        self.assertEqual(aventura._ordenes_anteriores()[3], 2)
+
+        catalogo.invalidar_catalogo('niveles')
+        anteriores = aventura._ordenes_anteriores()
+        self.assertNotIn(3, anteriores)
+        self.assertEqual(anteriores[10], 4)
+
+
+# ============================================
+# TESTS DE ORTOGRAFÍA
+# ============================================
+
+class BancoPreguntasTest(TestCase):
+    """Pruebas para el banco de preguntas en memoria"""
+
+    def setUp(self):
+        cache.clear()
+        preguntas._banco = None
+        preguntas._fragmentos = (None, OrderedDict())
+        for i in range(30):
+            PreguntaOrtografia.objects.create(
+                palabra=f'palabra{i}', palabra_correcta=f'palabra{i}', opciones=['a', 'b'],
+                categoria='tildes' if i % 2 else 'b-v', dificultad=1 + i % 3,
+            )
+
+    def test_muestreo_sin_reemplazo(self):
+        """Las preguntas elegidas son distintas y respetan el filtro"""
+        ids = preguntas.obtener_banco().muestrear(10, categoria='tildes')
+        self.assertEqual(len(set(ids)), 10)
+        self.assertEqual(
+            set(PreguntaOrtografia.objects.filter(id__in=ids).values_list('categoria', flat=True)),
+            {'tildes'},
+        )
+
+        banco = preguntas.obtener_banco()
+        self.assertEqual(len(banco.muestrear(100)), 30)
+        self.assertEqual(len(banco.ids(dificultad=2)), 10)
+        self.assertEqual(banco.muestrear(5, categoria='inexistente'), [])
+
+    def test_editar_pregunta_invalida_el_banco(self):
+        """Guardar una pregunta recarga el banco en la siguiente partida"""
+        preguntas.obtener_banco()
+        with self.captureOnCommitCallbacks(execute=True):
+            nueva = PreguntaOrtografia.objects.create(
+                palabra='nueva', palabra_correcta='nueva', opciones=['a'], categoria='h', dificultad=3,
+            )
+
+        self.assertEqual(list(preguntas.obtener_banco().ids(categoria='h')), [nueva.id])
+
+    def test_pregunta_revertida_no_cambia_la_version(self):
+        """Si la transacción se deshace, la versión del banco no se mueve"""
+        version = versiones.obtener_version(preguntas.CLAVE_VERSION)
+        with transaction.atomic():
+            sid = transaction.savepoint()
+            PreguntaOrtografia.objects.create(
+                palabra='x', palabra_correcta='x', opciones=['x'], categoria='h', dificultad=1,
+            )
+            transaction.savepoint_rollback(sid)
+
+        self.assertEqual(versiones.obtener_version(preguntas.CLAVE_VERSION), version)
+
+
+class PaquetesPreguntasTest(TestCase):
+    """Pruebas para los paquetes de preguntas pre-serializados"""
+
+    def setUp(self):
+        cache.clear()
+        preguntas._banco = None
+        preguntas._fragmentos = (None, OrderedDict())
+        for i in range(5):
+            PreguntaOrtografia.objects.create(
+                palabra=f'acion{i}', palabra_correcta=f'ación{i}', opciones=['ación', 'acion'],
+                categoria='tildes', dificultad=1,
+            )
+
+    def test_paquete_en_cache(self):
+        """El segundo pedido de una categoría no toca la BD"""
+        paquete = preguntas.paquete_ortografia('tildes')
+        datos = json.loads(paquete.texto)
+        self.assertEqual(paquete.total, 5)
+        self.assertEqual(datos[0]['correcta'], 'ación0')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(preguntas.paquete_ortografia('tildes').etag, paquete.etag)
+
+    def test_editar_pregunta_cambia_el_paquete(self):
+        """Guardar una pregunta publica una nueva versión del paquete"""
+        anterior = preguntas.paquete_ortografia('tildes')
+        with self.captureOnCommitCallbacks(execute=True):
+            PreguntaOrtografia.objects.filter(categoria='tildes').first().save()
+            PreguntaOrtografia.objects.create(
+                palabra='x', palabra_correcta='x', opciones=['x'], categoria='tildes', dificultad=2,
+            )
+
+        nuevo = preguntas.paquete_ortografia('tildes')
+        self.assertEqual(nuevo.total, 6)
+        self.assertNotEqual(nuevo.etag, anterior.etag)
+
+    def test_practica_con_un_in_bulk(self):
+        """Con el banco cargado, la práctica cuesta un in_bulk de lo que falta"""
+        preguntas.obtener_banco()
+        with self.assertNumQueries(1):
+            preguntas.paquete_practica(5)
+
+        with self.assertNumQueries(0):
+            paquete = preguntas.paquete_practica(3)
+
+        self.assertEqual(len({p['id'] for p in json.loads(paquete.texto)}), 3)
+
+    def test_fragmentos_acotados(self):
+        """Los fragmentos en memoria no pasan de MAX_FRAGMENTOS"""
+        original = preguntas.MAX_FRAGMENTOS
+        preguntas.MAX_FRAGMENTOS = 2
+        self.addCleanup(setattr, preguntas, 'MAX_FRAGMENTOS', original)
+
+        paquete = preguntas.paquete_practica(5)
+
+        self.assertEqual(paquete.total, 5)
+        self.assertEqual(len(preguntas._fragmentos[1]), 2)
+
+    def test_respuesta_condicional(self):
+        """Con If-None-Match igual al ETag se responde 304 sin cuerpo"""
+        paquete = preguntas.paquete_ortografia('tildes')
+        factory = RequestFactory()
+
+        response = respuesta_paquete(factory.get('/'), paquete)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], paquete.etag)
+
+        response = respuesta_paquete(factory.get('/', HTTP_IF_NONE_MATCH=paquete.etag), paquete)
+        self.assertEqual(response.status_code, 304)
+
+    def test_api_preguntas_ortografia(self):
+        """El endpoint devuelve el paquete con su ETag y 304 al repetirlo"""
+        usuario = User.objects.create_user(username='lectora', password='pass123')
+        Perfil.objects.create(usuario=usuario)
+        self.client.force_login(usuario)
+
+        response = self.client.get('/api/preguntas/ortografia/tildes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+        etag = response['ETag']
+
+        response = self.client.get('/api/preguntas/ortografia/tildes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+
+# ============================================
+# TESTS DE LOGROS
+# ============================================
+
+class EvaluacionLogrosTest(TestCase):
+    """Pruebas para la evaluación de logros en lote"""
+
+    def setUp(self):
+        # Partir de un catálogo vacío (sin los logros base de la migración)
+        Logro.objects.all().delete()
+        self.usuario = User.objects.create_user(username='testuser', password='testpass123')
+        Perfil.objects.create(usuario=self.usuario, puntos_totales=150, racha_maxima=4)
+        otro = User.objects.create_user(username='amigo', password='pass123')
+        Amistad.objects.create(usuario1=otro, usuario2=self.usuario, estado='ACEPTADA')
+
+        for orden in range(1, 4):
+            nivel = AventuraNivel.objects.create(
+                nivel=orden, orden=orden, titulo=f'Nivel {orden}', descripcion='Desc'
+            )
+            ProgresoAventura.objects.create(
+                usuario=self.usuario, nivel=nivel, completado=orden < 3
+            )
+        ProgresoOrtografia.objects.create(usuario=self.usuario, categoria='tildes', aciertos=12)
+        ProgresoOrtografia.objects.create(usuario=self.usuario, categoria='b-v', aciertos=8)
+
+    def crear_logro(self, nombre, tipo, cantidad, rareza='COMUN'):
+        return Logro.objects.create(
+            nombre=nombre, descripcion=nombre, categoria='ESPECIAL',
+            tipo=tipo, cantidad_necesaria=cantidad, rareza=rareza,
+        )
+
+    def test_metricas_en_una_consulta(self):
+        """Todas las métricas de las reglas salen de una sola consulta"""
+        with self.assertNumQueries(1):
+            metricas = logros.obtener_metricas(self.usuario.id)
+
+        self.assertEqual(metricas, {
+            'niveles_completados': 2,
+            'aciertos_ortografia': 20,
+            'puntos_totales': 150,
+            'racha_maxima': 4,
+            'amigos': 1,
+        })
+
+    def test_consultas_constantes(self):
+        """La evaluación no crece con el número de logros"""
+        for i in range(30):
+            self.crear_logro(f'Logro {i}', 'ORTOGRAFIA', 10 * (i + 1), rareza='RARO')
+
+        with self.assertNumQueries(3):
+            evaluacion = logros.EvaluacionLogros(self.usuario)
+            evaluacion.proximos()
+            evaluacion.stats_rareza()
+
+    def test_progreso_proximos_y_rareza(self):
+        """Progreso, próximos logros y estadísticas por rareza"""
+        aventura = self.crear_logro('Explorador', 'AVENTURA', 5)
+        puntos = self.crear_logro('Ahorrador', 'PUNTOS', 200, rareza='EPICO')
+        social = self.crear_logro('Sociable', 'SOCIAL', 1)
+        LogroDesbloqueado.objects.create(usuario=self.usuario, logro=social)
+
+        evaluacion = logros.EvaluacionLogros(self.usuario)
+
+        self.assertEqual(evaluacion.progreso(aventura)['actual'], 2)
+        self.assertEqual(evaluacion.progreso(aventura)['porcentaje'], 40)
+        self.assertIsNone(evaluacion.progreso(social))
+        self.assertEqual(
+            [p['logro'] for p in evaluacion.proximos()], [aventura, puntos]
+        )
+
+        rarezas = evaluacion.stats_rareza()
+        self.assertEqual(rarezas['COMUN'], {'total': 2, 'obtenidos': 1, 'porcentaje': 50})
+        self.assertEqual(rarezas['LEGENDARIO']['total'], 0)
+
+
+@override_settings(JUEGOS_LOGROS_EN_SEGUNDO_PLANO=False)
+class PublicarEventoLogrosTest(TestCase):
+    """Pruebas para el desbloqueo de logros por eventos"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='testuser', password='testpass123')
+        Perfil.objects.create(usuario=self.usuario)
+        self.aciertos = Logro.objects.create(
+            nombre='Buen ojo', descripcion='20 aciertos', categoria='ORTOGRAFIA',
+            tipo='ORTOGRAFIA', cantidad_necesaria=20,
+        )
+        self.social = Logro.objects.create(
+            nombre='Sociable', descripcion='Un amigo', categoria='SOCIAL',
+            tipo='SOCIAL', cantidad_necesaria=1,
+        )
+
+    def jugar_ortografia(self, aciertos):
+        ProgresoOrtografia.objects.create(usuario=self.usuario, categoria='tildes', aciertos=aciertos)
+        return logros.publicar_evento(
+            self.usuario, logros.EVENTO_ORTOGRAFIA,
+            aciertos_ortografia=aciertos, puntos_totales=aciertos * 10,
+        )
+
+    def test_desbloqueo_con_notificacion(self):
+        """Al cruzar el umbral se crea el desbloqueo y su notificación"""
+        self.jugar_ortografia(12)
+        self.assertFalse(LogroDesbloqueado.objects.filter(logro=self.aciertos).exists())
+
+        self.jugar_ortografia(8)
+        self.assertTrue(LogroDesbloqueado.objects.filter(
+            usuario=self.usuario, logro=self.aciertos
+        ).exists())
+        self.assertEqual(Notificacion.objects.filter(usuario=self.usuario, tipo='LOGRO').count(), 1)
+
+    def test_contadores_en_cache_y_sin_duplicados(self):
+        """Con los contadores en caché, un evento sin desbloqueos no consulta la BD"""
+        self.jugar_ortografia(25)
+
+        with self.assertNumQueries(1):  # solo el INSERT de la partida
+            self.jugar_ortografia(5)
+
+        self.assertEqual(LogroDesbloqueado.objects.filter(logro=self.aciertos).count(), 1)
+        self.assertEqual(Notificacion.objects.filter(usuario=self.usuario).count(), 1)
+
+    def test_contadores_atomicos_y_confirmados(self):
+        """Cada delta se suma con incr; un contador adelantado no desbloquea sin la BD"""
+        self.jugar_ortografia(5)
+        clave = logros._clave_metrica(self.usuario.id, 'aciertos_ortografia')
+        self.assertEqual(cache.get(clave), 5)
+
+        # Otro proceso sumó su delta entre medio: no se pierde
+        cache.incr(clave, 3)
+        self.jugar_ortografia(2)
+        self.assertEqual(cache.get(clave), 10)
+
+        # Contador por encima de la BD: la regla se confirma y no se desbloquea
+        cache.set(clave, 100)
+        self.jugar_ortografia(1)
+        self.assertFalse(LogroDesbloqueado.objects.filter(logro=self.aciertos).exists())
+
+    def test_solo_reglas_suscritas(self):
+        """Un evento de ortografía no evalúa los logros sociales"""
+        otro = User.objects.create_user(username='amigo', password='pass123')
+        Amistad.objects.create(usuario1=otro, usuario2=self.usuario, estado='ACEPTADA')
+
+        self.jugar_ortografia(1)
+        self.assertFalse(LogroDesbloqueado.objects.filter(logro=self.social).exists())
+
+        logros.publicar_evento(self.usuario, logros.EVENTO_SOCIAL, amigos=1)
+        self.assertTrue(LogroDesbloqueado.objects.filter(logro=self.social).exists())
+
+    def test_reglas_siguen_la_version_del_catalogo(self):
+        """Un umbral cambiado en otro proceso se aplica en cuanto sube la versión"""
+        self.jugar_ortografia(12)
+
+        # update() no envía señales: es lo que ve un proceso que no hizo el cambio
+        Logro.objects.filter(pk=self.aciertos.pk).update(cantidad_necesaria=10)
+        catalogo.invalidar_catalogo('logros')
+
+        self.jugar_ortografia(1)
+        self.assertTrue(LogroDesbloqueado.objects.filter(logro=self.aciertos).exists())
+
+    def test_logro_de_todos_los_niveles(self):
+        """El logro base de aventura exige completar todos los niveles existentes"""
+        logros.asegurar_logros_base()
+        niveles = [
+            AventuraNivel.objects.create(nivel=i, orden=i, titulo=f'Nivel {i}', descripcion='Desc')
+            for i in (1, 2)
+        ]
+        maestro = Logro.objects.get(nombre=logros.LOGRO_TODOS_LOS_NIVELES)
+        self.assertEqual(maestro.cantidad_necesaria, 2)
+
+        for nivel in niveles:
+            ProgresoAventura.objects.create(usuario=self.usuario, nivel=nivel, completado=True)
+            logros.publicar_evento(self.usuario, logros.EVENTO_AVENTURA, niveles_completados=None)
+
+        self.assertTrue(LogroDesbloqueado.objects.filter(logro=maestro).exists())
+
+
+# ============================================
+# TESTS DE MENSAJERIA
+# ============================================
+
+class BandejaConversacionesTest(TestCase):
+    """Pruebas para la bandeja de conversaciones"""
+
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='pass123')
+        self.beto = User.objects.create_user(username='beto', password='pass123')
+        self.carla = User.objects.create_user(username='carla', password='pass123')
+
+    def enviar(self, remitente, destinatario, contenido='hola'):
+        mensaje = Mensaje.objects.create(remitente=remitente, destinatario=destinatario, contenido=contenido)
+        mensajeria.registrar_mensaje(mensaje)
+        return mensaje
+
+    def test_bandeja_en_una_consulta(self):
+        """La bandeja viene ordenada por el último mensaje con sus no leídos"""
+        self.enviar(self.beto, self.ana)
+        self.enviar(self.beto, self.ana)
+        ultimo = self.enviar(self.ana, self.carla)
+
+        with self.assertNumQueries(1):
+            bandeja = mensajeria.obtener_conversaciones(self.ana)
+            resumen = [(c['usuario'].username, c['ultimo_mensaje'].id, c['no_leidos']) for c in bandeja]
+
+        self.assertEqual(resumen[0], ('carla', ultimo.id, 0))
+        self.assertEqual(resumen[1][0], 'beto')
+        self.assertEqual(resumen[1][2], 2)
+
+    def test_marcar_leidos(self):
+        """Abrir la conversación marca los mensajes y pone en cero el contador"""
+        self.enviar(self.beto, self.ana)
+        mensajeria.marcar_leidos(self.ana, self.beto)
+
+        self.assertFalse(Mensaje.objects.filter(destinatario=self.ana, leido=False).exists())
+        self.assertEqual(mensajeria.obtener_conversaciones(self.ana)[0]['no_leidos'], 0)
+
+    def test_reconstruir_coincide_con_incremental(self):
+        """Reconstruir desde el historial da la misma bandeja"""
+        self.enviar(self.beto, self.ana)
+        self.enviar(self.ana, self.beto)
+        self.enviar(self.carla, self.beto)
+        mensajeria.marcar_leidos(self.beto, self.ana)
+
+        campos = ('usuario_id', 'otro_usuario_id', 'ultimo_mensaje_id', 'no_leidos')
+        incremental = set(Conversacion.objects.values_list(*campos))
+        self.assertEqual(mensajeria.reconstruir_conversaciones(), len(incremental))
+        self.assertEqual(set(Conversacion.objects.values_list(*campos)), incremental)
+
+
+class HistorialMensajesTest(TestCase):
+    """Pruebas para el historial paginado por cursor"""
+
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='pass123')
+        self.beto = User.objects.create_user(username='beto', password='pass123')
+        inicio = timezone.now() - timedelta(hours=1)
+        for i in range(7):
+            remitente, destinatario = (self.beto, self.ana) if i % 2 == 0 else (self.ana, self.beto)
+            mensaje = Mensaje.objects.create(
+                remitente=remitente, destinatario=destinatario, contenido=f'm{i}',
+                # Dos mensajes con la misma fecha para probar el desempate por id
+                fecha_envio=inicio + timedelta(minutes=min(i, 5)),
+            )
+            mensajeria.registrar_mensaje(mensaje)
+
+    def test_recorre_todo_el_historial_sin_repetir(self):
+        """Las páginas cubren la conversación completa en orden"""
+        contenidos = []
+        cursor = None
+        while True:
+            pagina, cursor = mensajeria.pagina_mensajes(self.ana, self.beto, antes=cursor, limite=3)
+            contenidos = [m.contenido for m in pagina] + contenidos
+            if cursor is None:
+                break
+
+        self.assertEqual(contenidos, [f'm{i}' for i in range(7)])
+
+    def test_marca_solo_la_ventana_visible(self):
+        """Abrir la última página no marca los mensajes anteriores"""
+        pagina, _ = mensajeria.pagina_mensajes(self.ana, self.beto, limite=2)
+        mensajeria.marcar_leidos(self.ana, self.beto, pagina)
+
+        self.assertEqual(Mensaje.objects.filter(destinatario=self.ana, leido=False).count(), 3)
+        conversacion = Conversacion.objects.get(usuario=self.ana, otro_usuario=self.beto)
+        self.assertEqual(conversacion.no_leidos, 3)
+
+    def test_cursor_invalido(self):
+        """Un cursor mal formado se rechaza"""
+        with self.assertRaises(ValueError):
+            mensajeria.pagina_mensajes(self.ana, self.beto, antes='basura')
+
+    def test_cursor_fuera_de_rango(self):
+        """Un cursor bien formado pero enorme también es ValueError, no OverflowError"""
+        for cursor in [f'{10 ** 30}-1', f'1-{10 ** 30}']:
+            with self.assertRaises(ValueError):
+                mensajeria.pagina_mensajes(self.ana, self.beto, antes=cursor)
+
+
+# ============================================
+# TESTS DE NOTIFICACIONES
+# ============================================
+
+class CentroNotificacionesTest(TestCase):
+    """Pruebas para el centro de notificaciones"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='lector', password='pass123')
+
+    def notificar(self, cantidad, dias_atras=0):
+        fecha = timezone.now() - timedelta(days=dias_atras)
+        return notificaciones.crear_notificaciones([
+            Notificacion(usuario=self.usuario, titulo=f'n{i}', mensaje='hola', fecha_creacion=fecha)
+            for i in range(cantidad)
+        ])
+
+    def test_contador_en_cache(self):
+        """Crear y marcar invalidan el contador; se cuenta una vez y luego sale de la caché"""
+        self.assertEqual(notificaciones.contar_no_leidas(self.usuario.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            creadas = self.notificar(3)
+            notificaciones.crear_notificacion(self.usuario, 'Hola', 'Bienvenido')
+        with self.captureOnCommitCallbacks(execute=True):
+            notificaciones.marcar_leidas(self.usuario, creadas[:2])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(notificaciones.contar_no_leidas(self.usuario.id), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(notificaciones.contar_no_leidas(self.usuario.id), 2)
+
+    def test_conteo_viejo_no_queda_en_cache(self):
+        """Un total contado antes de un commit se guarda bajo la versión vieja"""
+        # Un lector toma la clave y cuenta 0 mientras otra petición crea dos
+        clave = notificaciones._clave_no_leidas(self.usuario.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notificar(2)
+        cache.add(clave, 0)
+
+        self.assertEqual(notificaciones.contar_no_leidas(self.usuario.id), 2)
+
+    def test_paginas_agrupadas_por_dia(self):
+        """Las páginas se agrupan por día y no repiten filas"""
+        self.notificar(2, dias_atras=1)
+        self.notificar(3)
+
+        primera, cursor = notificaciones.pagina_notificaciones(self.usuario, limite=4)
+        segunda, fin = notificaciones.pagina_notificaciones(self.usuario, antes=cursor, limite=4)
+
+        hoy = timezone.now().date()
+        self.assertEqual([len(grupo) for grupo in primera.values()], [3, 1])
+        self.assertEqual(list(primera)[0], hoy)
+        self.assertEqual(list(segunda), [hoy - timedelta(days=1)])
+        self.assertIsNone(fin)
+
+    def test_novedades_desde_cursor(self):
+        """El sondeo sólo devuelve lo posterior al cursor"""
+        self.notificar(2)
+        cursor = notificaciones.cursor_mas_reciente(self.usuario)
+        nueva = notificaciones.crear_notificacion(self.usuario, 'Nueva', 'otra')
+
+        nuevas, siguiente = notificaciones.notificaciones_desde(self.usuario, cursor)
+        self.assertEqual(nuevas, [nueva])
+        self.assertEqual(notificaciones.notificaciones_desde(self.usuario, siguiente)[0], [])
+
+
+class CanalEventosTest(TestCase):
+    """Pruebas para el canal de eventos en vivo"""
+
+    def test_publicar_desde_otro_hilo(self):
+        """Un evento publicado desde un hilo llega a la conexión del usuario"""
+        async def escuchar():
+            suscripcion = push.canal.suscribir(7)
+            hilo = threading.Thread(
+                target=push.canal.publicar, args=(7, {'id': None, 'tipo': 'mensaje', 'datos': {'id': 1}})
+            )
+            hilo.start()
+            evento = await suscripcion.siguiente(timeout=2)
+            push.canal.cancelar(suscripcion)
+            return evento
+
+        self.assertEqual(asyncio.run(escuchar())['datos'], {'id': 1})
+        self.assertEqual(push.canal.conectados(7), 0)
+
+    def test_flujo_reenvia_pendientes_sin_duplicar(self):
+        """Lo perdido se reenvía primero y no se repite si también llega en vivo"""
+        pendiente = {'id': '1-1', 'tipo': 'notificacion', 'datos': {'mensaje': 'a'}}
+
+        async def leer():
+            suscripcion = push.canal.suscribir(8)
+            push.canal.publicar(8, pendiente)
+            push.canal.publicar(8, {'id': '2-2', 'tipo': 'notificacion', 'datos': {'mensaje': 'b'}})
+            return [
+                bloque async for bloque in push.flujo_eventos(suscripcion, [pendiente], duracion=0.2, latido=0.1)
+            ]
+
+        bloques = asyncio.run(leer())
+        eventos = [b for b in bloques if b.startswith('id:')]
+        self.assertEqual(eventos, [
+            'id: 1-1\nevent: notificacion\ndata: {"mensaje":"a"}\n\n',
+            'id: 2-2\nevent: notificacion\ndata: {"mensaje":"b"}\n\n',
+        ])
+        self.assertEqual(push.canal.conectados(8), 0)
+
+    def test_notificacion_se_publica_al_confirmar(self):
+        """Crear una notificación la empuja por el canal tras el commit"""
+        usuario = User.objects.create_user(username='oyente', password='pass123')
+        publicados = []
+        original = push.canal.publicar
+        push.canal.publicar = lambda usuario_id, evento: publicados.append((usuario_id, evento))
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                notificacion = notificaciones.crear_notificacion(usuario, 'Hola', 'Bienvenido')
+                self.assertEqual(publicados, [])
+        finally:
+            push.canal.publicar = original
+
+        self.assertEqual(publicados, [(usuario.id, notificaciones.evento_notificacion(notificacion))])
+
+    def test_bajo_wsgi_responde_sin_esperar(self):
+        """Sin ASGI no se retiene el worker: 204, o lo pendiente desde el cursor"""
+        usuario = User.objects.create_user(username='sondeo', password='pass123')
+        Perfil.objects.create(usuario=usuario)
+        self.client.force_login(usuario)
+        notificaciones.crear_notificacion(usuario, 'Vieja', 'antes')
+        cursor = notificaciones.cursor_mas_reciente(usuario)
+
+        inicio = time.monotonic()
+        respuesta = self.client.get('/api/eventos/')
+        self.assertEqual(respuesta.status_code, 204)
+        self.assertLess(time.monotonic() - inicio, 5)
+        self.assertEqual(push.canal.conectados(usuario.id), 0)
+
+        nueva = notificaciones.crear_notificacion(usuario, 'Nueva', 'después')
+        datos = self.client.get('/api/eventos/', {'desde': cursor}).json()
+        self.assertEqual([e['datos']['id'] for e in datos['eventos']], [nueva.id])
+
+        self.assertFalse(self.client.get('/api/notificaciones-pendientes/').json()['en_vivo'])
+
+
+# ============================================
+# TESTS DE RETENCION
+# ============================================
+
+class RetencionTest(TestCase):
+    """Pruebas para la purga y archivo de notificaciones y mensajes"""
+
+    def setUp(self):
+        cache.clear()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        self.ana = User.objects.create_user(username='ana', password='pass123')
+        self.beto = User.objects.create_user(username='beto', password='pass123')
+
+    def notificacion(self, tipo, dias, leida=True):
+        return Notificacion.objects.create(
+            usuario=self.ana, titulo=tipo, mensaje='x', tipo=tipo, leida=leida,
+            fecha_creacion=timezone.now() - timedelta(days=dias),
+        )
+
+    def test_plazos_por_tipo(self):
+        """Cada tipo vence según su plazo y las no leídas sólo con el plazo largo"""
+        vieja_sistema = self.notificacion('SISTEMA', 100)
+        self.notificacion('LOGRO', 100)
+        self.notificacion('SISTEMA', 100, leida=False)
+        vieja_no_leida = self.notificacion('LOGRO', 400, leida=False)
+
+        resumen = retencion.aplicar_retencion(directorio=self.directorio, lote=1)
+
+        self.assertEqual(resumen['notificaciones']['SISTEMA'], 1)
+        self.assertEqual(resumen['notificaciones']['no_leidas'], 1)
+        restantes = set(Notificacion.objects.values_list('id', flat=True))
+        self.assertEqual(len(restantes), 2)
+        self.assertNotIn(vieja_sistema.id, restantes)
+        self.assertNotIn(vieja_no_leida.id, restantes)
+
+        with gzip.open(resumen['archivos'][0], 'rt', encoding='utf-8') as archivo:
+            archivadas = [json.loads(linea) for linea in archivo]
+        self.assertEqual({fila['id'] for fila in archivadas}, {vieja_sistema.id, vieja_no_leida.id})
+
+    def test_mensajes_conservan_la_vista_previa(self):
+        """No se borra el último mensaje de una conversación ni los no leídos"""
+        hace_dos_anios = timezone.now() - timedelta(days=730)
+        viejo = Mensaje.objects.create(
+            remitente=self.ana, destinatario=self.beto, contenido='viejo', leido=True, fecha_envio=hace_dos_anios
+        )
+        Mensaje.objects.create(
+            remitente=self.beto, destinatario=self.ana, contenido='sin leer', fecha_envio=hace_dos_anios
+        )
+        ultimo = Mensaje.objects.create(
+            remitente=self.ana, destinatario=self.beto, contenido='último', leido=True, fecha_envio=hace_dos_anios
+        )
+        mensajeria.reconstruir_conversaciones()
+
+        self.assertEqual(retencion.purgar_mensajes(simular=True), 1)
+        self.assertEqual(retencion.aplicar_retencion(directorio=self.directorio)['mensajes'], 1)
+        self.assertFalse(Mensaje.objects.filter(id=viejo.id).exists())
+        self.assertTrue(Mensaje.objects.filter(id=ultimo.id).exists())
+
+
+# ============================================
+# TESTS DEL LIBRO DE PUNTOS
+# ============================================
+
+class LibroPuntosTest(TestCase):
+    """Pruebas para la suma atómica de puntos"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='sumador', password='pass123')
+        Perfil.objects.create(usuario=self.usuario, puntos_totales=950)
+
+    def test_suma_en_un_update_y_sube_de_nivel(self):
+        """Los puntos se suman sin leer el perfil y el nivel se recalcula"""
+        # UPDATE + lectura del resultado (más el savepoint de atomic)
+        with self.assertNumQueries(4):
+            totales = puntos.sumar_puntos(self.usuario.id, 100)
+
+        self.assertEqual(totales, (1050, 2))
+
+    def test_el_nivel_no_baja(self):
+        """Un nivel asignado a mano no se pierde por sumar puntos"""
+        Perfil.objects.filter(usuario=self.usuario).update(nivel_maestria=5)
+        self.assertEqual(puntos.sumar_puntos(self.usuario.id, 10), (960, 5))
+
+    def test_sumas_con_perfil_desactualizado_no_se_pierden(self):
+        """Dos sumas con copias viejas del perfil no se pisan"""
+        puntos.sumar_puntos(self.usuario.id, 10)
+        puntos.sumar_puntos(self.usuario.id, 20)
+        self.assertEqual(Perfil.objects.get(usuario=self.usuario).puntos_totales, 980)
+
+    def test_guardar_y_recalcular_desde_el_libro(self):
+        """Guardar anota las partidas; recalcular rehace el total sin bajar el nivel"""
+        partidas.aplicar_lote([
+            partidas.partida_ortografia(self.usuario.id, 'tildes', 3, 0, 10),
+            partidas.partida_ortografia(self.usuario.id, 'tildes', 4, 0, 10),
+        ])
+        self.assertEqual(PuntuacionDiaria.objects.filter(usuario=self.usuario).count(), 2)
+        self.assertEqual(RankingMaterializado.objects.get(
+            usuario=self.usuario, periodo='total', juego='todos'
+        ).puntos, 70)
+
+        puntos.recalcular_puntos()
+        perfil = Perfil.objects.get(usuario=self.usuario)
+        self.assertEqual((perfil.puntos_totales, perfil.nivel_maestria), (70, 2))
+
+
+# ============================================
+# TESTS DE GUARDADO DE PARTIDAS
+# ============================================
+
+class GuardadoPartidasTest(TestCase):
+    """Pruebas para el guardado directo y diferido de partidas"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='jugadora', password='pass123')
+        Perfil.objects.create(usuario=self.usuario)
+        self.nivel = AventuraNivel.objects.create(
+            nivel=1, orden=1, titulo='Inicio', descripcion='Primer nivel', dificultad=1, recompensa_puntos=50
+        )
+
+    def test_guardado_directo(self):
+        """Sin escritura diferida la partida se aplica al momento"""
+        totales = partidas.guardar_partida(
+            partidas.partida_aventura(self.usuario.id, self.nivel.id, 80, 30, True)
+        )
+
+        self.assertEqual(totales, (80, 1))
+        self.assertTrue(ProgresoAventura.objects.get(usuario=self.usuario, nivel=self.nivel).completado)
+        self.assertTrue(aventura.nivel_desbloqueado(self.usuario, self.nivel))
+        self.assertEqual(aventura.obtener_frontera(self.usuario), 1)
+
+    def test_lote_agrupa_puntos_y_ranking(self):
+        """Un lote suma una vez por usuario y cuenta cada partida en el ranking"""
+        lote = [
+            partidas.partida_ortografia(self.usuario.id, 'tildes', 5, 0, 20),
+            partidas.partida_ortografia(self.usuario.id, 'tildes', 3, 2, 20),
+            partidas.partida_aventura(self.usuario.id, self.nivel.id, 10, 30, False),
+            partidas.partida_aventura(self.usuario.id, self.nivel.id, 40, 25, True),
+        ]
+        totales = partidas.aplicar_lote(lote)
+
+        self.assertEqual(totales[self.usuario.id], (110, 1))
+        self.assertEqual(PuntuacionDiaria.objects.filter(usuario=self.usuario).count(), 3)
+        self.assertEqual(ProgresoOrtografia.objects.filter(usuario=self.usuario).count(), 2)
+        progreso = ProgresoAventura.objects.get(usuario=self.usuario, nivel=self.nivel)
+        self.assertEqual((progreso.puntuacion, progreso.completado), (40, True))
+        fila = RankingMaterializado.objects.get(usuario=self.usuario, periodo='total', juego='todos')
+        self.assertEqual((fila.puntos, fila.partidas), (110, 3))
+
+    @override_settings(JUEGOS_ESCRITURA_DIFERIDA=True, JUEGOS_ESCRITURA_DIFERIDA_MS=0)
+    def test_diferido_con_spool_y_lectura(self):
+        """Las partidas diferidas quedan en el spool y se aplican al leer"""
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        with override_settings(JUEGOS_DIRECTORIO_SPOOL=directorio):
+            partidas._cola = None
+            self.addCleanup(setattr, partidas, '_cola', None)
+
+            totales = partidas.guardar_partida(partidas.partida_ortografia(self.usuario.id, 'tildes', 4, 0, 10))
+            self.assertEqual(totales, (40, 1))
+            self.assertFalse(ProgresoOrtografia.objects.exists())
+            with open(partidas._cola.ruta_spool, encoding='utf-8') as spool:
+                self.assertEqual(json.loads(spool.readline())['aciertos'], 4)
+
+            partidas.asegurar_escrito(self.usuario.id)
+
+            self.assertEqual(Perfil.objects.get(usuario=self.usuario).puntos_totales, 40)
+            self.assertEqual(os.listdir(directorio), [])
+            self.assertEqual(partidas._cola.pendientes_de(self.usuario.id), 0)
+
+    def test_recuperar_spool_de_proceso_muerto(self):
+        """Lo que dejó un proceso que ya no existe se aplica una vez"""
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        evento = partidas.partida_ortografia(self.usuario.id, 'tildes', 2, 0, 10)
+        with open(os.path.join(directorio, 'partidas-999999999-0.lote'), 'w', encoding='utf-8') as spool:
+            spool.write(json.dumps(evento) + '\n{"cortada')
+
+        self.assertEqual(partidas.recuperar_spool(directorio), 1)
+        self.assertEqual(Perfil.objects.get(usuario=self.usuario).puntos_totales, 20)
+        self.assertEqual(os.listdir(directorio), [])
+
+    def test_recuperar_spool_reclama_cada_archivo(self):
+        """Dos recuperadores a la vez: el archivo se aplica una sola vez"""
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        evento = partidas.partida_ortografia(self.usuario.id, 'tildes', 2, 0, 10)
+        ruta = os.path.join(directorio, 'partidas-999999999-0.lote')
+        with open(ruta, 'w', encoding='utf-8') as spool:
+            spool.write(json.dumps(evento) + '\n')
+
+        # Otro recuperador lo reclamó entre el listado y el renombrado
+        reclamado = partidas._reclamar(Path(ruta))
+        self.assertIsNone(partidas._reclamar(Path(ruta)))
+
+        # Si ese recuperador muere, el archivo reclamado se retoma una vez
+        os.replace(reclamado, os.path.join(directorio, 'recuperando-999999999-1-partidas-999999999-0.lote'))
+        self.assertEqual(partidas.recuperar_spool(directorio), 1)
+        self.assertEqual(partidas.recuperar_spool(directorio), 0)
+        self.assertEqual(Perfil.objects.get(usuario=self.usuario).puntos_totales, 20)
+        self.assertEqual(os.listdir(directorio), [])
+
+    @override_settings(JUEGOS_ESCRITURA_DIFERIDA=True, JUEGOS_ESCRITURA_DIFERIDA_MS=0)
+    def test_pid_reutilizado_no_pierde_partidas(self):
+        """El archivo de un proceso caído con nuestro mismo PID se aplica y no se pisa"""
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        evento = partidas.partida_ortografia(self.usuario.id, 'tildes', 2, 0, 10)
+        with open(os.path.join(directorio, f'partidas-{os.getpid()}-otro.jsonl'), 'w', encoding='utf-8') as spool:
+            spool.write(json.dumps(evento) + '\n')
+
+        with override_settings(JUEGOS_DIRECTORIO_SPOOL=directorio):
+            partidas._cola = None
+            self.addCleanup(setattr, partidas, '_cola', None)
+            partidas.guardar_partida(partidas.partida_ortografia(self.usuario.id, 'tildes', 1, 0, 10))
+            partidas.asegurar_escrito(self.usuario.id)
+
+        self.assertEqual(Perfil.objects.get(usuario=self.usuario).puntos_totales, 30)
+        self.assertEqual(os.listdir(directorio), [])
+
+    @override_settings(JUEGOS_ESCRITURA_DIFERIDA=True, JUEGOS_ESCRITURA_DIFERIDA_MS=0)
+    def test_partida_fallida_sigue_en_el_spool(self):
+        """Una partida que falla al aplicarse se conserva y entra en el siguiente vaciado"""
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        original = partidas.aplicar_lote
+        self.addCleanup(setattr, partidas, 'aplicar_lote', original)
+
+        def aplicar_lote(eventos):
+            if any(e['aciertos'] == 3 for e in eventos):
+                raise RuntimeError('database is locked')
+            return original(eventos)
+
+        with override_settings(JUEGOS_DIRECTORIO_SPOOL=directorio):
+            partidas._cola = None
+            self.addCleanup(setattr, partidas, '_cola', None)
+            partidas.guardar_partida(partidas.partida_ortografia(self.usuario.id, 'tildes', 1, 0, 10))
+            partidas.guardar_partida(partidas.partida_ortografia(self.usuario.id, 'tildes', 3, 0, 10))
+
+            partidas.aplicar_lote = aplicar_lote
+            partidas.vaciar()
+
+            self.assertEqual(Perfil.objects.get(usuario=self.usuario).puntos_totales, 10)
+            self.assertEqual(partidas._cola.pendientes_de(self.usuario.id), 1)
+            with open(partidas._cola.ruta_spool, encoding='utf-8') as spool:
+                self.assertEqual([json.loads(linea)['aciertos'] for linea in spool], [3])
+
+            partidas.aplicar_lote = original
+            partidas.asegurar_escrito(self.usuario.id)
+
+        self.assertEqual(Perfil.objects.get(usuario=self.usuario).puntos_totales, 40)
+        self.assertEqual(os.listdir(directorio), [])
+
+    def test_recuperar_spool_conserva_las_fallidas(self):
+        """Sin cola, lo que falla al recuperar queda en el archivo reclamado"""
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        with open(os.path.join(directorio, 'partidas-999999999-0.lote'), 'w', encoding='utf-8') as spool:
+            spool.write(json.dumps(partidas.partida_ortografia(self.usuario.id, 'tildes', 2, 0, 10)) + '\n')
+        original = partidas.aplicar_lote
+        self.addCleanup(setattr, partidas, 'aplicar_lote', original)
+
+        def aplicar_lote(eventos):
+            raise RuntimeError('database is locked')
+
+        partidas.aplicar_lote = aplicar_lote
+        self.assertEqual(partidas.recuperar_spool(directorio), 0)
+
+        archivos = os.listdir(directorio)
+        self.assertEqual(len(archivos), 1)
+        with open(os.path.join(directorio, archivos[0]), encoding='utf-8') as spool:
+            self.assertEqual(json.loads(spool.readline())['intentos'], 1)
+
+
+# ============================================
+# TESTS DEL MIDDLEWARE DE PERFIL
+# ============================================
+
+@override_settings(JUEGOS_CACHE_COMPARTIDA=True)
+class PerfilMiddlewareTest(TestCase):
+    """Pruebas para la carga del usuario con su perfil"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='conectada', password='pass123')
+        Perfil.objects.create(usuario=self.usuario, puntos_totales=30)
+        self.client.force_login(self.usuario)
+
+    def peticion(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        # La sesión se carga aparte; aquí sólo cuentan las consultas del usuario
+        request.session.keys()
+        return request
+
+    def test_una_consulta_por_peticion(self):
+        """La primera petición hace un JOIN; las siguientes salen de la caché"""
+        primera, segunda = self.peticion(), self.peticion()
+        with self.assertNumQueries(1):
+            usuario = obtener_usuario(primera)
+            self.assertEqual(usuario.perfil.puntos_totales, 30)
+            self.assertFalse(hasattr(usuario, 'inventario_core'))
+
+        with self.assertNumQueries(0):
+            usuario = obtener_usuario(segunda)
+            self.assertEqual(usuario.pk, self.usuario.pk)
+            self.assertEqual(usuario.perfil_core.puntos_totales, 30)
+
+    def test_sumar_puntos_invalida_la_cache(self):
+        """Un UPDATE de puntos hace releer el perfil"""
+        obtener_usuario(self.peticion())
+        with self.captureOnCommitCallbacks(execute=True):
+            puntos.sumar_puntos(self.usuario.id, 20)
+
+        self.assertEqual(obtener_usuario(self.peticion()).perfil.puntos_totales, 50)
+
+    def test_hash_de_sesion_distinto(self):
+        """Si la contraseña cambió, la sesión deja de ser válida"""
+        request = self.peticion()
+        User.objects.filter(pk=self.usuario.pk).update(password='otro')
+        cache.clear()
+
+        self.assertFalse(obtener_usuario(request).is_authenticated)
+
+    def test_desactivar_invalida_la_cache(self):
+        """Guardar al usuario desactivado corta la sesión que estaba en caché"""
+        obtener_usuario(self.peticion())
+        self.usuario.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+
+        self.assertFalse(obtener_usuario(self.peticion()).is_authenticated)
+
+    def test_cambiar_contrasena_invalida_la_cache(self):
+        """Con la contraseña nueva el hash de la sesión ya no coincide"""
+        request = self.peticion()
+        obtener_usuario(self.peticion())
+        self.usuario.set_password('otra456')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+
+        self.assertFalse(obtener_usuario(request).is_authenticated)
+
+    @override_settings(JUEGOS_CACHE_COMPARTIDA=False)
+    def test_sin_cache_compartida_no_guarda_usuarios(self):
+        obtener_usuario(self.peticion())
+        request = self.peticion()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(obtener_usuario(request).perfil.puntos_totales, 30)
+        self.assertIsNone(cache.get(perfiles._clave_usuario(self.usuario.id)))
+
+
+# ============================================
+# TESTS DE MEDICIÓN DE CONSULTAS
+# ============================================
+
+class MedicionConsultasTest(TestCase):
+    """Pruebas para el presupuesto de consultas y el detector de N+1"""
+
+    def setUp(self):
+        self.usuarios = [User.objects.create_user(username=f'medido{i}', password='x') for i in range(6)]
+
+    def vista_n_mas_1(self, request):
+        nombres = [User.objects.get(id=u.id).username for u in self.usuarios]
+        return JsonResponse({'nombres': nombres})
+
+    def vista_una_consulta(self, request):
+        return JsonResponse({'nombres': list(User.objects.values_list('username', flat=True))})
+
+    def test_huella_ignora_parametros_y_listas_in(self):
+        self.assertEqual(
+            consultas.huella('SELECT * FROM t WHERE id IN (%s, %s,%s)'),
+            consultas.huella('SELECT * FROM t  WHERE id IN (%s)'),
+        )
+
+    def test_detecta_n_mas_1_con_su_origen(self):
+        with consultas.RegistroConsultas() as registro:
+            self.vista_n_mas_1(None)
+
+        veces, origen, _ = registro.repetidas()[0]
+        self.assertEqual(veces, 6)
+        self.assertIn('vista_n_mas_1', origen)
+        self.assertFalse(consultas.RegistroConsultas().repetidas())
+
+    @override_settings(JUEGOS_MEDIR_CONSULTAS=True)
+    def test_cabeceras_del_middleware(self):
+        middleware = consultas.ConsultasMiddleware(self.vista_n_mas_1)
+        with self.assertLogs('juegos.consultas', 'WARNING'):
+            response = middleware(RequestFactory().get('/lista/'))
+
+        self.assertEqual(response['X-Consultas'], '6')
+        self.assertIn('vista_n_mas_1 x6', response['X-Consultas-N1'])
+
+        response = consultas.ConsultasMiddleware(self.vista_una_consulta)(RequestFactory().get('/lista/'))
+        self.assertEqual(response['X-Consultas'], '1')
+        self.assertNotIn('X-Consultas-N1', response)
+
+    @override_settings(JUEGOS_MEDIR_CONSULTAS=True)
+    def test_cabeceras_bajo_asgi(self):
+        """Una vista asíncrona que consulta con sync_to_async también se mide"""
+        async def vista(request):
+            return await sync_to_async(self.vista_n_mas_1)(request)
+
+        middleware = consultas.ConsultasMiddleware(vista)
+        with self.assertLogs('juegos.consultas', 'WARNING'):
+            response = async_to_sync(middleware)(AsyncRequestFactory().get('/lista/'))
+
+        self.assertEqual(response['X-Consultas'], '6')
+        self.assertIn('vista_n_mas_1 x6', response['X-Consultas-N1'])
+
+    def test_presupuestos_de_settings_son_urls_reales(self):
+        def nombres(patrones, prefijo=''):
+            for patron in patrones:
+                if isinstance(patron, URLResolver):
+                    yield from nombres(patron.url_patterns, f'{prefijo}{patron.namespace}:' if patron.namespace else prefijo)
+                elif patron.name:
+                    yield prefijo + patron.name
+
+        existentes = set(nombres(get_resolver().url_patterns))
+        for clave in settings.JUEGOS_PRESUPUESTO_CONSULTAS:
+            self.assertIn(clave, existentes)
+
+    @override_settings(JUEGOS_PRESUPUESTO_CONSULTAS={'/lista/': 0})
+    def test_presupuesto_por_url_en_modo_estricto(self):
+        middleware = consultas.ConsultasMiddleware(self.vista_una_consulta)
+        with self.assertRaises(consultas.PresupuestoConsultasExcedido):
+            with consultas.presupuesto_consultas():
+                middleware(RequestFactory().get('/lista/'))
+
+        with consultas.presupuesto_consultas(maximo=1):
+            consultas.ConsultasMiddleware(self.vista_una_consulta)(RequestFactory().get('/otra/'))
+
+    def test_decorador_de_test(self):
+        with self.assertRaises(consultas.PresupuestoConsultasExcedido):
+            consultas.presupuesto_consultas()(self.vista_n_mas_1)(None)
+
+
+# ============================================
+# TESTS DEL BENCHMARK
+# ============================================
+
+class BenchmarkTest(TestCase):
+    """Pruebas para el generador de datos y la medición de vistas"""
+
+    def setUp(self):
+        cache.clear()
+        self.creadas = benchmark.generar_datos(usuarios=6, dias=3, mensajes_por_usuario=3)
+
+    def test_generar_y_limpiar(self):
+        self.assertEqual(self.creadas['usuarios'], 6)
+        self.assertEqual(Perfil.objects.filter(usuario__username__startswith=benchmark.PREFIJO).count(), 6)
+        self.assertEqual(RankingMaterializado.objects.filter(periodo='total', juego='todos').exists(),
+                         self.creadas['puntuaciones'] > 0)
+
+        self.assertEqual(benchmark.limpiar_datos(), 6)
+        self.assertFalse(User.objects.filter(username__startswith=benchmark.PREFIJO).exists())
+
+    def test_no_toca_a_los_usuarios_reales(self):
+        """Generar y limpiar sólo rehacen las tablas derivadas de los sintéticos"""
+        real = User.objects.create_user(username='real', password='pass123')
+        otro = User.objects.create_user(username='real2', password='pass123')
+        Perfil.objects.create(usuario=real, puntos_totales=77)
+        RankingMaterializado.objects.create(
+            usuario=real, periodo='total', juego='todos', inicio_periodo=ranking.INICIO_TOTAL, puntos=40,
+        )
+        Conversacion.objects.create(usuario=real, otro_usuario=otro, no_leidos=3)
+
+        benchmark.generar_datos(usuarios=2, dias=2, mensajes_por_usuario=2)
+        benchmark.limpiar_datos()
+
+        self.assertEqual(Perfil.objects.get(usuario=real).puntos_totales, 77)
+        self.assertEqual(RankingMaterializado.objects.get(usuario=real).puntos, 40)
+        self.assertEqual(Conversacion.objects.get(usuario=real).no_leidos, 3)
+
+    def test_resultado_comparable(self):
+        resultado = benchmark.ejecutar_benchmark(escenarios=['bandeja', 'notificaciones'], repeticiones=4)
+        metricas = resultado['escenarios']['notificaciones']
+
+        self.assertEqual(resultado['tablas']['usuarios'], 6)
+        self.assertEqual(metricas['errores'], {})
+        self.assertLessEqual(metricas['p50_ms'], metricas['p95_ms'])
+        self.assertGreater(metricas['consultas_max'], 0)
+        json.dumps(resultado)
+
+        filas = benchmark.comparar(resultado, resultado)
+        self.assertTrue(filas)
+        self.assertTrue(all(cambio == 0 for *_, cambio in filas))
+
+    @override_settings(JUEGOS_CONEXIONES_EN_SEGUNDO_PLANO=False)
+    def test_rafaga_login(self):
+        inicio = timezone.now()
+        resultado = benchmark.ejecutar_benchmark(escenarios=[], rafaga_login=4)
+        rafaga = resultado['rafaga_login']
+
+        self.assertEqual(resultado['escenarios'], {})
+        self.assertEqual(rafaga['fallidos'], 0)
+        self.assertGreater(rafaga['logins_por_segundo'], 0)
+        self.assertEqual(
+            Perfil.objects.filter(usuario__username__startswith=benchmark.PREFIJO, ultima_conexion__gte=inicio)
+            .count(), 4
+        )
+        self.assertIn(('rafaga_login', 'logins_por_segundo'), [fila[:2] for fila in benchmark.comparar(resultado, resultado)])
+
+    def test_percentil(self):
+        self.assertEqual(benchmark.percentil(list(range(1, 101)), 95), 95)
+        self.assertEqual(benchmark.percentil([7], 50), 7)
+
+
+# ============================================
+# TESTS DE ESTADÍSTICAS GLOBALES
+# ============================================
+
+class EstadisticasRankingTest(TestCase):
+    """Pruebas para las estadísticas globales cacheadas"""
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user(username='ana_stats', password='x')
+        self.luis = User.objects.create_user(username='luis_stats', password='x')
+        Perfil.objects.create(usuario=self.ana, puntos_totales=120, ultima_conexion=timezone.now())
+        Perfil.objects.create(usuario=self.luis, puntos_totales=30)
+        ranking.actualizar_ranking(self.ana, 120, 'ortografia')
+        ranking.actualizar_ranking(self.luis, 30, 'aventura')
+
+    def test_valores(self):
+        stats = estadisticas.obtener_estadisticas()
+
+        self.assertEqual(stats['total_usuarios'], 2)
+        self.assertEqual(stats['activos_hoy'], 1)
+        self.assertEqual(stats['puntos_totales'], 150)
+        self.assertEqual(stats['top_hoy']['usuario']['username'], 'ana_stats')
+        self.assertEqual(stats['top_hoy']['puntos'], 120)
+
+    def test_top_hoy_ignora_dias_anteriores(self):
+        ayer = timezone.now().date() - timedelta(days=1)
+        ranking.actualizar_ranking(self.luis, 500, 'aventura', ayer)
+
+        top = estadisticas.calcular_estadisticas()['top_hoy']
+        self.assertEqual(top['usuario']['username'], 'ana_stats')
+        self.assertEqual(top['puntos'], 120)
+
+    def test_se_sirven_desde_la_cache(self):
+        estadisticas.obtener_estadisticas()
+        User.objects.create_user(username='nuevo_stats', password='x')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(estadisticas.obtener_estadisticas()['total_usuarios'], 2)
+
+    def test_vencidas_se_recalculan_una_vez(self):
+        estadisticas.obtener_estadisticas()
+        User.objects.create_user(username='nuevo_stats', password='x')
+        calculado, valores = cache.get(estadisticas.CLAVE_ESTADISTICAS)
+        cache.set(estadisticas.CLAVE_ESTADISTICAS, (calculado - estadisticas.TIEMPO_FRESCO, valores))
+
+        # Otro proceso tiene el cerrojo: se sirve lo anterior sin consultar
+        cache.add(estadisticas.CLAVE_CERROJO, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(estadisticas.obtener_estadisticas()['total_usuarios'], 2)
+
+        cache.delete(estadisticas.CLAVE_CERROJO)
+        self.assertEqual(estadisticas.obtener_estadisticas()['total_usuarios'], 3)
+        self.assertIsNone(cache.get(estadisticas.CLAVE_CERROJO))
+
+
+# ============================================
+# TESTS DEL RESUMEN DE INVENTARIO
+# ============================================
+
+class ResumenInventarioTest(TestCase):
+    """Pruebas para el resumen del inventario en una consulta"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='coleccionista', password='x')
+        self.espada = Item.objects.create(nombre='Espada', tipo='ESPECIAL', rareza='EPICO', descripcion='-', valor=50)
+        self.pocion = Item.objects.create(nombre='Poción', tipo='CONSUMIBLE', rareza='COMUN', descripcion='-', valor=5)
+        self.cromo = Item.objects.create(nombre='Cromo', tipo='COLECCIONABLE', rareza='RARO', descripcion='-', valor=2)
+        Item.objects.create(nombre='Cromo 2', tipo='COLECCIONABLE', descripcion='-', valor=2)
+        ItemUsuario.objects.create(usuario=self.usuario, item=self.espada, equipado=True)
+        ItemUsuario.objects.create(usuario=self.usuario, item=self.pocion, cantidad=3)
+        ItemUsuario.objects.create(usuario=self.usuario, item=self.cromo)
+
+    def test_resumen(self):
+        with self.assertNumQueries(2):
+            resumen = inventario.calcular_resumen(self.usuario.id)
+
+        stats = resumen['stats']
+        self.assertEqual(stats['total_items'], 3)
+        self.assertEqual(stats['items_equipados'], 1)
+        self.assertEqual(stats['valor_total'], 50 + 15 + 2)
+        self.assertEqual(stats['rareza_maxima'], 'EPICO')
+        self.assertEqual(stats['por_tipo'], {'especiales': 1, 'consumibles': 1, 'coleccionables': 1, 'medallas': 0})
+        self.assertEqual(resumen['stats_coleccion'], {'total': 2, 'obtenidos': 1, 'porcentaje': 50.0})
+
+    def test_inventario_vacio(self):
+        otro = User.objects.create_user(username='sin_items', password='x')
+        stats = inventario.calcular_resumen(otro.id)['stats']
+
+        self.assertEqual((stats['total_items'], stats['valor_total'], stats['rareza_maxima']), (0, 0, 'COMUN'))
+
+    def test_agrupar_items_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            grupos = inventario.agrupar_items(self.usuario.id)
+            self.assertEqual(len(grupos['todos']), 3)
+            self.assertEqual([iu.item.nombre for iu in grupos['consumibles']], ['Poción'])
+            self.assertEqual(grupos['medallas'], [])
+
+    def test_cache_e_invalidacion(self):
+        inventario.obtener_resumen(self.usuario.id)
+        with self.assertNumQueries(0):
+            inventario.obtener_resumen(self.usuario.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemUsuario.objects.filter(item=self.espada).get().delete()
+        self.assertEqual(inventario.obtener_resumen(self.usuario.id)['stats']['total_items'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pocion.valor = 10
+            self.pocion.save()
+        self.assertEqual(inventario.obtener_resumen(self.usuario.id)['stats']['valor_total'], 30 + 2)
+
+
+# ============================================
+# TESTS DEL CATÁLOGO EN MEMORIA
+# ============================================
+
+class CatalogoTest(TestCase):
+    """Pruebas para los catálogos estáticos de cada proceso"""
+
+    def setUp(self):
+        cache.clear()
+        self.primero = AventuraNivel.objects.create(nivel=1, orden=1, titulo='Inicio', descripcion='-', dificultad=1)
+        self.segundo = AventuraNivel.objects.create(nivel=2, orden=2, titulo='Bosque', descripcion='-', dificultad=1)
+
+    def test_mapas_por_id_y_nombre_sin_consultas(self):
+        catalogo.niveles()
+
+        with self.assertNumQueries(0):
+            niveles = catalogo.niveles()
+            self.assertEqual([n.titulo for n in niveles], ['Inicio', 'Bosque'])
+            self.assertEqual(niveles.por_id[self.segundo.id].nivel, 2)
+            self.assertEqual(niveles.por_nombre[1].titulo, 'Inicio')
+            with self.assertRaises(AventuraNivel.DoesNotExist):
+                niveles.obtener(999)
+            with self.assertRaises(TypeError):
+                niveles.por_id[0] = self.primero
+
+    @override_settings(JUEGOS_CACHE_COMPARTIDA=False, JUEGOS_VIDA_VERSIONES_LOCALES=0.05)
+    def test_sin_cache_compartida_el_sello_caduca(self):
+        """Sin caché compartida, el cambio de otro proceso llega cuando caduca el sello"""
+        # Los sellos que creó setUp no tienen vida
+        cache.clear()
+        catalogo.niveles()
+        # Otro proceso edita: su señal sube el sello de su propia caché, no el de esta
+        AventuraNivel.objects.filter(pk=self.segundo.pk).update(titulo='Montaña')
+        self.assertEqual(catalogo.niveles().por_id[self.segundo.id].titulo, 'Bosque')
+
+        time.sleep(0.1)
+        self.assertEqual(catalogo.niveles().por_id[self.segundo.id].titulo, 'Montaña')
+
+    def test_se_recarga_entero_al_editar(self):
+        anterior = catalogo.niveles()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.segundo.titulo = 'Montaña'
+            self.segundo.save()
+
+        nuevo = catalogo.niveles()
+        self.assertIsNot(nuevo, anterior)
+        self.assertEqual(nuevo.por_id[self.segundo.id].titulo, 'Montaña')
+        # La foto anterior no cambia bajo los pies de quien la esté usando
+        self.assertEqual(anterior.por_id[self.segundo.id].titulo, 'Bosque')
+
+    def test_logro_de_todos_los_niveles_al_dia(self):
+        """El update del logro de todos los niveles también recarga el catálogo"""
+        logros.asegurar_logros_base()
+        self.assertEqual(catalogo.logros().por_nombre[logros.LOGRO_TODOS_LOS_NIVELES].cantidad_necesaria, 2)
+
+        AventuraNivel.objects.create(nivel=3, orden=3, titulo='Cueva', descripcion='-', dificultad=1)
+
+        self.assertEqual(catalogo.logros().por_nombre[logros.LOGRO_TODOS_LOS_NIVELES].cantidad_necesaria, 3)
+
+    def test_asegurar_item(self):
+        kit = catalogo.asegurar_item('Kit de Prueba', tipo='ESPECIAL', descripcion='-', valor=100)
+        # Crearlo subió la versión: la siguiente lectura recarga el catálogo una vez
+        catalogo.items()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogo.asegurar_item('Kit de Prueba').id, kit.id)
+        self.assertEqual(Item.objects.filter(nombre='Kit de Prueba').count(), 1)
+
+
+# ============================================
+# TESTS DE OPERACIONES DE INVENTARIO
+# ============================================
+
+class OperacionesInventarioTest(TestCase):
+    """Pruebas para dar y usar ítems con UPDATE condicionales"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='aventurera', password='x')
+        self.pista = Item.objects.create(nombre='Pista Extra', tipo='CONSUMIBLE', descripcion='-', valor=5)
+        self.tiempo = Item.objects.create(nombre='Tiempo Extra', tipo='CONSUMIBLE', descripcion='-', valor=5)
+
+    def cantidades(self):
+        return dict(ItemUsuario.objects.filter(usuario=self.usuario).values_list('item_id', 'cantidad'))
+
+    def test_dar_crea_y_suma(self):
+        inventario.dar_item(self.usuario.id, self.pista.id)
+        inventario.dar_items(self.usuario.id, {self.pista.id: 2, self.tiempo.id: 3})
+
+        self.assertEqual(self.cantidades(), {self.pista.id: 3, self.tiempo.id: 3})
+
+    def test_usar_hasta_agotar(self):
+        inventario.dar_item(self.usuario.id, self.pista.id, 2)
+
+        # UPDATE condicional y lectura de lo que queda (más el SAVEPOINT del test)
+        with self.assertNumQueries(4):
+            self.assertEqual(inventario.usar_item(self.usuario.id, self.pista.id), 1)
+        self.assertEqual(inventario.usar_item(self.usuario.id, self.pista.id), 0)
+        self.assertIsNone(inventario.usar_item(self.usuario.id, self.pista.id))
+        self.assertEqual(self.cantidades(), {})
+
+    def test_usar_varios_es_todo_o_nada(self):
+        inventario.dar_items(self.usuario.id, {self.pista.id: 2, self.tiempo.id: 1})
+
+        self.assertIsNone(inventario.usar_items(self.usuario.id, {self.pista.id: 1, self.tiempo.id: 2}))
+        self.assertEqual(self.cantidades(), {self.pista.id: 2, self.tiempo.id: 1})
+
+        restantes = inventario.usar_items(self.usuario.id, {self.pista.id: 1, self.tiempo.id: 1})
+        self.assertEqual(restantes, {self.pista.id: 1, self.tiempo.id: 0})
+        self.assertEqual(self.cantidades(), {self.pista.id: 1})
+
+    def test_invalida_el_resumen(self):
+        self.assertEqual(inventario.obtener_resumen(self.usuario.id)['stats']['total_items'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventario.dar_items(self.usuario.id, {self.pista.id: 1, self.tiempo.id: 4})
+        self.assertEqual(inventario.obtener_resumen(self.usuario.id)['stats']['valor_total'], 25)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventario.usar_item(self.usuario.id, self.tiempo.id, 4)
+        self.assertEqual(inventario.obtener_resumen(self.usuario.id)['stats']['valor_total'], 5)
+
+
+# ============================================
+# TESTS DE ALTA MASIVA DE ALUMNOS
+# ============================================
+
+class ImportarAlumnosTest(TestCase):
+    """Pruebas para la importación de listas de clase"""
+
+    CSV = (
+        'username,password,nombre_completo,fecha_nacimiento,email\n'
+        'ana,clave-ana-1,Ana Pérez,2014-03-02,ana@escuela.test\n'
+        'beto,,Beto Gómez,,\n'
+        'existente,otra,,,\n'
+        'ana,repetida,,,\n'
+        'carla,,Carla Ruiz,02/03/2014,\n'
+        ',sin-usuario,,,\n'
+        'dani con espacios,x,,,\n'
+        'eva,x,,,no-es-un-email\n'
+        f'{"f" * 151},x,,,\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='existente', password='pass123')
+
+    def test_leer_csv_y_json(self):
+        self.assertEqual(alumnos.leer_lista(self.CSV.encode('utf-8-sig'))[0]['username'], 'ana')
+        self.assertEqual(alumnos.leer_lista('[{"username": "ana"}]'), [{'username': 'ana'}])
+        self.assertEqual(alumnos.leer_lista('{"alumnos": [{"username": "ana"}]}'), [{'username': 'ana'}])
+        with self.assertRaises(ValueError):
+            alumnos.leer_lista('"ana"', 'json')
+
+    def test_importacion_completa(self):
+        resultado = alumnos.importar_alumnos(alumnos.leer_lista(self.CSV), lote=1, procesos=1)
+
+        self.assertEqual(sorted(resultado.creados), ['ana', 'beto'])
+        self.assertEqual(resultado.existentes, ['existente'])
+        self.assertEqual(len(resultado.errores), 6)
+        self.assertIn('email', resultado.errores[4])
+        self.assertEqual(list(resultado.claves_generadas), ['beto'])
+
+        ana = User.objects.get(username='ana')
+        self.assertTrue(ana.check_password('clave-ana-1'))
+        self.assertEqual(ana.email, 'ana@escuela.test')
+        self.assertEqual(ana.perfil_core.nombre_completo, 'Ana Pérez')
+        self.assertEqual(str(ana.perfil_core.fecha_nacimiento), '2014-03-02')
+        self.assertTrue(User.objects.get(username='beto').check_password(resultado.claves_generadas['beto']))
+
+        kit = alumnos.obtener_item_bienvenida()
+        for usuario in User.objects.filter(username__in=['ana', 'beto']):
+            self.assertTrue(hasattr(usuario, 'inventario_core'))
+            self.assertTrue(ItemUsuario.objects.filter(usuario=usuario, item=kit).exists())
+            self.assertTrue(Notificacion.objects.filter(usuario=usuario, tipo='BIENVENIDA').exists())
+        self.assertFalse(Perfil.objects.filter(usuario__username='existente').exists())
+
+    def test_reimportar_no_duplica(self):
+        filas = alumnos.leer_lista('[{"username": "dani", "password": "clave-dani-7"}]')
+        alumnos.importar_alumnos(filas, procesos=1)
+        resultado = alumnos.importar_alumnos(filas, procesos=1)
+
+        self.assertEqual(resultado.creados, [])
+        self.assertEqual(resultado.existentes, ['dani'])
+        self.assertEqual(Notificacion.objects.filter(usuario__username='dani').count(), 1)
+
+    def test_contrasena_debil_rechazada(self):
+        filas = alumnos.leer_lista('[{"username": "fede", "password": "12345678"}, {"username": "gala"}]')
+        resultado = alumnos.importar_alumnos(filas, procesos=1)
+
+        self.assertEqual(resultado.creados, ['gala'])
+        self.assertEqual(len(resultado.errores), 1)
+        self.assertIn('Fila 1: password', resultado.errores[0])
+
+    def test_alta_concurrente_no_aborta_el_lote(self):
+        """Un username creado por otra petición tras validar sólo saltea a ese alumno"""
+        original = alumnos.validar_filas
+        self.addCleanup(setattr, alumnos, 'validar_filas', original)
+
+        def validar_y_otra_alta(filas, resultado):
+            validos = original(filas, resultado)
+            User.objects.create_user(username='hugo', password='pass123')
+            return validos
+
+        alumnos.validar_filas = validar_y_otra_alta
+        filas = alumnos.leer_lista('[{"username": "hugo"}, {"username": "ines"}, {"username": "juan"}]')
+        resultado = alumnos.importar_alumnos(filas, procesos=1)
+
+        self.assertEqual(resultado.creados, ['ines', 'juan'])
+        self.assertEqual(resultado.existentes, ['hugo'])
+        self.assertFalse(Perfil.objects.filter(usuario__username='hugo').exists())
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_admin_importa_sin_pool_de_procesos(self):
+        """El admin hashea en la propia petición y corta las listas largas"""
+        def sin_procesos(*args, **kwargs):
+            raise AssertionError('El admin no debe arrancar procesos')
+        original = alumnos.ProcessPoolExecutor
+        alumnos.ProcessPoolExecutor = sin_procesos
+        self.addCleanup(setattr, alumnos, 'ProcessPoolExecutor', original)
+        self.client.force_login(User.objects.create_superuser(username='direccion', password='pass123'))
+
+        def subir(cantidad):
+            contenido = 'username\n' + ''.join(f'admin{i}\n' for i in range(cantidad))
+            archivo = SimpleUploadedFile('lista.csv', contenido.encode('utf-8'), content_type='text/csv')
+            return self.client.post('/admin/auth/user/importar-alumnos/', {'archivo': archivo})
+
+        response = subir(alumnos.MINIMO_PARA_PROCESOS)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(User.objects.filter(username__startswith='admin').count(), alumnos.MINIMO_PARA_PROCESOS)
+
+        response = subir(alumnos.MAXIMO_EN_PETICION + 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'La lista tiene {alumnos.MAXIMO_EN_PETICION + 1} filas')
+        self.assertFalse(User.objects.filter(username=f'admin{alumnos.MAXIMO_EN_PETICION}').exists())
+
+    def test_hashes_en_orden(self):
+        hashes = alumnos.hashear_claves(['uno', 'dos'], procesos=1)
+
+        usuario = User(username='prueba')
+        for clave, hash_clave in zip(['uno', 'dos'], hashes):
+            usuario.password = hash_clave
+            self.assertTrue(usuario.check_password(clave))
+
+
+# ============================================
+# TESTS DE INICIO DE SESIÓN
+# ============================================
+
+@override_settings(JUEGOS_CONEXIONES_EN_SEGUNDO_PLANO=False)
+class LoginAsincronoTest(TestCase):
+    """Pruebas para el login con verificación en el pool y racha en lote"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username='alumno', password='clave-segura-1')
+        self.perfil = Perfil.objects.create(usuario=self.usuario, racha_actual=2, racha_maxima=2)
+
+    def activo(self, usuario, dias_atras):
+        RankingMaterializado.objects.create(
+            usuario=usuario, periodo='diario', juego='todos',
+            inicio_periodo=timezone.now().date() - timedelta(days=dias_atras),
+        )
+
+    def peticion(self, password):
+        request = AsyncRequestFactory().post('/?next=/', {'username': 'alumno', 'password': password})
+        request.session = SessionStore()
+        request._messages = default_storage(request)
+        request.user = AnonymousUser()
+        return request
+
+    def test_login_correcto_anota_conexion_y_racha(self):
+        self.activo(self.usuario, 1)
+        request = self.peticion('clave-segura-1')
+
+        response = async_to_sync(login_view)(request)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(request.session[SESSION_KEY], str(self.usuario.id))
+        self.perfil.refresh_from_db()
+        self.assertIsNotNone(self.perfil.ultima_conexion)
+        self.assertEqual((self.perfil.racha_actual, self.perfil.racha_maxima), (3, 3))
+
+    def test_credenciales_invalidas(self):
+        self.assertIsNone(async_to_sync(acceso.autenticar)(None, 'alumno', 'otra'))
+        self.assertIsNone(async_to_sync(acceso.autenticar)(None, 'nadie', 'clave-segura-1'))
+
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertIsNone(async_to_sync(acceso.autenticar)(None, 'alumno', 'clave-segura-1'))
+
+    def test_saturado_responde_503(self):
+        _, cupos = acceso._obtener_pool()
+        tomados = 0
+        while cupos.acquire(blocking=False):
+            tomados += 1
+        try:
+            response = async_to_sync(login_view)(self.peticion('clave-segura-1'))
+        finally:
+            for _ in range(tomados):
+                cupos.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(acceso.REINTENTAR_EN))
+
+    def test_conexiones_en_lote(self):
+        cortada = User.objects.create_user(username='cortada', password='x')
+        Perfil.objects.create(usuario=cortada, racha_actual=5, racha_maxima=7)
+        nuevo = User.objects.create_user(username='nuevo', password='x')
+        Perfil.objects.create(usuario=nuevo)
+        self.activo(self.usuario, 1)
+        self.activo(cortada, 3)
+        ahora = timezone.now()
+
+        # Último día activo, SELECT de perfiles y un bulk_update (más el SAVEPOINT)
+        with self.assertNumQueries(5):
+            acceso.aplicar_conexiones({self.usuario.id: ahora, cortada.id: ahora, nuevo.id: ahora})
+
+        rachas = dict(Perfil.objects.values_list('usuario__username', 'racha_actual'))
+        self.assertEqual(rachas, {'alumno': 3, 'cortada': 1, 'nuevo': 1})
+        self.assertEqual(Perfil.objects.get(usuario=cortada).racha_maxima, 7)
+
+    def test_conexiones_invalidan_el_usuario_en_cache(self):
+        self.assertIsNone(perfiles.cargar_usuario(self.usuario.id).perfil_core.ultima_conexion)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            acceso.aplicar_conexiones({self.usuario.id: timezone.now()})
+
+        perfil = perfiles.cargar_usuario(self.usuario.id).perfil_core
+        self.assertIsNotNone(perfil.ultima_conexion)
+        self.assertEqual(perfil.racha_actual, 1)
@@ -4,9 +4,16 @@ from . import views
 app_name = 'juegos'
 
 urlpatterns = [
+    path('logros/', views.logros_view, name='logros'),
+    path('ranking/', views.ranking_view, name='ranking'),
     path('aventura/', views.aventura_list_view, name='aventura_list'),
     path('aventura/<int:nivel_id>/', views.aventura_jugar_view, name='aventura_jugar'),
     path('ortografia/', views.ortografia_categorias_view, name='ortografia_categorias'),
     path('ortografia/jugar/', views.ortografia_jugar_view, name='ortografia_jugar'),
     path('ortografia/jugar/<str:categoria>/', views.ortografia_jugar_view, name='ortografia_jugar_categoria'),
+    path('api/preguntas/ortografia/<str:categoria>/', views.api_preguntas_ortografia, name='api_preguntas_ortografia'),
+    path('api/mensajes/<int:usuario_id>/', views.api_historial_mensajes, name='api_historial_mensajes'),
+    path('api/notificaciones/', views.api_notificaciones, name='api_notificaciones'),
+    path('api/notificaciones-pendientes/', views.api_notificaciones_pendientes, name='api_notificaciones_pendientes'),
+    path('api/eventos/', views.api_eventos, name='api_eventos'),
 ]
@@ -0,0 +1,64 @@
+"""
+Sellos de versión compartidos en la caché
+
+Los servicios que guardan datos en memoria de cada proceso (índices de
+ranking, banco de preguntas...) comparan su copia con un contador en la
+caché de Django. Un contador nuevo (o que la caché descartó) arranca en un
+valor al azar, para que nunca coincida con la versión que un proceso tenía
+antes de perderse la clave.
+
+Los sellos sólo avisan a otros procesos si la caché es compartida (Redis).
+Con LocMemCache cada proceso tiene sus propios contadores: para que los
+cambios hechos en otro proceso lleguen igual, ahí los sellos caducan cada
+JUEGOS_VIDA_VERSIONES_LOCALES segundos y el nuevo valor al azar obliga a
+recargar. Los valores que se cachean sin sello (p. ej. la frontera de cada
+usuario) usan `vida_en_cache` para no vivir más que eso en cada proceso.
+"""
+
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Backends que guardan las claves en la memoria de cada proceso
+CACHES_LOCALES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+VIDA_VERSIONES_LOCALES = 30
+
+
+def cache_compartida():
+    """True si todos los procesos ven la misma caché (JUEGOS_CACHE_COMPARTIDA lo fuerza)"""
+    compartida = getattr(settings, 'JUEGOS_CACHE_COMPARTIDA', None)
+    if compartida is None:
+        compartida = settings.CACHES['default']['BACKEND'] not in CACHES_LOCALES
+    return compartida
+
+
+def vida_en_cache(tiempo):
+    """`tiempo` con caché compartida; si no, a lo sumo la vida de los sellos locales"""
+    if cache_compartida():
+        return tiempo
+    vida = getattr(settings, 'JUEGOS_VIDA_VERSIONES_LOCALES', VIDA_VERSIONES_LOCALES)
+    return vida if tiempo is None else min(tiempo, vida)
+
+
+def obtener_version(clave):
+    """Versión actual; la crea si no existe"""
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, random.randint(1, 2 ** 31), timeout=vida_en_cache(None))
+        version = cache.get(clave)
+    return version
+
+
+def incrementar_version(clave):
+    """Sube la versión y devuelve el nuevo valor"""
+    obtener_version(clave)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        # La caché descartó la clave entre ambas llamadas
+        return obtener_version(clave)
@@ -1,18 +1,46 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, logout, authenticate
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from django.db.models import Sum, Count, Avg, Q, F
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.views.decorators.http import require_GET, require_POST
 from datetime import timedelta, datetime
+from functools import wraps
+from django.contrib.auth.models import User
+from asgiref.sync import sync_to_async
+from core.models import (
+    Perfil, Inventario, ItemUsuario, LogroDesbloqueado, Amistad, Mensaje
+)
 from .models import (
-    User, Perfil, Inventario, Item, ItemUsuario, Logro, LogroDesbloqueado,
     AventuraNivel, ProgresoAventura, PreguntaOrtografia, ProgresoOrtografia,
-    PuntuacionDiaria, Notificacion, Amistad, Mensaje
 )
+from .acceso import REINTENTAR_EN, FormularioLogin, LoginsSaturados, autenticar, registrar_conexion
+from .aventura import MapaAventura, nivel_desbloqueado
+from .alumnos import BIENVENIDA, obtener_item_bienvenida
+from .catalogo import niveles
+from .logros import (
+    EVENTO_SOCIAL, EvaluacionLogros, publicar_evento,
+)
+from .mensajeria import (
+    marcar_leidos, obtener_conversaciones as obtener_bandeja, pagina_mensajes, registrar_mensaje,
+)
+from .partidas import (
+    asegurar_escrito, guardar_partida, partida_aventura, partida_ortografia, puntos_partida,
+)
+from .notificaciones import (
+    contar_no_leidas, crear_notificacion, cursor_mas_reciente, evento_notificacion, marcar_leidas,
+    notificaciones_desde, pagina_notificaciones, serializar_notificacion,
+)
+from .estadisticas import obtener_estadisticas
+from .inventario import agrupar_items, dar_item, obtener_resumen, usar_item
+from .preguntas import paquete_ortografia, paquete_practica
+from .push import canal, flujo_eventos
+from .ranking import dias_activos, obtener_posicion, obtener_ranking
 
 # ============================================
 # DECORADOR PERSONALIZADO
@@ -29,6 +57,22 @@ def verificar_perfil_completo(view_func):
         return view_func(request, *args, **kwargs)
     return wrapper
 
+def obtener_nivel_o_404(nivel_id):
+    """Nivel de aventura desde el catálogo en memoria, o 404"""
+    try:
+        return niveles().obtener(nivel_id)
+    except AventuraNivel.DoesNotExist:
+        raise Http404('Nivel no encontrado')
+
+def con_partidas_guardadas(view_func):
+    """Decorador que aplica antes las partidas pendientes del usuario (escritura diferida)"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            asegurar_escrito(request.user.id)
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
 # ============================================
 # VISTAS DE AUTENTICACIÓN
 # ============================================
@@ -53,34 +97,14 @@ def registro_view(request):
             Inventario.objects.create(usuario=user)
             
             # Items iniciales
-            item_bienvenida = Item.objects.get_or_create(
-                nombre='Kit de Bienvenida',
-                defaults={
-                    'tipo': 'ESPECIAL',
-                    'rareza': 'COMUN',
-                    'icono': 'gift',
-                    'descripcion': 'Item de bienvenida para nuevos estudiantes',
-                    'valor': 100
-                }
-            )[0]
-            
-            ItemUsuario.objects.create(
-                usuario=user,
-                item=item_bienvenida,
-                fecha_obtencion=timezone.now()
-            )
+            dar_item(user.id, obtener_item_bienvenida().id)
             
             # Login automático
             login(request, user)
             messages.success(request, f'¡Bienvenido a la Academia, {user.username}!')
             
             # Notificación de bienvenida
-            Notificacion.objects.create(
-                usuario=user,
-                titulo='¡Bienvenido!',
-                mensaje='Completa tu perfil y empieza a jugar',
-                tipo='BIENVENIDA'
-            )
+            crear_notificacion(usuario=user, **BIENVENIDA)
             
             return redirect('juegos:editar_perfil')
     else:
@@ -97,34 +121,47 @@ def registro_view(request):
         ]
     })
 
-def login_view(request):
-    """Inicio de sesión"""
-    if request.user.is_authenticated:
+def _iniciar_sesion(request, user):
+    login(request, user)
+    # Última conexión y racha: se anotan fuera del tiempo de respuesta
+    registrar_conexion(user.id)
+
+async def login_view(request):
+    """Inicio de sesión
+    
+    Vista asíncrona: bajo ASGI, mientras la contraseña se verifica en el pool
+    de acceso el worker sigue atendiendo otras peticiones. Si hay demasiados
+    logins esperando se responde enseguida un 503 liviano con Retry-After.
+    """
+    if await sync_to_async(_usuario_autenticado)(request) is not None:
         return redirect('juegos:dashboard')
     
     if request.method == 'POST':
-        form = AuthenticationForm(data=request.POST)
+        form = FormularioLogin(request, data=request.POST)
         if form.is_valid():
-            user = form.get_user()
-            login(request, user)
+            try:
+                user = await autenticar(
+                    request, form.cleaned_data['username'], form.cleaned_data['password']
+                )
+            except LoginsSaturados:
+                response = HttpResponse(
+                    'Hay muchos alumnos entrando a la vez. Intenta de nuevo en unos segundos.',
+                    content_type='text/plain; charset=utf-8', status=503,
+                )
+                response['Retry-After'] = str(REINTENTAR_EN)
+                return response
             
-            # Actualizar última conexión
-            perfil = user.perfil
-            perfil.ultima_conexion = timezone.now()
-            perfil.save()
-            
-            # Verificar racha
-            verificar_racha(user)
-            
-            messages.success(request, f'¡Hola de nuevo, {user.username}!')
-            
-            # Redireccionar a la página solicitada
-            next_url = request.GET.get('next', 'juegos:dashboard')
-            return redirect(next_url)
+            if form.aceptar(user):
+                await sync_to_async(_iniciar_sesion)(request, user)
+                messages.success(request, f'¡Hola de nuevo, {user.username}!')
+                
+                # Redireccionar a la página solicitada
+                next_url = request.GET.get('next', 'juegos:dashboard')
+                return redirect(next_url)
     else:
-        form = AuthenticationForm()
+        form = FormularioLogin()
     
-    return render(request, 'registration/login.html', {
+    return await sync_to_async(render)(request, 'registration/login.html', {
         'form': form,
         'titulo': 'Iniciar Sesión'
     })
@@ -140,6 +177,7 @@ def logout_view(request):
 # ============================================
 
 @login_required
+@con_partidas_guardadas
 def perfil_view(request):
     """Vista del perfil del usuario"""
     perfil = request.user.perfil
@@ -181,42 +219,21 @@ def editar_perfil_view(request):
 @login_required
 def inventario_view(request):
     """Vista del inventario del usuario"""
-    inventario = request.user.inventario
-    items_usuario = ItemUsuario.objects.filter(usuario=request.user).select_related('item')
-    
-    # Agrupar por categoría
-    items_por_categoria = {
-        'todos': items_usuario,
-        'especiales': items_usuario.filter(item__tipo='ESPECIAL'),
-        'consumibles': items_usuario.filter(item__tipo='CONSUMIBLE'),
-        'coleccionables': items_usuario.filter(item__tipo='COLECCIONABLE'),
-        'medallas': items_usuario.filter(item__tipo='MEDALLA'),
-    }
-    
-    # Estadísticas del inventario
-    stats = {
-        'total_items': items_usuario.count(),
-        'items_equipados': items_usuario.filter(equipado=True).count(),
-        'valor_total': sum(item.item.valor * item.cantidad for item in items_usuario),
-        'rareza_maxima': obtener_rareza_maxima(items_usuario),
-    }
+    # El inventario viene precargado con el usuario (PerfilMiddleware)
+    inventario = getattr(request.user, 'inventario_core', None)
     
-    # Progreso de colección
-    total_coleccionables = Item.objects.filter(tipo='COLECCIONABLE').count()
-    coleccionables_obtenidos = items_usuario.filter(item__tipo='COLECCIONABLE').count()
+    # Ítems de una consulta, agrupados por categoría en una pasada
+    items_por_categoria = agrupar_items(request.user.id)
     
-    stats_coleccion = {
-        'total': total_coleccionables,
-        'obtenidos': coleccionables_obtenidos,
-        'porcentaje': (coleccionables_obtenidos / total_coleccionables * 100) if total_coleccionables > 0 else 0
-    }
+    # Estadísticas y progreso de colección (una agregación, cacheada por usuario)
+    resumen = obtener_resumen(request.user.id)
     
     context = {
         'titulo': 'Mi Inventario',
         'inventario': inventario,
         'items_por_categoria': items_por_categoria,
-        'stats': stats,
-        'stats_coleccion': stats_coleccion,
+        'stats': resumen['stats'],
+        'stats_coleccion': resumen['stats_coleccion'],
     }
     
     return render(request, 'juegos/perfil/inventario.html', context)
@@ -226,14 +243,13 @@ def inventario_view(request):
 # ============================================
 
 @login_required
+@con_partidas_guardadas
 def logros_view(request):
     """Galería de logros"""
-    todos_logros = Logro.objects.all().order_by('categoria', 'dificultad')
-    logros_usuario = LogroDesbloqueado.objects.filter(
-        usuario=request.user
-    ).select_related('logro')
-    
-    logros_ids = [l.logro.id for l in logros_usuario]
+    # Logros, desbloqueos y métricas del usuario en un número fijo de consultas
+    evaluacion = EvaluacionLogros(request.user)
+    todos_logros = evaluacion.logros
+    logros_ids = evaluacion.desbloqueados
     
     # Organizar por categoría
     categorias = {}
@@ -248,13 +264,12 @@ def logros_view(request):
             }
         
         desbloqueado = logro.id in logros_ids
-        progreso = calcular_progreso_logro(request.user, logro) if not desbloqueado else None
         
         categorias[logro.categoria]['logros'].append({
             'logro': logro,
             'desbloqueado': desbloqueado,
-            'fecha': next((l.fecha_desbloqueo for l in logros_usuario if l.logro.id == logro.id), None),
-            'progreso': progreso,
+            'fecha': logros_ids.get(logro.id),
+            'progreso': evaluacion.progreso(logro),
         })
         
         categorias[logro.categoria]['total'] += 1
@@ -262,13 +277,13 @@ def logros_view(request):
             categorias[logro.categoria]['obtenidos'] += 1
     
     # Logros recientes
-    recientes = logros_usuario.order_by('-fecha_desbloqueo')[:5]
+    recientes = evaluacion.recientes(5)
     
     # Próximos logros (más cercanos a desbloquear)
-    proximos = calcular_proximos_logros(request.user, todos_logros, logros_ids)
+    proximos = evaluacion.proximos()
     
     # Estadísticas por rareza
-    rarezas = calcular_stats_rareza(request.user, todos_logros)
+    rarezas = evaluacion.stats_rareza()
     
     context = {
         'titulo': 'Mis Logros',
@@ -276,9 +291,9 @@ def logros_view(request):
         'recientes': recientes,
         'proximos': proximos[:5],
         'rarezas': rarezas,
-        'total_logros': todos_logros.count(),
+        'total_logros': len(todos_logros),
         'logros_obtenidos': len(logros_ids),
-        'progreso_total': (len(logros_ids) / todos_logros.count() * 100) if todos_logros.count() > 0 else 0,
+        'progreso_total': (len(logros_ids) / len(todos_logros) * 100) if todos_logros else 0,
     }
     
     return render(request, 'juegos/logros/galeria.html', context)
@@ -288,6 +303,7 @@ def logros_view(request):
 # ============================================
 
 @login_required
+@con_partidas_guardadas
 def ranking_view(request):
     """Vista principal del ranking"""
     # Obtener filtros
@@ -328,6 +344,7 @@ def ranking_view(request):
     return render(request, 'juegos/ranking/leaderboard.html', context)
 
 @login_required
+@con_partidas_guardadas
 def ranking_detalle_view(request, usuario_id):
     """Vista detallada de un usuario en el ranking"""
     usuario = get_object_or_404(User, id=usuario_id)
@@ -401,7 +418,7 @@ def amigos_view(request):
     amigos = Amistad.objects.filter(
         (Q(usuario1=request.user) | Q(usuario2=request.user)),
         estado='ACEPTADA'
-    ).select_related('usuario1', 'usuario2')
+    ).select_related('usuario1__perfil_core', 'usuario2__perfil_core')
     
     lista_amigos = []
     for amistad in amigos:
@@ -454,23 +471,15 @@ def conversacion_view(request, usuario_id):
     """Vista de una conversación específica"""
     otro_usuario = get_object_or_404(User, id=usuario_id)
     
-    # Marcar mensajes como leídos
-    Mensaje.objects.filter(
-        remitente=otro_usuario,
-        destinatario=request.user,
-        leido=False
-    ).update(leido=True)
-    
-    # Obtener mensajes
-    mensajes = Mensaje.objects.filter(
-        (Q(remitente=request.user) & Q(destinatario=otro_usuario)) |
-        (Q(remitente=otro_usuario) & Q(destinatario=request.user))
-    ).order_by('fecha_envio')
+    # Sólo la página más reciente; las anteriores llegan por api_historial_mensajes
+    mensajes, cursor_anterior = pagina_mensajes(request.user, otro_usuario)
+    marcar_leidos(request.user, otro_usuario, mensajes)
     
     context = {
         'titulo': f'Chat con {otro_usuario.username}',
         'otro_usuario': otro_usuario,
         'mensajes': mensajes,
+        'cursor_anterior': cursor_anterior,
     }
     
     return render(request, 'juegos/social/conversacion.html', context)
@@ -482,20 +491,18 @@ def conversacion_view(request, usuario_id):
 @login_required
 def notificaciones_view(request):
     """Centro de notificaciones"""
-    notificaciones = Notificacion.objects.filter(
-        usuario=request.user
-    ).order_by('-fecha_creacion')
-    
-    # Marcar todas como leídas
-    notificaciones.filter(leida=False).update(leida=True)
+    # Primera página agrupada por día; las siguientes llegan por api_notificaciones
+    notificaciones_agrupadas, cursor_siguiente = pagina_notificaciones(request.user)
     
-    # Agrupar por fecha
-    notificaciones_agrupadas = agrupar_notificaciones(notificaciones)
+    # Marcar como leídas sólo las visibles
+    marcar_leidas(request.user, [n for grupo in notificaciones_agrupadas.values() for n in grupo])
     
     context = {
         'titulo': 'Notificaciones',
         'notificaciones_agrupadas': notificaciones_agrupadas,
-        'no_leidas': 0,
+        'cursor_siguiente': cursor_siguiente,
+        'cursor_reciente': cursor_mas_reciente(request.user),
+        'no_leidas': contar_no_leidas(request.user.id),
     }
     
     return render(request, 'juegos/social/notificaciones.html', context)
@@ -553,48 +560,26 @@ def configuracion_view(request):
 
 @login_required
 @verificar_perfil_completo
+@con_partidas_guardadas
 def aventura_list_view(request):
     """Lista de niveles de aventura"""
-    niveles = AventuraNivel.objects.all().order_by('orden')
-    progresos = ProgresoAventura.objects.filter(usuario=request.user)
-    
-    # Procesar cada nivel
-    for nivel in niveles:
-        progreso = progresos.filter(nivel=nivel).first()
-        nivel.completado = progreso and progreso.completado
-        nivel.puntuacion_obtenida = progreso.puntuacion if progreso else 0
-        nivel.mejor_tiempo = progreso.tiempo_jugado if progreso else None
-        
-        # Determinar si está bloqueado
-        if nivel.orden > 1:
-            nivel_anterior = niveles.get(orden=nivel.orden - 1)
-            nivel_anterior_completado = progresos.filter(
-                nivel=nivel_anterior, completado=True
-            ).exists()
-            nivel.bloqueado = not nivel_anterior_completado
-        else:
-            nivel.bloqueado = False
-    
-    # Estadísticas generales
-    stats = {
-        'niveles_completados': progresos.filter(completado=True).count(),
-        'puntuacion_total': progresos.aggregate(total=Sum('puntuacion'))['total'] or 0,
-        'tiempo_total': progresos.aggregate(total=Sum('tiempo_jugado'))['total'] or timedelta(),
-    }
+    # Niveles, estado del usuario y estadísticas en dos consultas
+    mapa = MapaAventura(request.user)
     
     context = {
         'titulo': 'Aventura Educativa',
-        'niveles': niveles,
-        'stats': stats,
+        'niveles': mapa.niveles,
+        'stats': mapa.stats,
     }
     
     return render(request, 'juegos/aventura/lista_niveles.html', context)
 
 @login_required
 @verificar_perfil_completo
+@con_partidas_guardadas
 def aventura_jugar_view(request, nivel_id):
     """Jugar un nivel de aventura"""
-    nivel = get_object_or_404(AventuraNivel, id=nivel_id)
+    nivel = obtener_nivel_o_404(nivel_id)
     
     # Verificar si está desbloqueado
     if not nivel_esta_desbloqueado(request.user, nivel):
@@ -631,6 +616,7 @@ def aventura_jugar_view(request, nivel_id):
 
 @login_required
 @verificar_perfil_completo
+@con_partidas_guardadas
 def ortografia_categorias_view(request):
     """Categorías de ortografía"""
     categorias = PreguntaOrtografia.objects.values('categoria').annotate(
@@ -677,30 +663,19 @@ def ortografia_categorias_view(request):
 @verificar_perfil_completo
 def ortografia_jugar_view(request, categoria=None):
     """Jugar ortografía"""
+    # Preguntas ya serializadas (caché versionada / fragmentos en memoria)
     if categoria:
-        preguntas = PreguntaOrtografia.objects.filter(categoria=categoria)
+        preguntas = paquete_ortografia(categoria)
         titulo = f'Ortografía - {categoria.title()}'
     else:
-        preguntas = PreguntaOrtografia.objects.all().order_by('?')[:20]
+        preguntas = paquete_practica(20)
         titulo = 'Ortografía - Práctica General'
     
-    # Convertir a JSON
-    preguntas_json = []
-    for p in preguntas:
-        preguntas_json.append({
-            'id': p.id,
-            'palabra': p.palabra,
-            'opciones': p.opciones,
-            'correcta': p.palabra_correcta,
-            'categoria': p.categoria,
-            'dificultad': p.dificultad,
-        })
-    
     context = {
         'titulo': titulo,
-        'preguntas_json': preguntas_json,
+        'preguntas_json': preguntas.texto,
         'categoria_actual': categoria,
-        'total_preguntas': preguntas.count(),
+        'total_preguntas': preguntas.total,
     }
     
     return render(request, 'juegos/ortografia/jugar_partida.html', context)
@@ -719,40 +694,16 @@ def api_guardar_progreso_aventura(request):
         tiempo = int(request.POST.get('tiempo', 0))
         completado = request.POST.get('completado') == 'true'
         
-        nivel = AventuraNivel.objects.get(id=nivel_id)
-        
-        # Guardar o actualizar progreso
-        progreso, created = ProgresoAventura.objects.update_or_create(
-            usuario=request.user,
-            nivel=nivel,
-            defaults={
-                'puntuacion': puntuacion,
-                'tiempo_jugado': timedelta(seconds=tiempo),
-                'completado': completado,
-                'fecha_completado': timezone.now() if completado else None,
-            }
-        )
+        nivel = niveles().obtener(nivel_id)
         
-        # Actualizar puntos totales del perfil
-        if completado:
-            perfil = request.user.perfil
-            perfil.puntos_totales += puntuacion
-            perfil.save()
-            
-            # Registrar puntuación diaria
-            PuntuacionDiaria.objects.create(
-                usuario=request.user,
-                puntos=puntuacion,
-                tipo_juego='AVENTURA',
-                fecha=timezone.now().date()
-            )
-            
-            # Verificar logros
-            verificar_logros_aventura(request.user)
+        # Progreso, puntos, ranking, frontera y logros (directo o diferido)
+        puntos_totales, _ = guardar_partida(partida_aventura(
+            request.user.id, nivel.id, puntuacion, tiempo, completado
+        ))
         
         return JsonResponse({
             'success': True,
-            'puntuacion_total': request.user.perfil.puntos_totales,
+            'puntuacion_total': puntos_totales,
         })
         
     except Exception as e:
@@ -768,67 +719,48 @@ def api_guardar_progreso_ortografia(request):
         errores = int(request.POST.get('errores', 0))
         tiempo = int(request.POST.get('tiempo', 0))
         
-        # Guardar progreso
-        progreso = ProgresoOrtografia.objects.create(
-            usuario=request.user,
-            categoria=categoria,
-            aciertos=aciertos,
-            errores=errores,
-            tiempo_jugado=timedelta(seconds=tiempo),
-            fecha=timezone.now()
-        )
-        
-        # Calcular puntos (10 por acierto, -5 por error)
-        puntos = (aciertos * 10) - (errores * 5)
-        
-        # Actualizar perfil
-        perfil = request.user.perfil
-        perfil.puntos_totales += max(0, puntos)
-        perfil.save()
-        
-        # Registrar puntuación diaria
-        PuntuacionDiaria.objects.create(
-            usuario=request.user,
-            puntos=max(0, puntos),
-            tipo_juego='ORTOGRAFIA',
-            fecha=timezone.now().date()
-        )
-        
-        # Verificar logros
-        verificar_logros_ortografia(request.user)
+        # Progreso, puntos, ranking y logros (directo o diferido)
+        partida = partida_ortografia(request.user.id, categoria, aciertos, errores, tiempo)
+        puntos_totales, nivel_maestria = guardar_partida(partida)
         
         return JsonResponse({
             'success': True,
-            'puntos_ganados': max(0, puntos),
-            'puntuacion_total': perfil.puntos_totales,
+            'puntos_ganados': puntos_partida(partida),
+            'puntuacion_total': puntos_totales,
+            'nivel_maestria': nivel_maestria,
         })
         
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+@login_required
+@require_GET
+def api_preguntas_ortografia(request, categoria):
+    """Preguntas de una categoría en JSON (admite If-None-Match)"""
+    return respuesta_paquete(request, paquete_ortografia(categoria))
+
 @login_required
 @require_POST
 def api_usar_item(request):
     """Usar un item del inventario"""
     try:
         item_usuario_id = request.POST.get('item_id')
-        item_usuario = ItemUsuario.objects.get(id=item_usuario_id, usuario=request.user)
+        item_usuario = ItemUsuario.objects.select_related('item').get(id=item_usuario_id, usuario=request.user)
         
         # Verificar si es consumible
         if item_usuario.item.tipo == 'CONSUMIBLE':
+            # Descontar una unidad sólo si todavía queda (borra la fila al llegar a cero)
+            restantes = usar_item(request.user.id, item_usuario.item_id)
+            if restantes is None:
+                return JsonResponse({'success': False, 'error': 'Ya no te quedan unidades de este item'})
+            
             # Aplicar efecto del item
             efecto = aplicar_efecto_item(request.user, item_usuario.item)
             
-            # Reducir cantidad o eliminar
-            if item_usuario.cantidad > 1:
-                item_usuario.cantidad -= 1
-                item_usuario.save()
-            else:
-                item_usuario.delete()
-            
             return JsonResponse({
                 'success': True,
                 'efecto': efecto,
+                'restantes': restantes,
                 'mensaje': f'Has usado {item_usuario.item.nombre}'
             })
         else:
@@ -909,7 +841,7 @@ def api_enviar_solicitud_amistad(request):
         )
         
         # Crear notificación
-        Notificacion.objects.create(
+        crear_notificacion(
             usuario=usuario_destino,
             titulo='Solicitud de amistad',
             mensaje=f'{request.user.username} quiere ser tu amigo',
@@ -940,13 +872,17 @@ def api_responder_solicitud(request):
             solicitud.save()
             
             # Notificación al otro usuario
-            Notificacion.objects.create(
+            crear_notificacion(
                 usuario=solicitud.usuario1,
                 titulo='Solicitud aceptada',
                 mensaje=f'{request.user.username} aceptó tu solicitud de amistad',
                 tipo='AMISTAD'
             )
             
+            # Logros sociales de ambos usuarios
+            publicar_evento(request.user, EVENTO_SOCIAL, amigos=1)
+            publicar_evento(solicitud.usuario1, EVENTO_SOCIAL, amigos=1)
+            
             return JsonResponse({'success': True, 'mensaje': 'Amistad aceptada'})
             
         else:  # rechazar
@@ -971,9 +907,10 @@ def api_enviar_mensaje(request):
             destinatario=destinatario,
             contenido=contenido
         )
+        registrar_mensaje(mensaje)
         
         # Notificación
-        Notificacion.objects.create(
+        crear_notificacion(
             usuario=destinatario,
             titulo='Nuevo mensaje',
             mensaje=f'{request.user.username} te envió un mensaje',
@@ -992,6 +929,120 @@ def api_enviar_mensaje(request):
     except User.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Usuario no encontrado'})
 
+@login_required
+def api_historial_mensajes(request, usuario_id):
+    """Página anterior del historial de una conversación (scroll infinito)"""
+    otro_usuario = get_object_or_404(User, id=usuario_id)
+    
+    try:
+        mensajes, cursor_anterior = pagina_mensajes(
+            request.user, otro_usuario, antes=request.GET.get('antes')
+        )
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Cursor inválido'}, status=400)
+    
+    marcar_leidos(request.user, otro_usuario, mensajes)
+    
+    return JsonResponse({
+        'success': True,
+        'mensajes': [
+            {
+                'id': m.id,
+                'contenido': m.contenido,
+                'fecha': m.fecha_envio.strftime('%H:%M'),
+                'propio': m.remitente_id == request.user.id,
+                'leido': m.leido,
+            }
+            for m in mensajes
+        ],
+        'cursor_anterior': cursor_anterior,
+    })
+
+@login_required
+def api_notificaciones(request):
+    """Página siguiente del centro de notificaciones, agrupada por día"""
+    try:
+        agrupadas, cursor_siguiente = pagina_notificaciones(request.user, antes=request.GET.get('antes'))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Cursor inválido'}, status=400)
+    
+    marcar_leidas(request.user, [n for grupo in agrupadas.values() for n in grupo])
+    
+    return JsonResponse({
+        'success': True,
+        'dias': [
+            {'fecha': dia.isoformat(), 'notificaciones': [serializar_notificacion(n) for n in grupo]}
+            for dia, grupo in agrupadas.items()
+        ],
+        'cursor_siguiente': cursor_siguiente,
+    })
+
+@login_required
+def api_notificaciones_pendientes(request):
+    """Contador de no leídas (desde la caché) y las notificaciones posteriores a ?desde=
+    
+    Sin cursor sólo se devuelve el cursor más reciente, para que el cliente
+    empiece a pedir novedades desde ahí. `en_vivo` indica si este servidor
+    puede mantener abierto /api/eventos/ (sólo bajo ASGI); si no, el cliente
+    sigue sondeando.
+    """
+    respuesta = {
+        'success': True,
+        'no_leidas': contar_no_leidas(request.user.id),
+        'en_vivo': isinstance(request, ASGIRequest),
+    }
+    
+    desde = request.GET.get('desde')
+    if not desde:
+        respuesta['notificaciones'] = []
+        respuesta['cursor'] = cursor_mas_reciente(request.user)
+        return JsonResponse(respuesta)
+    
+    try:
+        nuevas, cursor = notificaciones_desde(request.user, desde)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Cursor inválido'}, status=400)
+    respuesta['notificaciones'] = [serializar_notificacion(n) for n in nuevas]
+    respuesta['cursor'] = cursor
+    
+    return JsonResponse(respuesta)
+
+def _usuario_autenticado(request):
+    return request.user if request.user.is_authenticated else None
+
+async def api_eventos(request):
+    """Canal en vivo de notificaciones y mensajes
+    
+    Bajo ASGI es un stream de Server-Sent Events. Bajo WSGI cada conexión
+    ocuparía un worker síncrono, así que se responde en el acto con lo
+    pendiente desde Last-Event-ID (204 si no hay nada) y el cliente sondea.
+    """
+    usuario = await sync_to_async(_usuario_autenticado)(request)
+    if usuario is None:
+        return JsonResponse({'success': False, 'error': 'No autenticado'}, status=401)
+    
+    en_vivo = isinstance(request, ASGIRequest)
+    # Suscribirse antes de leer lo perdido para no dejar huecos
+    suscripcion = canal.suscribir(usuario.id) if en_vivo else None
+    pendientes = []
+    desde = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+    if desde:
+        try:
+            nuevas, _ = await sync_to_async(notificaciones_desde)(usuario, desde)
+            pendientes = [evento_notificacion(n) for n in nuevas]
+        except ValueError:
+            pass
+    
+    if en_vivo:
+        response = StreamingHttpResponse(flujo_eventos(suscripcion, pendientes), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    if not pendientes:
+        return HttpResponse(status=204)
+    return JsonResponse({'success': True, 'eventos': pendientes})
+
 # ============================================
 # FUNCIONES AUXILIARES
 # ============================================
@@ -1038,108 +1089,41 @@ def obtener_contexto_perfil(user):
         'actividad': actividad,
     }
 
-def verificar_racha(user):
-    """Verifica y actualiza la racha del usuario"""
-    perfil = user.perfil
-    hoy = timezone.now().date()
-    
-    # Última actividad registrada
-    ultima_actividad = PuntuacionDiaria.objects.filter(
-        usuario=user
-    ).order_by('-fecha').first()
-    
-    if ultima_actividad:
-        diferencia = (hoy - ultima_actividad.fecha).days
-        
-        if diferencia == 1:
-            # Día consecutivo
-            perfil.racha_actual += 1
-            if perfil.racha_actual > perfil.racha_maxima:
-                perfil.racha_maxima = perfil.racha_actual
-        elif diferencia > 1:
-            # Se rompió la racha
-            perfil.racha_actual = 1
-    else:
-        # Primera actividad
-        perfil.racha_actual = 1
-    
-    perfil.save()
+def respuesta_paquete(request, paquete):
+    """Respuesta JSON de un paquete de preguntas, o 304 si el cliente ya lo tiene"""
+    response = get_conditional_response(request, etag=paquete.etag)
+    if response is None:
+        response = HttpResponse(paquete.contenido, content_type='application/json')
+    response['ETag'] = paquete.etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 def obtener_ranking_completo(usuario_actual, periodo='total', juego='todos'):
     """Obtiene el ranking completo con todos los datos"""
     rankings = []
-    fecha_inicio = obtener_fecha_inicio_ranking(periodo)
-    
-    # Obtener todos los usuarios con puntos
-    if fecha_inicio:
-        # Ranking por período
-        puntuaciones = PuntuacionDiaria.objects.filter(
-            fecha__gte=fecha_inicio
-        ).values('usuario').annotate(
-            total_puntos=Sum('puntos'),
-            partidas=Count('id')
-        ).order_by('-total_puntos')
-        
-        for idx, item in enumerate(puntuaciones[:100], 1):
-            usuario = User.objects.get(id=item['usuario'])
-            perfil = usuario.perfil
-            
-            rankings.append({
-                'posicion': idx,
-                'usuario': {
-                    'id': usuario.id,
-                    'username': usuario.username,
-                    'avatar': usuario.username[0].upper(),
-                    'nivel': perfil.nivel_maestria,
-                },
-                'puntos': item['total_puntos'],
-                'partidas': item['partidas'],
-                'racha': perfil.racha_actual,
-                'ultima_actividad': perfil.ultima_conexion,
-                'es_usuario_actual': usuario == usuario_actual,
-            })
-    else:
-        # Ranking total
-        usuarios = User.objects.filter(perfil__puntos_totales__gt=0).order_by('-perfil__puntos_totales')[:100]
-        
-        for idx, usuario in enumerate(usuarios, 1):
-            perfil = usuario.perfil
-            rankings.append({
-                'posicion': idx,
-                'usuario': {
-                    'id': usuario.id,
-                    'username': usuario.username,
-                    'avatar': usuario.username[0].upper(),
-                    'nivel': perfil.nivel_maestria,
-                },
-                'puntos': perfil.puntos_totales,
-                'racha': perfil.racha_actual,
-                'ultima_actividad': perfil.ultima_conexion,
-                'es_usuario_actual': usuario == usuario_actual,
-            })
+    
+    # Una sola lectura del ranking materializado (incluye los datos del perfil)
+    for idx, fila in enumerate(obtener_ranking(periodo, juego), 1):
+        rankings.append({
+            'posicion': idx,
+            'usuario': {
+                'id': fila['usuario_id'],
+                'username': fila['username'],
+                'avatar': fila['username'][0].upper(),
+                'nivel': fila['nivel'],
+            },
+            'puntos': fila['puntos'],
+            'partidas': fila['partidas'],
+            'racha': fila['racha'],
+            'ultima_actividad': fila['ultima_actividad'],
+            'es_usuario_actual': fila['usuario_id'] == usuario_actual.id,
+        })
     
     return rankings
 
 def obtener_stats_globales_ranking():
-    """Estadísticas globales para el ranking"""
-    total_usuarios = User.objects.count()
-    usuarios_activos_hoy = User.objects.filter(
-        perfil__ultima_conexion__gte=timezone.now() - timedelta(days=1)
-    ).count()
-    
-    puntos_totales = Perfil.objects.aggregate(total=Sum('puntos_totales'))['total'] or 0
-    
-    # Top jugador del día
-    top_hoy = PuntuacionDiaria.objects.filter(
-        fecha=timezone.now().date()
-    ).select_related('usuario').order_by('-puntos').first()
-    
-    return {
-        'total_usuarios': total_usuarios,
-        'activos_hoy': usuarios_activos_hoy,
-        'puntos_totales': puntos_totales,
-        'top_hoy': top_hoy,
-    }
+    """Estadísticas globales para el ranking (desde la caché, con unos segundos de atraso)"""
+    return obtener_estadisticas()
 
 def obtener_lista_paises():
     """Lista de países para el formulario"""
@@ -1180,78 +1164,6 @@ def obtener_icono_categoria(categoria):
     }
     return iconos.get(categoria, 'medal')
 
-def obtener_fecha_inicio_ranking(periodo):
-    """Obtiene la fecha de inicio según el período"""
-    hoy = timezone.now().date()
-    
-    if periodo == 'diario':
-        return hoy
-    elif periodo == 'semanal':
-        return hoy - timedelta(days=hoy.weekday())
-    elif periodo == 'mensual':
-        return hoy.replace(day=1)
-    else:
-        return None
-
-def calcular_progreso_logro(user, logro):
-    """Calcula el progreso de un logro específico"""
-    # Implementar según el tipo de logro
-    if logro.tipo == 'AVENTURA':
-        completados = ProgresoAventura.objects.filter(
-            usuario=user, completado=True
-        ).count()
-        return {
-            'actual': completados,
-            'necesario': logro.cantidad_necesaria,
-            'porcentaje': (completados / logro.cantidad_necesaria * 100) if logro.cantidad_necesaria > 0 else 0
-        }
-    elif logro.tipo == 'ORTOGRAFIA':
-        aciertos = ProgresoOrtografia.objects.filter(
-            usuario=user
-        ).aggregate(total=Sum('aciertos'))['total'] or 0
-        return {
-            'actual': aciertos,
-            'necesario': logro.cantidad_necesaria,
-            'porcentaje': (aciertos / logro.cantidad_necesaria * 100) if logro.cantidad_necesaria > 0 else 0
-        }
-    # ... otros tipos
-    
-    return {'actual': 0, 'necesario': logro.cantidad_necesaria, 'porcentaje': 0}
-
-def calcular_proximos_logros(user, todos_logros, logros_ids):
-    """Calcula los próximos logros a desbloquear"""
-    proximos = []
-    
-    for logro in todos_logros:
-        if logro.id not in logros_ids:
-            progreso = calcular_progreso_logro(user, logro)
-            if progreso['actual'] > 0:
-                faltante = progreso['necesario'] - progreso['actual']
-                proximos.append({
-                    'logro': logro,
-                    'progreso': progreso,
-                    'faltante': faltante
-                })
-    
-    return sorted(proximos, key=lambda x: x['faltante'])
-
-def calcular_stats_rareza(user, todos_logros):
-    """Calcula estadísticas por rareza de logros"""
-    rarezas = {}
-    logros_usuario = LogroDesbloqueado.objects.filter(usuario=user).values_list('logro_id', flat=True)
-    
-    for rareza, _ in Logro.RAREZAS:
-        total = todos_logros.filter(rareza=rareza).count()
-        obtenidos = todos_logros.filter(id__in=logros_usuario, rareza=rareza).count()
-        
-        rarezas[rareza] = {
-            'total': total,
-            'obtenidos': obtenidos,
-            'porcentaje': (obtenidos / total * 100) if total > 0 else 0
-        }
-    
-    return rarezas
-
 def obtener_ayudas_disponibles(user):
     """Obtiene las ayudas disponibles del inventario"""
     items_ayuda = ItemUsuario.objects.filter(
@@ -1278,15 +1190,7 @@ def obtener_ayudas_disponibles(user):
 
 def nivel_esta_desbloqueado(user, nivel):
     """Verifica si un nivel está desbloqueado"""
-    if nivel.orden == 1:
-        return True
-    
-    nivel_anterior = AventuraNivel.objects.get(orden=nivel.orden - 1)
-    return ProgresoAventura.objects.filter(
-        usuario=user,
-        nivel=nivel_anterior,
-        completado=True
-    ).exists()
+    return nivel_desbloqueado(user, nivel)
 
 def obtener_actividad_usuario(user, limit=10):
     """Obtiene la actividad reciente del usuario"""
@@ -1347,34 +1251,16 @@ def obtener_actividad_recente_usuario(user):
 
 def obtener_posicion_usuario(user, periodo, juego):
     """Obtiene la posición del usuario en un ranking específico"""
-    fecha_inicio = obtener_fecha_inicio_ranking(periodo)
-    
-    if fecha_inicio:
-        puntuaciones = PuntuacionDiaria.objects.filter(
-            fecha__gte=fecha_inicio
-        ).values('usuario').annotate(
-            total=Sum('puntos')
-        ).order_by('-total')
-        
-        for idx, item in enumerate(puntuaciones, 1):
-            if item['usuario'] == user.id:
-                return idx
-    else:
-        if juego == 'todos':
-            posicion = Perfil.objects.filter(
-                puntos_totales__gt=user.perfil.puntos_totales
-            ).count() + 1
-            return posicion
-    
-    return None
+    return obtener_posicion(user.id, periodo, juego)
 
 def esta_en_linea(user):
     """Verifica si un usuario está en línea"""
-    if not user.perfil.ultima_conexion:
+    perfil = getattr(user, 'perfil_core', None)
+    if not perfil or not perfil.ultima_conexion:
         return False
     
     tiempo_limite = timezone.now() - timedelta(minutes=5)
-    return user.perfil.ultima_conexion > tiempo_limite
+    return perfil.ultima_conexion > tiempo_limite
 
 def tiene_solicitud_pendiente(usuario1, usuario2):
     """Verifica si hay una solicitud pendiente entre usuarios"""
@@ -1406,58 +1292,11 @@ def obtener_sugerencias_amigos(user):
 
 def obtener_conversaciones(user):
     """Obtiene las conversaciones del usuario"""
-    mensajes = Mensaje.objects.filter(
-        Q(remitente=user) | Q(destinatario=user)
-    ).select_related('remitente', 'destinatario').order_by('-fecha_envio')
-    
-    conversaciones = {}
-    for mensaje in mensajes:
-        otro = mensaje.destinatario if mensaje.remitente == user else mensaje.remitente
-        
-        if otro.id not in conversaciones:
-            conversaciones[otro.id] = {
-                'usuario': otro,
-                'ultimo_mensaje': mensaje,
-                'no_leidos': Mensaje.objects.filter(
-                    remitente=otro,
-                    destinatario=user,
-                    leido=False
-                ).count()
-            }
-    
-    return list(conversaciones.values())
-
-def agrupar_notificaciones(notificaciones):
-    """Agrupa notificaciones por fecha"""
-    agrupadas = {}
-    
-    for notif in notificaciones:
-        fecha = notif.fecha_creacion.date()
-        if fecha not in agrupadas:
-            agrupadas[fecha] = []
-        agrupadas[fecha].append(notif)
-    
-    return agrupadas
-
-def obtener_rareza_maxima(items):
-    """Obtiene la rareza máxima entre los items"""
-    rarezas = {'COMUN': 1, 'RARO': 2, 'EPICO': 3, 'LEGENDARIO': 4}
-    max_rareza = 'COMUN'
-    max_valor = 0
-    
-    for item in items:
-        valor = rarezas.get(item.item.rareza, 0)
-        if valor > max_valor:
-            max_valor = valor
-            max_rareza = item.item.rareza
-    
-    return max_rareza
+    return obtener_bandeja(user)
 
 def calcular_dias_activos(user):
     """Calcula los días activos del usuario"""
-    return PuntuacionDiaria.objects.filter(
-        usuario=user
-    ).values('fecha').distinct().count()
+    return dias_activos(user.id)
 
 def obtener_logros_ranking_usuario(user):
     """Obtiene logros relacionados con ranking del usuario"""
@@ -1490,66 +1329,6 @@ def obtener_logros_ranking_usuario(user):
     
     return logros
 
-def verificar_logros_aventura(user):
-    """Verifica y desbloquea logros de aventura"""
-    niveles_completados = ProgresoAventura.objects.filter(
-        usuario=user, completado=True
-    ).count()
-    
-    # Logro por completar todos los niveles
-    total_niveles = AventuraNivel.objects.count()
-    if niveles_completados == total_niveles:
-        logro, _ = Logro.objects.get_or_create(
-            nombre='Maestro de la Aventura',
-            defaults={
-                'descripcion': 'Completar todos los niveles de aventura',
-                'tipo': 'AVENTURA',
-                'rareza': 'LEGENDARIO',
-                'icono': 'crown',
-                'puntos': 1000
-            }
-        )
-        
-        if not LogroDesbloqueado.objects.filter(usuario=user, logro=logro).exists():
-            LogroDesbloqueado.objects.create(
-                usuario=user,
-                logro=logro,
-                fecha_desbloqueo=timezone.now()
-            )
-            
-            # Notificación
-            Notificacion.objects.create(
-                usuario=user,
-                titulo='¡Nuevo logro!',
-                mensaje=f'Has desbloqueado: {logro.nombre}',
-                tipo='LOGRO'
-            )
-
-def verificar_logros_ortografia(user):
-    """Verifica y desbloquea logros de ortografía"""
-    total_aciertos = ProgresoOrtografia.objects.filter(
-        usuario=user
-    ).aggregate(total=Sum('aciertos'))['total'] or 0
-    
-    if total_aciertos >= 1000:
-        logro, _ = Logro.objects.get_or_create(
-            nombre='Maestro de la Ortografía',
-            defaults={
-                'descripcion': 'Alcanzar 1000 aciertos en ortografía',
-                'tipo': 'ORTOGRAFIA',
-                'rareza': 'LEGENDARIO',
-                'icono': 'pencil-alt',
-                'puntos': 1000
-            }
-        )
-        
-        if not LogroDesbloqueado.objects.filter(usuario=user, logro=logro).exists():
-            LogroDesbloqueado.objects.create(
-                usuario=user,
-                logro=logro,
-                fecha_desbloqueo=timezone.now()
-            )
-
 def aplicar_efecto_item(user, item):
     """Aplica el efecto de un item consumible"""
     efectos = {